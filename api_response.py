@@ -0,0 +1,174 @@
+import json
+import zlib
+from datetime import datetime, date
+from decimal import Decimal
+
+from flask import request, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+# المرمّزات الاختيارية - يتم استخدامها إذا كانت مثبتة فقط
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _default(obj):
+    """تحويل الأنواع غير المدعومة افتراضياً في JSON"""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).decode('utf-8', errors='replace')
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _stdlib_dumps(obj):
+    # ensure_ascii=False يحافظ على النص العربي كـ UTF-8 بدلاً من \uXXXX (حجم أصغر بثلاث مرات)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _ujson_dumps(obj):
+    # ujson لا يدعم default لذلك نرجع للمكتبة القياسية عند الفشل
+    try:
+        return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+    except TypeError:
+        return _stdlib_dumps(obj)
+
+
+JSON_ENCODERS = {
+    'stdlib': _stdlib_dumps,
+}
+if orjson is not None:
+    JSON_ENCODERS['orjson'] = _orjson_dumps
+if ujson is not None:
+    JSON_ENCODERS['ujson'] = _ujson_dumps
+
+
+def register_encoder(name, dumps):
+    """تسجيل مرمّز JSON مخصص (دالة تستقبل كائناً وترجع bytes)"""
+    JSON_ENCODERS[name] = dumps
+
+
+def get_encoder(name='auto'):
+    """اختيار مرمّز JSON حسب الاسم، أو الأسرع المتاح عند 'auto'"""
+    if name == 'auto':
+        for candidate in ('orjson', 'ujson', 'stdlib'):
+            if candidate in JSON_ENCODERS:
+                return JSON_ENCODERS[candidate]
+    if name not in JSON_ENCODERS:
+        raise ValueError(f'مرمّز JSON غير متوفر: {name}')
+    return JSON_ENCODERS[name]
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """مزود JSON لـ Flask يستخدم المرمّز المحدد في JSON_ENCODER"""
+
+    ensure_ascii = False
+
+    def __init__(self, app):
+        super().__init__(app)
+        self._encode = get_encoder(app.config.get('JSON_ENCODER', 'auto'))
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', _default)
+            kwargs.setdefault('ensure_ascii', False)
+            return json.dumps(obj, **kwargs)
+        return self._encode(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if self._app.debug and self.compact is None:
+            return super().response(obj)
+        # نمرر bytes مباشرة لتجنب فك الترميز وإعادته
+        return self._app.response_class(self._encode(obj), mimetype=self.mimetype)
+
+
+# =========================================================================
+# ضغط الاستجابات
+# =========================================================================
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/csv', 'application/javascript'}
+
+
+def _choose_encoding(accept_encoding):
+    """اختيار خوارزمية الضغط المدعومة من العميل"""
+    accepted = {part.split(';')[0].strip().lower() for part in accept_encoding.split(',')}
+    if 'gzip' in accepted:
+        return 'gzip'
+    if 'deflate' in accepted:
+        return 'deflate'
+    return None
+
+
+def compress_bytes(data, encoding='gzip', level=6):
+    """ضغط البيانات بـ zlib بصيغة gzip أو deflate"""
+    wbits = 31 if encoding == 'gzip' else 15
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    return compressor.compress(data) + compressor.flush()
+
+
+def init_compression(app):
+    """تفعيل ضغط الاستجابات التي يتجاوز حجمها JSON_COMPRESS_MIN_SIZE"""
+    app.config.setdefault('JSON_COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('JSON_COMPRESS_LEVEL', 6)
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough
+                or response.status_code < 200 or response.status_code >= 300
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        encoding = _choose_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < app.config['JSON_COMPRESS_MIN_SIZE']:
+            return response
+
+        response.set_data(compress_bytes(data, encoding, app.config['JSON_COMPRESS_LEVEL']))
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+    return app
+
+
+# =========================================================================
+# الصيغة العمودية للقوائم
+# =========================================================================
+
+def to_columnar(rows):
+    """تحويل قائمة صفوف إلى أعمدة مرة واحدة وصفوف كمصفوفات"""
+    if not rows:
+        return {'columns': [], 'rows': []}
+
+    columns = list(rows[0].keys())
+    return {'columns': columns, 'rows': [[row.get(column) for column in columns] for row in rows]}
+
+
+def list_response(rows, **extra):
+    """استجابة قائمة بالصيغة العادية أو العمودية حسب ?format=columnar"""
+    if request.args.get('format') == 'columnar':
+        payload = {'success': True, 'format': 'columnar'}
+        payload.update(to_columnar(rows))
+    else:
+        payload = {'success': True, 'data': rows}
+    payload.update(extra)
+    return jsonify(payload)
@@ -1,17 +1,96 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, session, send_file
+from flask import Flask, render_template, request, jsonify, send_from_directory, session, send_file, Response, stream_with_context
 from flask_cors import CORS
 from pos_backend import POSBackend
+from api_response import FastJSONProvider, init_compression, list_response
+from events import sse_stream
+from backup_manager import backup_filename
+from http_metrics import init_route_metrics, PROMETHEUS_CONTENT_TYPE
+from profiler import init_profiler, list_profiles, resolve_profile
+from store_router import StoreRouter
+from reporting_replica import ReplicaManager
+from flask import has_request_context
+from werkzeug.local import LocalProxy
 import os
 import json
-from datetime import datetime
+import tempfile
+from datetime import datetime, timedelta
 import io
 import base64
+from functools import wraps
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here-change-in-production'
 CORS(app)
 
-pos_system = POSBackend()
+# ترميز JSON سريع وضغط الاستجابات الكبيرة
+app.config['JSON_ENCODER'] = os.environ.get('POS_JSON_ENCODER', 'auto')
+app.json = FastJSONProvider(app)
+# مؤشرات المسارات قبل الضغط حتى يُقاس حجم الاستجابة بعد ضغطها
+route_metrics = init_route_metrics(app)
+init_compression(app)
+
+default_backend = POSBackend(os.environ.get('POS_DB_PATH', 'pos_database.db'))
+
+# كل فرع في ملف قاعدة بيانات مستقل، ويُحدد الفرع بالترويسة X-Store-ID أو ?store_id=
+store_router = StoreRouter(default_backend, os.environ.get('POS_STORES_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(default_backend.db_path)), 'stores'))
+
+def request_store_id():
+    return request.headers.get('X-Store-ID') or request.args.get('store_id')
+
+def current_backend():
+    """الواجهة الخلفية لفرع الطلب الحالي (أو الفرع الافتراضي خارج الطلبات)"""
+    if has_request_context():
+        store_id = request_store_id()
+        if store_id:
+            return store_router.get(store_id)
+    return default_backend
+
+pos_system = LocalProxy(current_backend)
+
+@app.before_request
+def validate_store_id():
+    store_id = request_store_id()
+    if store_id:
+        try:
+            if not store_router.exists(store_id):
+                return jsonify({"success": False, "error": f"الفرع غير موجود: {store_id}"}), 404
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
+# التقارير تُقرأ من نسخة قراءة فقط تُحدّث دورياً حتى لا تنافس عمليات البيع (?fresh=1 للقاعدة الرئيسية)
+replicas = ReplicaManager.from_env(os.environ.get('POS_REPLICA_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(default_backend.db_path)), 'replicas'))
+replicas.start()
+
+def reporting_backend():
+    """(الواجهة الخلفية للتقارير، مؤشر الحداثة) لفرع الطلب الحالي"""
+    return replicas.reporting_backend(current_backend(), fresh=request.args.get('fresh') == '1')
+
+# تحليل أداء طلبات المدير عند الطلب (X-Profile: cprofile|sample)
+init_profiler(app, os.path.join(os.path.dirname(os.path.abspath(default_backend.db_path)), 'profiles'))
+
+# صلاحيات المسارات الإدارية
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+def local_only(view):
+    """قصر المسار على الطلبات القادمة من نفس الجهاز"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.remote_addr not in LOCAL_ADDRESSES:
+            return jsonify({"success": False, "error": "غير مسموح"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def admin_only(view):
+    """قصر المسار على جلسات المدير"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if session.get('role') != 'admin':
+            return jsonify({"success": False, "error": "هذه العملية متاحة للمدير فقط"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
 
 # خدمة الملفات الثابتة
 @app.route('/')
@@ -26,29 +105,66 @@ def serve_static(path):
 @app.route('/api/dashboard')
 def get_dashboard_data():
     try:
-        # جلب البيانات الأساسية للوحة التحكم
-        products = pos_system.getAllProducts()
-        invoices = pos_system.getAllInvoices()
-        customers = pos_system.loadCustomers()
+        data = pos_system.getDashboardData()
+        return jsonify({"success": True, "data": data})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# عمليات القراءة المتاحة عبر /api/batch
+BATCH_OPERATIONS = {
+    'dashboard': lambda params: pos_system.getDashboardData(),
+    'categories': lambda params: pos_system.getCategoriesWithCount(),
+    'products': lambda params: (pos_system.getProductsByCategory(params['category_id'])
+                                if params.get('category_id') not in (None, '', 'all')
+                                else pos_system.getAllProducts()),
+    'products_search': lambda params: pos_system.searchProducts(params.get('q', '')),
+    'product_statistics': lambda params: pos_system.getProductStatistics(),
+    'stock_alerts': lambda params: pos_system.getStockAlerts(
+        params.get('status'), params.get('page', 1), params.get('per_page', 50)),
+    'settings': lambda params: pos_system.loadSettings(),
+    'cash_balance': lambda params: pos_system.getCashBalance(),
+    'customers': lambda params: pos_system.loadCustomers(),
+    'customer_balances': lambda params: pos_system.getCustomerBalances(),
+    'supplier_balances': lambda params: pos_system.getSupplierBalances(),
+    'invoices': lambda params: pos_system.getAllInvoices(params.get('type', 'sale')),
+    'financial_summary': lambda params: pos_system.getFinancialSummary(),
+    'account_types': lambda params: pos_system.getAccountTypes(),
+    'vouchers': lambda params: pos_system.getVouchersByType(
+        params.get('type', 'receipt'), params.get('start_date'), params.get('end_date')),
+}
+
+@app.route('/api/batch', methods=['GET', 'POST'])
+def batch_requests():
+    """تنفيذ عدة عمليات قراءة في طلب واحد على اتصال واحد ولقطة بيانات واحدة
+    
+    POST: {"requests": {"المفتاح": {"op": "products", "params": {...}}, ...}}
+    GET:  /api/batch?ops=dashboard,categories,settings (المفتاح = اسم العملية)
+    """
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            requests_map = data.get('requests')
+        else:
+            ops = [op.strip() for op in request.args.get('ops', '').split(',') if op.strip()]
+            requests_map = {op: {'op': op} for op in ops}
         
-        # مبيعات اليوم
-        today = datetime.now().date()
-        today_sales = sum(invoice['total_amount'] for invoice in invoices 
-                         if invoice['type'] == 'sale' 
-                         and datetime.strptime(invoice['created_at'], '%Y-%m-%d %H:%M:%S').date() == today)
+        if not isinstance(requests_map, dict) or not requests_map:
+            return jsonify({"success": False, "error": "يجب تحديد العمليات المطلوبة"}), 400
         
-        # قيمة المخزون
-        inventory_value = sum(product['stock_quantity'] * product.get('purchase_price', 0) for product in products)
+        results = {}
+        with pos_system.readSnapshot():
+            for key, spec in requests_map.items():
+                spec = spec if isinstance(spec, dict) else {'op': spec}
+                operation = BATCH_OPERATIONS.get(spec.get('op'))
+                if operation is None:
+                    results[key] = {"success": False, "error": f"عملية غير مدعومة: {spec.get('op')}"}
+                    continue
+                try:
+                    results[key] = {"success": True, "data": operation(spec.get('params') or {})}
+                except Exception as e:
+                    results[key] = {"success": False, "error": str(e)}
         
-        data = {
-            'today_sales': today_sales,
-            'today_purchases': 0,  # يمكن تطويره لاحقاً
-            'inventory_value': inventory_value,
-            'customers_count': len(customers),
-            'recent_invoices': invoices[-5:][::-1],  # آخر 5 فواتير
-            'low_stock_products': [p for p in products if p['stock_quantity'] <= p.get('min_stock', 0)]
-        }
-        return jsonify({"success": True, "data": data})
+        return jsonify({"success": True, "data": results})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -56,7 +172,7 @@ def get_dashboard_data():
 def get_products():
     try:
         products = pos_system.getAllProducts()
-        return jsonify({"success": True, "data": products})
+        return list_response(products)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -68,7 +184,7 @@ def get_products_pos():
             products = pos_system.getProductsByCategory(category_id)
         else:
             products = pos_system.getAllProducts()
-        return jsonify({"success": True, "data": products})
+        return list_response(products)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -97,7 +213,7 @@ def save_product():
 def delete_product(product_id):
     try:
         # في النظام الحالي، نستخدم التحديث بدلاً من الحذف الفعلي
-        result = pos_system.saveProduct({'id': product_id, 'is_active': 0})
+        result = pos_system.deactivateProduct(product_id)
         return jsonify({"success": True, "message": "تم حذف المنتج بنجاح"})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -110,6 +226,48 @@ def get_product_statistics():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/products/alerts')
+def get_stock_alerts():
+    try:
+        status = request.args.get('status')
+        if status not in (None, 'low', 'out'):
+            return jsonify({"success": False, "error": "حالة المخزون غير صالحة"}), 400
+        
+        alerts = pos_system.getStockAlerts(
+            status,
+            request.args.get('page', 1, type=int),
+            request.args.get('per_page', 50, type=int)
+        )
+        return list_response(alerts['items'], total=alerts['total'], counts=alerts['counts'],
+                             page=alerts['page'], per_page=alerts['per_page'])
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/products/alerts/stream')
+def stream_stock_alerts():
+    # إشعارات فورية عند تغير حالة مخزون أي منتج (good/low/out)
+    subscription = pos_system.events.subscribe(['stock_alert'])
+    return Response(stream_with_context(sse_stream(subscription)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# مواضيع الأحداث المتاحة عبر /api/events
+EVENT_TOPICS = ('sale_completed', 'stock_changed', 'stock_alert', 'cash_balance')
+
+@app.route('/api/events')
+def stream_events():
+    """بث فوري لتغيرات المبيعات والمخزون والصندوق بدلاً من الاستطلاع الدوري
+    
+    ?topics=sale_completed,cash_balance لتحديد المواضيع (الافتراضي: الكل)
+    """
+    topics = [topic.strip() for topic in request.args.get('topics', '').split(',') if topic.strip()]
+    unknown = [topic for topic in topics if topic not in EVENT_TOPICS]
+    if unknown:
+        return jsonify({"success": False, "error": f"مواضيع غير مدعومة: {', '.join(unknown)}"}), 400
+    
+    subscription = pos_system.events.subscribe(topics or EVENT_TOPICS)
+    return Response(stream_with_context(sse_stream(subscription)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/products/export')
 def export_products():
     try:
@@ -182,11 +340,158 @@ def delete_category(category_id):
 def process_sale():
     try:
         data = request.json
+        if request.headers.get('Idempotency-Key') and not data.get('idempotency_key'):
+            data['idempotency_key'] = request.headers['Idempotency-Key']
         result = pos_system.processSale(data)
         return jsonify(result)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/sales/batch', methods=['POST'])
+def process_sales_batch():
+    try:
+        data = request.json
+        sales = data.get('sales') if isinstance(data, dict) else data
+        if not isinstance(sales, list) or not sales:
+            return jsonify({"success": False, "error": "يجب إرسال قائمة المبيعات"}), 400
+        
+        result = pos_system.processSalesBatch(sales)
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/purchases/process', methods=['POST'])
+def process_purchase():
+    try:
+        result = pos_system.processPurchase(request.json)
+        return jsonify(result), (200 if result['success'] else 400)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# المخزون
+@app.route('/api/inventory/adjust', methods=['POST'])
+def adjust_stock():
+    try:
+        data = request.json
+        adjustments = data.get('adjustments') if isinstance(data, dict) else data
+        if not isinstance(adjustments, list) or not adjustments:
+            return jsonify({"success": False, "error": "يجب إرسال قائمة التسويات"}), 400
+        
+        result = pos_system.adjustStock(adjustments, data.get('reason') if isinstance(data, dict) else None)
+        return jsonify(result), (200 if result['success'] else 400)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/inventory/valuation')
+def get_inventory_valuation():
+    try:
+        return jsonify({"success": True, "data": pos_system.getInventoryValuation()})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/inventory/stock-on')
+def get_stock_on_date():
+    try:
+        day = request.args.get('date')
+        if not day:
+            return jsonify({"success": False, "error": "التاريخ مطلوب (date=YYYY-MM-DD)"}), 400
+        product_ids = request.args.get('product_ids')
+        product_ids = [int(product_id) for product_id in product_ids.split(',')] if product_ids else None
+        return jsonify({"success": True, "data": pos_system.getStockOnDate(day, product_ids)})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/inventory/movements/<int:product_id>')
+def get_stock_movements(product_id):
+    try:
+        start_date, end_date = analytics_period()
+        return jsonify({"success": True, "data": pos_system.getStockMovements(product_id, start_date, end_date)})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/inventory/drift')
+def get_stock_drift():
+    try:
+        return jsonify({"success": True, "data": pos_system.getStockDrift(request.args.get('limit', 100, type=int))})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/stocktakes', methods=['POST'])
+def create_stocktake():
+    try:
+        data = request.get_json(silent=True) or {}
+        result = pos_system.createStocktake(data.get('note'), session.get('user_id'))
+        return jsonify(result), (201 if result['success'] else 500)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/stocktakes/<int:session_id>')
+def get_stocktake(session_id):
+    try:
+        stocktake_session = pos_system.getStocktake(session_id)
+        if stocktake_session is None:
+            return jsonify({"success": False, "error": "جلسة الجرد غير موجودة"}), 404
+        return jsonify({"success": True, "data": stocktake_session})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/stocktakes/<int:session_id>/counts', methods=['POST'])
+def add_stocktake_counts(session_id):
+    try:
+        data = request.get_json(silent=True)
+        counts = data.get('counts') if isinstance(data, dict) else data
+        if not isinstance(counts, list) or not counts:
+            return jsonify({"success": False, "error": "يجب إرسال قائمة الكميات المعدودة"}), 400
+        mode = data.get('mode', 'add') if isinstance(data, dict) else 'add'
+        result = pos_system.addStocktakeCounts(session_id, counts, mode)
+        return jsonify(result), (200 if result['success'] else 400)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/stocktakes/<int:session_id>/variances')
+def get_stocktake_variances(session_id):
+    try:
+        result = pos_system.getStocktakeVariances(
+            session_id, request.args.get('zero_uncounted', '0') in ('1', 'true', 'yes'),
+            request.args.get('limit', 100, type=int), request.args.get('offset', 0, type=int))
+        return jsonify({"success": True, "data": result})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/stocktakes/<int:session_id>/apply', methods=['POST'])
+@admin_only
+def apply_stocktake(session_id):
+    try:
+        data = request.get_json(silent=True) or {}
+        result = pos_system.applyStocktake(session_id, bool(data.get('zero_uncounted')))
+        return jsonify(result), (200 if result['success'] else 400)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/stocktakes/<int:session_id>', methods=['DELETE'])
+def cancel_stocktake(session_id):
+    try:
+        result = pos_system.cancelStocktake(session_id)
+        return jsonify(result), (200 if result['success'] else 400)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/inventory/snapshots', methods=['POST'])
+@admin_only
+def snapshot_stock():
+    try:
+        data = request.get_json(silent=True) or {}
+        result = pos_system.snapshotStock(data.get('date'))
+        return jsonify(result), (200 if result['success'] else 400)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route('/api/cash/balance')
 def get_cash_balance():
     try:
@@ -200,7 +505,7 @@ def get_invoices():
     try:
         invoice_type = request.args.get('type', 'sale')
         invoices = pos_system.getAllInvoices(invoice_type)
-        return jsonify({"success": True, "data": invoices})
+        return list_response(invoices)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -323,8 +628,9 @@ def get_financial_report():
         if not start_date or not end_date:
             return jsonify({"success": False, "error": "يجب تحديد تاريخ البداية والنهاية"}), 400
             
-        report = pos_system.generateFinancialReport(start_date, end_date)
-        return jsonify({"success": True, "data": report})
+        backend, freshness = reporting_backend()
+        report = backend.generateFinancialReport(start_date, end_date)
+        return jsonify({"success": True, "data": report, "freshness": freshness})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -343,20 +649,14 @@ def get_sales_reports():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        invoices = pos_system.getAllInvoices('sale')
-        
-        # تطبيق الفلتر إذا كان موجوداً
+        # الفلترة بالتاريخ تتم في قاعدة البيانات وتشمل ملفات الأرشيف عند الحاجة
+        backend, freshness = reporting_backend()
         if start_date and end_date:
-            filtered_invoices = []
-            for invoice in invoices:
-                invoice_date = datetime.strptime(invoice['created_at'], '%Y-%m-%d %H:%M:%S').date()
-                start = datetime.strptime(start_date, '%Y-%m-%d').date()
-                end = datetime.strptime(end_date, '%Y-%m-%d').date()
-                if start <= invoice_date <= end:
-                    filtered_invoices.append(invoice)
-            invoices = filtered_invoices
+            invoices = backend.getAllInvoices('sale', start_date, end_date)
+        else:
+            invoices = backend.getAllInvoices('sale')
         
-        return jsonify({"success": True, "data": invoices})
+        return list_response(invoices, freshness=freshness)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -366,53 +666,239 @@ def get_purchases_reports():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        invoices = pos_system.getAllInvoices('purchase')
-        
-        # تطبيق الفلتر إذا كان موجوداً
+        # الفلترة بالتاريخ تتم في قاعدة البيانات وتشمل ملفات الأرشيف عند الحاجة
+        backend, freshness = reporting_backend()
         if start_date and end_date:
-            filtered_invoices = []
-            for invoice in invoices:
-                invoice_date = datetime.strptime(invoice['created_at'], '%Y-%m-%d %H:%M:%S').date()
-                start = datetime.strptime(start_date, '%Y-%m-%d').date()
-                end = datetime.strptime(end_date, '%Y-%m-%d').date()
-                if start <= invoice_date <= end:
-                    filtered_invoices.append(invoice)
-            invoices = filtered_invoices
+            invoices = backend.getAllInvoices('purchase', start_date, end_date)
+        else:
+            invoices = backend.getAllInvoices('purchase')
         
-        return jsonify({"success": True, "data": invoices})
+        return list_response(invoices, freshness=freshness)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/reports/margin')
+def get_margin_report():
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        
+        if not start_date or not end_date:
+            return jsonify({"success": False, "error": "يجب تحديد تاريخ البداية والنهاية"}), 400
+        
+        backend, freshness = reporting_backend()
+        report = backend.getMarginReport(start_date, end_date, request.args.get('group_by', 'product'),
+                                         request.args.get('limit', type=int),
+                                         request.args.get('offset', 0, type=int))
+        return jsonify({"success": True, "data": report, "freshness": freshness})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/reports/margin/summary')
+def get_margin_summary():
+    try:
+        backend, freshness = reporting_backend()
+        return jsonify({"success": True, "data": backend.getMarginSummary(), "freshness": freshness})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# تحليلات المبيعات حسب المنتج (الفترة الافتراضية: آخر 30 يوماً)
+def analytics_period():
+    end_date = request.args.get('end_date') or datetime.now().strftime('%Y-%m-%d')
+    start_date = request.args.get('start_date') or (
+        datetime.strptime(end_date, '%Y-%m-%d') - timedelta(days=29)).strftime('%Y-%m-%d')
+    return start_date, end_date
+
+@app.route('/api/analytics/top-products')
+def get_top_products():
+    try:
+        start_date, end_date = analytics_period()
+        backend, freshness = reporting_backend()
+        products = backend.getTopProducts(start_date, end_date,
+                                          request.args.get('limit', 20, type=int),
+                                          request.args.get('by', 'revenue'))
+        return list_response(products, period={'start_date': start_date, 'end_date': end_date},
+                             freshness=freshness)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/analytics/abc')
+def get_abc_analysis():
+    try:
+        start_date, end_date = analytics_period()
+        backend, freshness = reporting_backend()
+        analysis = backend.getABCAnalysis(start_date, end_date,
+                                          request.args.get('a', 0.8, type=float),
+                                          request.args.get('b', 0.95, type=float))
+        return jsonify({"success": True, "data": analysis, "freshness": freshness})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/analytics/velocity')
+def get_product_velocity():
+    try:
+        start_date, end_date = analytics_period()
+        backend, freshness = reporting_backend()
+        report = backend.getProductVelocity(start_date, end_date,
+                                            request.args.get('sort', 'days_of_cover'),
+                                            request.args.get('limit', 100, type=int),
+                                            request.args.get('offset', 0, type=int))
+        return jsonify({"success": True, "data": report, "freshness": freshness})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# اقتراحات إعادة الطلب
+@app.route('/api/reorder/suggestions')
+def get_reorder_suggestions():
+    try:
+        backend, freshness = reporting_backend()
+        suggestions = backend.getReorderSuggestions(
+            lead_days=request.args.get('lead_days', type=float),
+            review_days=request.args.get('review_days', type=float),
+            service_z=request.args.get('service_z', type=float),
+            limit=request.args.get('limit', 100, type=int),
+            offset=request.args.get('offset', 0, type=int),
+            include_all=request.args.get('all') == '1')
+        return jsonify({"success": True, "data": suggestions, "freshness": freshness})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/reorder/rebuild', methods=['POST'])
+@admin_only
+def rebuild_demand():
+    try:
+        result = pos_system.rebuildDemand()
+        return jsonify(result), (200 if result['success'] else 500)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 # النسخ الاحتياطي
+@app.route('/api/archives')
+def list_archives():
+    try:
+        return jsonify({"success": True, "data": pos_system.listArchives()})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/archives', methods=['POST'])
+@admin_only
+def archive_closed_periods():
+    try:
+        data = request.get_json(silent=True) or {}
+        result = pos_system.archiveClosedPeriods(keep_years=data.get('keep_years', 1), vacuum=bool(data.get('vacuum')))
+        return jsonify(result), (200 if result['success'] else 500)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/stores')
+def get_stores():
+    try:
+        return jsonify({"success": True, "data": [
+            {"store_id": store_id, "size": os.path.getsize(path) if os.path.exists(path) else 0}
+            for store_id, path in store_router.list_stores()
+        ]})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/stores', methods=['POST'])
+@admin_only
+def create_store():
+    data = request.get_json(silent=True) or {}
+    try:
+        store_router.create(str(data.get('store_id') or ''))
+        return jsonify({"success": True, "message": "تم إنشاء الفرع", "store_id": data['store_id']}), 201
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/chain/report')
+def get_chain_report():
+    """تقرير موحد لجميع الفروع: mode=attach (افتراضي) أو parallel، و stores=a,b لتحديد الفروع"""
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        if not start_date or not end_date:
+            return jsonify({"success": False, "error": "يجب تحديد تاريخ البداية والنهاية"}), 400
+        
+        store_ids = [store_id for store_id in request.args.get('stores', '').split(',') if store_id]
+        report = store_router.chainReport(start_date, end_date,
+                                          mode=request.args.get('mode', 'attach'),
+                                          store_ids=store_ids or None,
+                                          top=request.args.get('top', 20, type=int))
+        return jsonify({"success": True, "data": report})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route('/api/backup', methods=['POST'])
+@admin_only
 def create_backup():
     try:
-        backup_data = {
-            'products': pos_system.getAllProducts(),
-            'customers': pos_system.loadCustomers(),
-            'invoices': pos_system.getAllInvoices(),
-            'settings': pos_system.loadSettings(),
-            'backup_date': datetime.now().isoformat()
-        }
-        
-        backup_filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        # mode=local: حفظ نسخة كاملة في مجلد النسخ على الخادم
+        # mode=incremental: حفظ التغييرات منذ آخر نسخة فقط
+        # بدون mode: تنزيل نسخة كاملة مباشرة
+        mode = request.args.get('mode')
+        if mode in ('local', 'incremental'):
+            backup = pos_system.createIncrementalBackup() if mode == 'incremental' else pos_system.createBackup()
+            backup.pop('path', None)
+            return jsonify({"success": True, "message": "تم إنشاء نسخة احتياطية", **backup})
         
-        return jsonify({
-            "success": True, 
-            "message": "تم إنشاء نسخة احتياطية", 
-            "filename": backup_filename,
-            "data": backup_data
-        })
+        return Response(
+            stream_with_context(pos_system.streamBackup()),
+            mimetype='application/gzip',
+            headers={'Content-Disposition': f'attachment; filename={backup_filename()}'}
+        )
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/backups')
+@admin_only
+def list_backups():
+    try:
+        return jsonify({"success": True, "data": pos_system.listBackups()})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/backup/restore', methods=['POST'])
+@admin_only
 def restore_backup():
     try:
-        data = request.json
-        # هنا سيتم استعادة البيانات من النسخة الاحتياطية
-        # في النظام الحقيقي، سيتم حفظها في قاعدة البيانات
-        return jsonify({"success": True, "message": "تم استعادة النسخة الاحتياطية بنجاح"})
+        if 'file' in request.files:
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({"success": False, "error": "لم يتم اختيار ملف"}), 400
+            
+            # حفظ الملف المرفوع مؤقتاً في مجلد النسخ (يُكتب على دفعات دون تحميله في الذاكرة)
+            os.makedirs(pos_system.backup_dir, exist_ok=True)
+            fd, file_path = tempfile.mkstemp(prefix='temp_restore_', suffix='.upload', dir=pos_system.backup_dir)
+            os.close(fd)
+            file.save(file_path)
+            try:
+                result = pos_system.restoreBackup(backup_path=file_path)
+            finally:
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+        else:
+            data = request.get_json(silent=True) or {}
+            if not data.get('filename'):
+                return jsonify({"success": False, "error": "لم يتم اختيار ملف"}), 400
+            result = pos_system.restoreBackup(filename=data['filename'], incrementals=data.get('incrementals'))
+        
+        return jsonify(result), (200 if result['success'] else 400)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -493,5 +979,63 @@ def check_auth():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+# =========================================================================
+# مؤشرات الأداء (متاحة من الجهاز المحلي فقط)
+# =========================================================================
+
+@app.route('/api/replicas', methods=['GET', 'POST'])
+@local_only
+def reporting_replicas():
+    # POST لتحديث نسخ التقارير فوراً دون انتظار الدورة التالية
+    if request.method == 'POST':
+        return jsonify({"success": True, "data": replicas.refresh_all()})
+    return jsonify({"success": True, "data": replicas.status()})
+
+@app.route('/api/metrics/queries', methods=['GET', 'DELETE'])
+@local_only
+def query_metrics():
+    # DELETE لتصفير العدادات قبل بدء قياس جديد
+    if request.method == 'DELETE':
+        pos_system.metrics.reset()
+        return jsonify({"success": True})
+    top = request.args.get('top', 50, type=int)
+    return jsonify({"success": True, "data": pos_system.metrics.snapshot(top)})
+
+@app.route('/api/metrics/cache', methods=['GET', 'DELETE'])
+@local_only
+def report_cache_metrics():
+    # التقارير المقروءة من نسخة التقارير لها ذاكرتها الخاصة (انظر /api/replicas)
+    # DELETE لتصفير العدادات وحذف النتائج المخزنة
+    if request.method == 'DELETE':
+        pos_system.reportCache.reset()
+        pos_system.reportCache.clear()
+        return jsonify({"success": True})
+    return jsonify({"success": True, "data": pos_system.reportCache.snapshot()})
+
+@app.route('/api/metrics/routes')
+@local_only
+def route_metrics_summary():
+    return jsonify({"success": True, "data": route_metrics.snapshot()})
+
+@app.route('/metrics')
+@local_only
+def prometheus_metrics():
+    # زمن وحجم وأخطاء كل مسار، مع أزمنة دوال الواجهة الخلفية
+    return Response(route_metrics.render_prometheus(pos_system.metrics, pos_system.reportCache),
+                    content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/api/profiles')
+@admin_only
+def get_profiles():
+    return jsonify({"success": True, "data": list_profiles(app.config['PROFILE_DIR'])})
+
+@app.route('/api/profiles/<profile_id>')
+@admin_only
+def download_profile(profile_id):
+    path = resolve_profile(app.config['PROFILE_DIR'], profile_id)
+    if path is None:
+        return jsonify({"success": False, "error": "التحليل غير موجود"}), 404
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,221 @@
+"""أرشفة البيانات القديمة في ملفات سنوية منفصلة
+
+الفواتير وبنودها وحركات الصندوق والسندات للفترات المغلقة تُنقل من قاعدة البيانات
+الرئيسية إلى archives/archive_<year>.db، مع الاحتفاظ بملخص يومي في الجدول
+archive_daily_summary داخل القاعدة الرئيسية حتى تبقى التقارير المالية صحيحة دون
+فتح الأرشيف. الفواتير الآجلة غير المسددة (status = 'pending') لا تُؤرشف لأنها
+ما زالت مفتوحة.
+
+عملية النقل لكل سنة تتم في معاملة واحدة تشمل القاعدتين (ATTACH)، فإما أن تُنقل
+الصفوف كاملة أو لا يتغير شيء.
+"""
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+ARCHIVED_TABLES = ('invoices', 'invoice_items', 'cash_transactions', 'vouchers')
+
+ARCHIVE_PATTERN = re.compile(r'^archive_(\d{4})\.db$')
+
+# الفهارس التي تحتاجها استعلامات التقارير على الأرشيف
+ARCHIVE_INDEXES = (
+    ('idx_archive_invoices_created_at', 'invoices', 'type, created_at'),
+    ('idx_archive_invoice_items_invoice', 'invoice_items', 'invoice_id'),
+    ('idx_archive_vouchers_created_at', 'vouchers', 'voucher_type, created_at'),
+)
+
+
+def install_archive_summary(cursor):
+    """جدول الملخص اليومي للفترات المؤرشفة في القاعدة الرئيسية"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive_daily_summary (
+            day TEXT PRIMARY KEY,
+            sales_count INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            cash_sales REAL NOT NULL DEFAULT 0,
+            credit_sales REAL NOT NULL DEFAULT 0,
+            purchases_total REAL NOT NULL DEFAULT 0,
+            receipts REAL NOT NULL DEFAULT 0,
+            expenses REAL NOT NULL DEFAULT 0,
+            cash_in REAL NOT NULL DEFAULT 0,
+            cash_out REAL NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def archive_path(archive_dir, year):
+    return os.path.join(archive_dir, f'archive_{int(year)}.db')
+
+
+def list_archives(archive_dir):
+    """ملفات الأرشيف الموجودة: [(السنة، المسار)] مرتبة تصاعدياً"""
+    if not os.path.isdir(archive_dir):
+        return []
+    archives = []
+    for name in os.listdir(archive_dir):
+        match = ARCHIVE_PATTERN.match(name)
+        if match:
+            archives.append((int(match.group(1)), os.path.join(archive_dir, name)))
+    return sorted(archives)
+
+
+def archives_for_range(archive_dir, start_date=None, end_date=None):
+    """ملفات الأرشيف التي تتقاطع سنواتها مع الفترة المطلوبة"""
+    first = int(start_date[:4]) if start_date else None
+    last = int(end_date[:4]) if end_date else None
+    return [(year, path) for year, path in list_archives(archive_dir)
+            if (first is None or year >= first) and (last is None or year <= last)]
+
+
+def archivable_years(conn, before_year):
+    """السنوات السابقة لـ before_year التي ما زالت لها صفوف في القاعدة الرئيسية"""
+    years = set()
+    for table, condition in (('invoices', "status != 'pending'"), ('cash_transactions', '1'), ('vouchers', '1')):
+        for (year,) in conn.execute(f'''
+            SELECT DISTINCT strftime('%Y', created_at) FROM {table}
+            WHERE created_at < ? AND {condition}
+        ''', (f'{before_year:04d}-01-01',)):
+            if year:
+                years.add(int(year))
+    return sorted(years)
+
+
+def _columns(conn, schema, table):
+    return [(row[1], row[2]) for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def _prepare_archive_tables(conn):
+    """إنشاء جداول الأرشيف بنفس مخطط الجداول الرئيسية وإضافة الأعمدة الجديدة إن وجدت"""
+    for table in ARCHIVED_TABLES:
+        sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                           (table,)).fetchone()[0]
+        conn.execute(re.sub(r'^CREATE TABLE\s+"?\w+"?', f'CREATE TABLE IF NOT EXISTS archive.{table}', sql))
+
+        existing = {name for name, _ in _columns(conn, 'archive', table)}
+        for name, kind in _columns(conn, 'main', table):
+            if name not in existing:
+                conn.execute(f'ALTER TABLE archive.{table} ADD COLUMN {name} {kind}')
+
+    for name, table, columns in ARCHIVE_INDEXES:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS archive.{name} ON {table} ({columns})')
+
+
+def archive_year(conn, archive_dir, year):
+    """نقل صفوف سنة مغلقة إلى ملف أرشيفها وتحديث الملخص اليومي
+
+    يجب أن يكون الاتصال خارج أي معاملة (ATTACH غير مسموح داخل معاملة).
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    start, end = f'{year:04d}-01-01', f'{year + 1:04d}-01-01'
+
+    conn.execute('ATTACH DATABASE ? AS archive', (archive_path(archive_dir, year),))
+    try:
+        _prepare_archive_tables(conn)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('''
+                CREATE TEMP TABLE archive_invoice_ids AS
+                SELECT id FROM main.invoices
+                WHERE created_at >= ? AND created_at < ? AND status != 'pending'
+            ''', (start, end))
+            conn.execute('CREATE UNIQUE INDEX temp.idx_archive_invoice_ids ON archive_invoice_ids (id)')
+
+            _summarize(conn, start, end)
+
+            counts = {}
+            selections = {
+                'invoices': 'id IN (SELECT id FROM temp.archive_invoice_ids)',
+                'invoice_items': 'invoice_id IN (SELECT id FROM temp.archive_invoice_ids)',
+                'cash_transactions': 'created_at >= :start AND created_at < :end',
+                'vouchers': 'created_at >= :start AND created_at < :end',
+            }
+            params = {'start': start, 'end': end}
+            # البنود قبل الفواتير حتى يبقى شرط invoice_id صالحاً أثناء الحذف
+            for table in ('invoice_items', 'invoices', 'cash_transactions', 'vouchers'):
+                columns = ', '.join(name for name, _ in _columns(conn, 'main', table))
+                condition = selections[table]
+                counts[table] = conn.execute(f'''
+                    INSERT OR REPLACE INTO archive.{table} ({columns})
+                    SELECT {columns} FROM main.{table} WHERE {condition}
+                ''', params).rowcount
+                conn.execute(f'DELETE FROM main.{table} WHERE {condition}', params)
+
+            conn.execute('DROP TABLE temp.archive_invoice_ids')
+            conn.execute('COMMIT')
+            return counts
+        except Exception:
+            conn.execute('ROLLBACK')
+            conn.execute('DROP TABLE IF EXISTS temp.archive_invoice_ids')
+            raise
+    finally:
+        conn.execute('DETACH DATABASE archive')
+
+
+def _summarize(conn, start, end):
+    """إضافة ملخص الأيام المؤرشفة (يُجمع مع أي ملخص سابق لنفس اليوم)"""
+    conn.execute('''
+        INSERT INTO main.archive_daily_summary
+            (day, sales_count, revenue, cash_sales, credit_sales, purchases_total,
+             receipts, expenses, cash_in, cash_out)
+        SELECT day, SUM(sales_count), SUM(revenue), SUM(cash_sales), SUM(credit_sales),
+               SUM(purchases_total), SUM(receipts), SUM(expenses), SUM(cash_in), SUM(cash_out)
+        FROM (
+            SELECT DATE(created_at) AS day,
+                   SUM(type = 'sale') AS sales_count,
+                   SUM(CASE WHEN type = 'sale' AND status = 'completed' THEN total_amount ELSE 0 END) AS revenue,
+                   SUM(CASE WHEN type = 'sale' AND status = 'completed' AND remaining_amount = 0
+                            THEN paid_amount ELSE 0 END) AS cash_sales,
+                   SUM(CASE WHEN type = 'sale' AND status = 'completed' AND remaining_amount > 0
+                            THEN remaining_amount ELSE 0 END) AS credit_sales,
+                   SUM(CASE WHEN type = 'purchase' THEN total_amount ELSE 0 END) AS purchases_total,
+                   0 AS receipts, 0 AS expenses, 0 AS cash_in, 0 AS cash_out
+            FROM main.invoices WHERE id IN (SELECT id FROM temp.archive_invoice_ids)
+            GROUP BY day
+            UNION ALL
+            SELECT DATE(created_at), 0, 0, 0, 0, 0,
+                   SUM(CASE WHEN voucher_type = 'receipt' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN voucher_type = 'payment' THEN amount ELSE 0 END), 0, 0
+            FROM main.vouchers WHERE created_at >= ? AND created_at < ?
+            GROUP BY 1
+            UNION ALL
+            SELECT DATE(created_at), 0, 0, 0, 0, 0, 0, 0,
+                   SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN type != 'income' THEN amount ELSE 0 END)
+            FROM main.cash_transactions WHERE created_at >= ? AND created_at < ?
+            GROUP BY 1
+        )
+        GROUP BY day
+        ON CONFLICT(day) DO UPDATE SET
+            sales_count = sales_count + excluded.sales_count,
+            revenue = revenue + excluded.revenue,
+            cash_sales = cash_sales + excluded.cash_sales,
+            credit_sales = credit_sales + excluded.credit_sales,
+            purchases_total = purchases_total + excluded.purchases_total,
+            receipts = receipts + excluded.receipts,
+            expenses = expenses + excluded.expenses,
+            cash_in = cash_in + excluded.cash_in,
+            cash_out = cash_out + excluded.cash_out
+    ''', (start, end, start, end))
+
+
+def summary_totals(cursor, start_date, end_date):
+    """مجاميع الملخص المؤرشف للفترة (بنفس تعريفات التقرير المالي)"""
+    cursor.execute('''
+        SELECT COALESCE(SUM(revenue), 0), COALESCE(SUM(expenses), 0),
+               COALESCE(SUM(cash_sales), 0), COALESCE(SUM(credit_sales), 0)
+        FROM archive_daily_summary
+        WHERE day BETWEEN ? AND ?
+    ''', (start_date, end_date))
+    revenue, expenses, cash_sales, credit_sales = cursor.fetchone()
+    return {'revenue': revenue, 'expenses': expenses, 'cash_sales': cash_sales, 'credit_sales': credit_sales}
+
+
+def open_archive(path):
+    """اتصال للقراءة فقط بملف أرشيف"""
+    return sqlite3.connect(f'file:{os.path.abspath(path)}?mode=ro', uri=True)
+
+
+def current_cutoff_year(keep_years=1):
+    """أول سنة تبقى في القاعدة الرئيسية (keep_years=1: السنة الحالية فقط)"""
+    return datetime.now().year - max(int(keep_years), 1) + 1
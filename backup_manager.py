@@ -0,0 +1,522 @@
+"""النسخ الاحتياطي والاستعادة باستخدام واجهة النسخ الاحتياطي المباشر في SQLite
+
+يتم أخذ النسخة صفحةً بصفحة (backup API) إلى ملف مؤقت على القرص حتى لا تُحجب
+عمليات الكتابة لفترة طويلة، ثم تُضغط بـ gzip وتُرسل على دفعات دون تحميل
+قاعدة البيانات كاملة في الذاكرة.
+"""
+import base64
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import zlib
+from datetime import datetime
+
+GZIP_MAGIC = b'\x1f\x8b'
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+# 256 صفحة × 4KB = 1MB في كل خطوة، مع مهلة قصيرة تسمح للكتابات بالمرور
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.01
+CHUNK_SIZE = 1024 * 1024
+
+REQUIRED_TABLES = ('products', 'categories', 'invoices', 'invoice_items', 'accounts')
+
+# الجداول التي تُسجل تغييراتها في change_log للنسخ التزايدي: جميع الجداول غير المشتقة.
+# المشتقة (stock_alerts, product_demand, daily_margin, inventory_valuation, stock_snapshots) تُعاد بناؤها بعد الاستعادة.
+# الصفوف تُعرّف بـ rowid (وهو id في الجداول ذات المفتاح الرقمي)
+CHANGE_TRACKED_TABLES = (
+    'users', 'settings', 'categories', 'products', 'product_images', 'customers', 'suppliers',
+    'invoices', 'invoice_items', 'accounts', 'cash_transactions', 'vouchers',
+    'journal_entries', 'journal_items', 'archive_daily_summary',
+    'stock_movements', 'stocktake_sessions', 'stocktake_counts',
+)
+
+
+def install_change_journal(cursor):
+    """إنشاء جدول سجل التغييرات والمشغلات (triggers) على الجداول المتتبعة"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS backup_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            backup_type TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            base_change_id INTEGER NOT NULL DEFAULT 0,
+            last_change_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # موضع السجل الذي بدأ منه تتبع كل جدول؛ النسخ التزايدية المبنية على نسخة أقدم منه ناقصة
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log_tables (
+            table_name TEXT PRIMARY KEY,
+            tracked_since INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("SELECT type, name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+    existing = {(kind, name) for kind, name in cursor.fetchall()}
+    position = journal_position(cursor)
+
+    for table in CHANGE_TRACKED_TABLES:
+        # نسخة قديمة قبل إنشاء الجدول: يُتتبع بعد ترحيلها
+        if ('table', table) not in existing:
+            continue
+        if ('trigger', f'trg_{table}_insert_log') not in existing:
+            cursor.execute('INSERT OR REPLACE INTO change_log_tables (table_name, tracked_since) VALUES (?, ?)',
+                           (table, position))
+        for operation, ref in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{operation.lower()}_log
+                AFTER {operation} ON {table}
+                BEGIN
+                    INSERT INTO change_log (table_name, row_id, operation)
+                    VALUES ('{table}', {ref}.rowid, '{operation[0]}');
+                END
+            ''')
+
+
+def journal_position(cursor):
+    """آخر معرف صدر في change_log (يبقى صحيحاً بعد حذف السجلات المنسوخة)"""
+    cursor.execute("SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'change_log'), 0)")
+    return cursor.fetchone()[0]
+
+
+def backup_filename(prefix='backup', when=None):
+    """اسم ملف النسخة الاحتياطية المضغوطة"""
+    when = when or datetime.now()
+    return f"{prefix}_{when.strftime('%Y%m%d_%H%M%S')}.db.gz"
+
+
+def _unique_filename(backup_dir, filename):
+    """اسم غير مستخدم في مجلد النسخ (نسختان في نفس الثانية لا تستبدل إحداهما الأخرى)"""
+    stem, _, extension = filename.partition('.')
+    candidate, counter = filename, 1
+    while os.path.exists(os.path.join(backup_dir, candidate)):
+        candidate = f'{stem}_{counter}.{extension}'
+        counter += 1
+    return candidate
+
+
+def snapshot_database(db_path, dest_path, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP):
+    """أخذ نسخة متسقة من قاعدة البيانات إلى ملف باستخدام backup API"""
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(dest_path)
+    try:
+        source.backup(target, pages=pages, sleep=sleep)
+    finally:
+        target.close()
+        source.close()
+    return dest_path
+
+
+def iter_compressed(path, level=6, chunk_size=CHUNK_SIZE):
+    """قراءة ملف وإرجاعه مضغوطاً بصيغة gzip على دفعات"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    with open(path, 'rb') as source:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+    yield compressor.flush()
+
+
+def _temp_snapshot_path(directory=None):
+    handle, path = tempfile.mkstemp(prefix='pos_snapshot_', suffix='.db', dir=directory)
+    os.close(handle)
+    return path
+
+
+def stream_backup(db_path, level=6):
+    """مولد يرجع نسخة احتياطية مضغوطة على دفعات ويحذف الملف المؤقت عند الانتهاء"""
+    snapshot_path = _temp_snapshot_path()
+    try:
+        snapshot_database(db_path, snapshot_path)
+        yield from iter_compressed(snapshot_path, level)
+    finally:
+        _remove_quietly(snapshot_path)
+
+
+def write_backup(db_path, backup_dir, level=6):
+    """حفظ نسخة احتياطية مضغوطة في مجلد محلي وإرجاع معلوماتها"""
+    os.makedirs(backup_dir, exist_ok=True)
+    filename = _unique_filename(backup_dir, backup_filename())
+    final_path = os.path.join(backup_dir, filename)
+    partial_path = final_path + '.partial'
+
+    snapshot_path = _temp_snapshot_path(backup_dir)
+    try:
+        snapshot_database(db_path, snapshot_path)
+        last_change_id = _max_change_id(snapshot_path)
+        with open(partial_path, 'wb') as output:
+            for chunk in iter_compressed(snapshot_path, level):
+                output.write(chunk)
+        # إعادة التسمية ذرية، فلا يظهر ملف نسخة ناقص في المجلد
+        os.replace(partial_path, final_path)
+    finally:
+        _remove_quietly(snapshot_path)
+        _remove_quietly(partial_path)
+
+    # النسخ التزايدية التالية تبدأ من آخر تغيير موجود في هذه النسخة،
+    # والتغييرات الأقدم لم تعد لازمة في السجل
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            conn.execute('''
+                INSERT INTO backup_history (backup_type, filename, last_change_id)
+                VALUES ('full', ?, ?)
+            ''', (filename, last_change_id))
+            conn.execute('DELETE FROM change_log WHERE id <= ?', (last_change_id,))
+    finally:
+        conn.close()
+
+    return {
+        'filename': filename,
+        'type': 'full',
+        'path': final_path,
+        'size': os.path.getsize(final_path),
+        'last_change_id': last_change_id,
+        'created_at': datetime.now().isoformat()
+    }
+
+
+def _max_change_id(path):
+    conn = sqlite3.connect(path)
+    try:
+        return journal_position(conn.cursor())
+    finally:
+        conn.close()
+
+
+def _encode_value(value):
+    # أعمدة BLOB (صور المنتجات) غير قابلة للترميز في JSON مباشرة
+    if isinstance(value, bytes):
+        return {'$base64': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f'قيمة غير قابلة للترميز: {type(value).__name__}')
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and '$base64' in value:
+        return base64.b64decode(value['$base64'])
+    return value
+
+
+def write_incremental_backup(db_path, backup_dir):
+    """حفظ نسخة تزايدية بالصفوف التي تغيرت منذ آخر نسخة (كاملة أو تزايدية)
+
+    الملف بصيغة JSON Lines مضغوطة: سطر رأس يحدد نطاق التغييرات، ثم سطر لكل
+    صف بحالته الحالية (upsert) أو لكل صف محذوف (delete).
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        row = conn.execute('''
+            SELECT last_change_id FROM backup_history ORDER BY id DESC LIMIT 1
+        ''').fetchone()
+        if row is None:
+            raise ValueError('يجب إنشاء نسخة احتياطية كاملة قبل النسخ التزايدي')
+        base_change_id = row[0]
+
+        # جدول بدأ تتبعه بعد آخر نسخة: تغييراته قبل ذلك غير مسجلة، فالنسخة التزايدية ستكون ناقصة
+        late = [name for name, since in conn.execute('SELECT table_name, tracked_since FROM change_log_tables')
+                if since > base_change_id]
+        if late:
+            raise ValueError(f'يجب إنشاء نسخة احتياطية كاملة جديدة (بدأ تتبع الجداول: {", ".join(sorted(late))})')
+
+        filename = _unique_filename(backup_dir, backup_filename('incremental').replace('.db.gz', '.jsonl.gz'))
+        final_path = os.path.join(backup_dir, filename)
+        partial_path = final_path + '.partial'
+
+        # معاملة قراءة واحدة لضمان لقطة متسقة بين السجل والصفوف
+        conn.execute('BEGIN')
+        last_change_id = journal_position(conn.cursor())
+        changed = conn.execute('''
+            SELECT table_name, row_id FROM change_log
+            WHERE id > ? AND id <= ?
+            GROUP BY table_name, row_id
+            ORDER BY table_name, row_id
+        ''', (base_change_id, last_change_id)).fetchall()
+
+        counts = {'upsert': 0, 'delete': 0}
+        try:
+            with gzip.open(partial_path, 'wt', encoding='utf-8') as output:
+                output.write(json.dumps({
+                    'type': 'incremental',
+                    'base_change_id': base_change_id,
+                    'last_change_id': last_change_id,
+                    'tables': list(CHANGE_TRACKED_TABLES),
+                    'created_at': datetime.now().isoformat()
+                }, ensure_ascii=False) + '\n')
+
+                for table in CHANGE_TRACKED_TABLES:
+                    row_ids = [row_id for name, row_id in changed if name == table]
+                    for start in range(0, len(row_ids), 500):
+                        chunk = row_ids[start:start + 500]
+                        marks = ','.join('?' * len(chunk))
+                        cursor = conn.execute(f'SELECT rowid, * FROM {table} WHERE rowid IN ({marks})', chunk)
+                        columns = [column[0] for column in cursor.description][1:]
+                        found = set()
+                        for values in cursor:
+                            found.add(values[0])
+                            entry = {'table': table, 'op': 'upsert', 'row': dict(zip(columns, values[1:]))}
+                            if 'id' not in entry['row']:
+                                entry['rowid'] = values[0]
+                            output.write(json.dumps(entry, ensure_ascii=False, default=_encode_value) + '\n')
+                            counts['upsert'] += 1
+                        for row_id in chunk:
+                            if row_id not in found:
+                                output.write(json.dumps({'table': table, 'op': 'delete', 'id': row_id}) + '\n')
+                                counts['delete'] += 1
+            conn.commit()
+            os.replace(partial_path, final_path)
+        finally:
+            _remove_quietly(partial_path)
+
+        with conn:
+            conn.execute('''
+                INSERT INTO backup_history (backup_type, filename, base_change_id, last_change_id)
+                VALUES ('incremental', ?, ?, ?)
+            ''', (filename, base_change_id, last_change_id))
+    finally:
+        conn.close()
+
+    return {
+        'filename': filename,
+        'type': 'incremental',
+        'path': final_path,
+        'size': os.path.getsize(final_path),
+        'base_change_id': base_change_id,
+        'last_change_id': last_change_id,
+        'upserts': counts['upsert'],
+        'deletes': counts['delete'],
+        'created_at': datetime.now().isoformat()
+    }
+
+
+def list_backups(backup_dir):
+    """قائمة النسخ الاحتياطية المحفوظة محلياً من الأحدث للأقدم"""
+    if not os.path.isdir(backup_dir):
+        return []
+    backups = []
+    for name in os.listdir(backup_dir):
+        if not name.endswith(('.db.gz', '.jsonl.gz')):
+            continue
+        path = os.path.join(backup_dir, name)
+        backups.append({
+            'filename': name,
+            'type': 'incremental' if name.endswith('.jsonl.gz') else 'full',
+            'size': os.path.getsize(path),
+            'modified_at': datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+        })
+    backups.sort(key=lambda backup: backup['modified_at'], reverse=True)
+    return backups
+
+
+def resolve_backup(backup_dir, filename):
+    """مسار نسخة محلية بالاسم مع منع الخروج من مجلد النسخ"""
+    path = os.path.join(backup_dir, os.path.basename(filename))
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f'النسخة الاحتياطية غير موجودة: {filename}')
+    return path
+
+
+def _decompress_to(source_path, dest_path):
+    """فك ضغط ملف النسخة (أو نسخه إذا لم يكن مضغوطاً) إلى ملف قاعدة بيانات"""
+    with open(source_path, 'rb') as source:
+        magic = source.read(2)
+
+    opener = gzip.open if magic == GZIP_MAGIC else open
+    with opener(source_path, 'rb') as source, open(dest_path, 'wb') as target:
+        shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+    with open(dest_path, 'rb') as target:
+        if target.read(len(SQLITE_MAGIC)) != SQLITE_MAGIC:
+            raise ValueError('الملف ليس نسخة احتياطية صالحة لقاعدة البيانات')
+
+
+def validate_database(path):
+    """التحقق من سلامة ملف قاعدة البيانات ووجود الجداول الأساسية"""
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            raise ValueError(f'النسخة الاحتياطية تالفة: {result}')
+
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'change_log' not in tables:
+            install_change_journal(conn.cursor())
+            conn.commit()
+        missing = [table for table in REQUIRED_TABLES if table not in tables]
+        if missing:
+            raise ValueError(f'النسخة الاحتياطية لا تحتوي على الجداول: {", ".join(missing)}')
+    finally:
+        conn.close()
+
+
+def apply_incremental(conn, path, expected_base=None):
+    """تطبيق نسخة تزايدية على اتصال مفتوح (ضمن معاملة المستدعي)
+
+    النسخ التي لا تغطي جميع الجداول المتتبعة حالياً (من إصدار أقدم) تُرفض بدلاً
+    من استعادة ناقصة بصمت.
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as source:
+        header = json.loads(source.readline() or '{}')
+        if header.get('type') != 'incremental':
+            raise ValueError(f'ملف النسخة التزايدية غير صالح: {os.path.basename(path)}')
+        missing = [table for table in CHANGE_TRACKED_TABLES if table not in header.get('tables', ())]
+        if missing:
+            raise ValueError(f'النسخة {os.path.basename(path)} لا تتضمن تغييرات الجداول: {", ".join(missing)}؛ '
+                             'يلزم نسخة كاملة أحدث')
+        if expected_base is not None and header['base_change_id'] != expected_base:
+            raise ValueError(
+                f'النسخة {os.path.basename(path)} لا تتبع النسخة السابقة '
+                f'(تبدأ من {header["base_change_id"]} والمتوقع {expected_base})'
+            )
+
+        for line in source:
+            entry = json.loads(line)
+            table = entry['table']
+            if table not in CHANGE_TRACKED_TABLES:
+                raise ValueError(f'جدول غير متوقع في النسخة التزايدية: {table}')
+            if entry['op'] == 'delete':
+                conn.execute(f'DELETE FROM {table} WHERE rowid = ?', (entry['id'],))
+            else:
+                row = {name: _decode_value(value) for name, value in entry['row'].items()}
+                if 'rowid' in entry:
+                    row = {'rowid': entry['rowid'], **row}
+                columns = ', '.join(row)
+                marks = ', '.join('?' * len(row))
+                conn.execute(f'INSERT OR REPLACE INTO {table} ({columns}) VALUES ({marks})', list(row.values()))
+
+    return header['last_change_id']
+
+
+def restore_chain(db_path, full_backup_path, incremental_paths=(), migrate=None):
+    """استعادة نسخة كاملة ثم إعادة تطبيق النسخ التزايدية بالترتيب بشكل ذري
+
+    يتم بناء قاعدة البيانات المستعادة كاملة في ملف مؤقت، ثم نسخها إلى قاعدة
+    البيانات الحالية في خطوة واحدة.
+    migrate(path): ترحيل مخطط الملف المؤقت قبل التطبيق، لأن النسخ التزايدية
+    قد تحتوي أعمدة وجداول أحدث من النسخة الكاملة.
+    """
+    work_path = _temp_snapshot_path(os.path.dirname(os.path.abspath(db_path)))
+    try:
+        _decompress_to(full_backup_path, work_path)
+        validate_database(work_path)
+        last_change_id = _max_change_id(work_path)
+        if migrate is not None:
+            migrate(work_path)
+
+        conn = sqlite3.connect(work_path)
+        try:
+            with conn:
+                for path in incremental_paths:
+                    last_change_id = apply_incremental(conn, path, last_change_id)
+                # التغييرات الناتجة عن إعادة التطبيق ليست تغييرات جديدة في السجل، ويعود موضع
+                # السجل إلى نهاية السلسلة حتى تتبعها النسخة التزايدية التالية
+                conn.execute('DELETE FROM change_log WHERE id > ?', (last_change_id,))
+                conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'change_log'", (last_change_id,))
+        finally:
+            conn.close()
+
+        restore_database(db_path, work_path,
+                         filename=os.path.basename(incremental_paths[-1] if incremental_paths else full_backup_path))
+    finally:
+        _remove_quietly(work_path)
+
+
+def restore_database(db_path, backup_path, filename=None):
+    """استعادة قاعدة البيانات من ملف نسخة احتياطية بشكل ذري
+
+    يتم فك الضغط والتحقق في ملف مؤقت أولاً، ثم نسخ جميع الصفحات إلى قاعدة
+    البيانات الحالية في خطوة واحدة (pages=-1) تحت قفل كتابة واحد، فإما أن
+    تُستبدل البيانات بالكامل أو تبقى كما هي.
+    """
+    restore_path = _temp_snapshot_path(os.path.dirname(os.path.abspath(db_path)))
+    try:
+        _decompress_to(backup_path, restore_path)
+        validate_database(restore_path)
+        _record_restored_base(restore_path, filename or os.path.basename(backup_path))
+
+        source = sqlite3.connect(restore_path)
+        target = sqlite3.connect(db_path, timeout=30)
+        try:
+            source.backup(target, pages=-1)
+        finally:
+            target.close()
+            source.close()
+    finally:
+        _remove_quietly(restore_path)
+
+
+def _record_restored_base(path, filename):
+    """تسجيل النسخة المستعادة أساساً للنسخ التزايدية التالية
+
+    سجل النسخة الكاملة في backup_history يُكتب بعد أخذ اللقطة فلا يوجد داخل
+    ملفها، وبدونه يتعذر متابعة سلسلة النسخ التزايدية بعد الاستعادة.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            position = journal_position(conn.cursor())
+            conn.execute('''
+                INSERT INTO backup_history (backup_type, filename, last_change_id)
+                VALUES ('restore', ?, ?)
+            ''', (filename, position))
+            conn.execute('DELETE FROM change_log WHERE id <= ?', (position,))
+    finally:
+        conn.close()
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def main():
+    """أداة سطر الأوامر للنسخ الاحتياطي والاستعادة
+
+    أمثلة:
+        python backup_manager.py backup --db pos_database.db --dir backups
+        python backup_manager.py incremental --db pos_database.db --dir backups
+        python backup_manager.py restore --db pos_database.db backups/backup_X.db.gz backups/incremental_Y.jsonl.gz
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='النسخ الاحتياطي والاستعادة لقاعدة بيانات نقطة البيع')
+    parser.add_argument('command', choices=['backup', 'incremental', 'restore'])
+    parser.add_argument('files', nargs='*', help='للاستعادة: النسخة الكاملة ثم النسخ التزايدية بالترتيب')
+    parser.add_argument('--db', default='pos_database.db')
+    parser.add_argument('--dir', default='backups')
+    args = parser.parse_args()
+
+    if args.command == 'backup':
+        result = write_backup(args.db, args.dir)
+    elif args.command == 'incremental':
+        result = write_incremental_backup(args.db, args.dir)
+    else:
+        if not args.files:
+            parser.error('يجب تحديد ملف النسخة الكاملة')
+        restore_chain(args.db, args.files[0], args.files[1:])
+        result = {'restored': args.files}
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
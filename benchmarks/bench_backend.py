@@ -0,0 +1,222 @@
+"""قياس أداء سيناريوهات POSBackend الرئيسية على بيانات متجر تجريبية
+
+السيناريوهات:
+    sales      عمليات بيع متتالية عبر processSale (بيع/ثانية)
+    search     زمن searchProducts بكلمات بحث من أسماء المنتجات
+    dashboard  زمن getDashboardData
+    report     زمن generateFinancialReport لآخر سنة بدون ذاكرة التقارير (cold) ومنها (warm)، و getAllInvoices
+    export     تصدير المنتجات إلى Excel (صف/ثانية)
+    import     استيراد ملف التصدير على نسخة من قاعدة البيانات (صف/ثانية)
+
+النتائج تُكتب بصيغة JSON لمتابعة التراجع في الأداء بين الإصدارات.
+
+الاستخدام:
+    python benchmarks/bench_backend.py --products 5000 --years 1 --output results.json
+    python benchmarks/bench_backend.py --db store.db --scenarios sales,search
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pos_backend import POSBackend
+from synthetic_data import populate, load_catalog, make_sale, PRODUCT_NOUNS, BRANDS
+
+SCENARIOS = ('sales', 'search', 'dashboard', 'report', 'export', 'import')
+
+
+def summarize(latencies):
+    """ملخص أزمنة بالمللي ثانية"""
+    ordered = sorted(latencies)
+    count = len(ordered)
+
+    def percentile(q):
+        return round(ordered[min(count - 1, int(q * count))] * 1000, 3)
+
+    return {
+        'count': count,
+        'mean_ms': round(sum(ordered) / count * 1000, 3),
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def timed(func, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_sales(backend, rng, count):
+    catalog, customers = load_catalog(backend)
+    sales = [make_sale(rng, catalog, customers) for _ in range(count)]
+    latencies = []
+    failed = 0
+    start = time.perf_counter()
+    for sale in sales:
+        begin = time.perf_counter()
+        if not backend.processSale(sale)['success']:
+            failed += 1
+        latencies.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - start
+    return {'sales_per_second': round(count / elapsed, 1), 'failed': failed, **summarize(latencies)}
+
+
+def bench_search(backend, rng, count):
+    terms = [rng.choice(PRODUCT_NOUNS + BRANDS) for _ in range(count)]
+    # بحث بالباركود الجزئي كما تفعل قارئات الباركود
+    terms += [f'62{rng.randint(0, 99999):05d}' for _ in range(count // 4)]
+    latencies = []
+    for term in terms:
+        start = time.perf_counter()
+        backend.searchProducts(term)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def bench_dashboard(backend, rng, count):
+    return summarize(timed(backend.getDashboardData, count))
+
+
+def bench_report(backend, rng, count):
+    end = datetime.now().strftime('%Y-%m-%d')
+    start = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+    report = lambda: backend.generateFinancialReport(start, end)
+    # بعد أول استدعاء تُرجع ذاكرة التقارير النتيجة المخزنة، فيُقاس الحساب الفعلي والقراءة منها منفصلين
+    enabled = backend.reportCache.enabled
+    backend.reportCache.enabled = False
+    try:
+        cold = timed(report, count)
+    finally:
+        backend.reportCache.enabled = enabled
+    return {
+        'financial_report': summarize(cold),
+        'financial_report_cached': summarize(timed(report, count)) if enabled else None,
+        'all_invoices': summarize(timed(lambda: backend.getAllInvoices('sale'), max(1, count // 5))),
+    }
+
+
+def bench_export(backend, rng, count, workdir):
+    path = os.path.join(workdir, 'export.xlsx')
+    rows = len(backend.getAllProducts())
+    latencies = timed(lambda: backend.exportProductsToExcel(path), max(1, count // 10))
+    return {'rows': rows, 'rows_per_second': round(rows / min(latencies), 1), **summarize(latencies)}
+
+
+def bench_import(backend, rng, count, workdir):
+    # الاستيراد يعدل المنتجات، لذا يتم على نسخة من قاعدة البيانات
+    path = os.path.join(workdir, 'export.xlsx')
+    if not os.path.exists(path):
+        backend.exportProductsToExcel(path)
+    copy_path = os.path.join(workdir, 'import.db')
+    source = sqlite3.connect(backend.db_path)
+    target = sqlite3.connect(copy_path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+    copy = POSBackend(copy_path, backup_dir=os.path.join(workdir, 'backups'))
+    start = time.perf_counter()
+    result = copy.importProductsFromExcel(path)
+    elapsed = time.perf_counter() - start
+    rows = result.get('imported_count', 0) + result.get('updated_count', 0)
+    return {
+        'rows': rows,
+        'errors': len(result.get('errors', [])),
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed else None,
+    }
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='pos_bench_')
+    try:
+        if args.db:
+            db_path = os.path.join(workdir, 'store.db')
+            shutil.copyfile(args.db, db_path)
+            backend = POSBackend(db_path, backup_dir=os.path.join(workdir, 'backups'))
+            dataset = {'source': os.path.abspath(args.db)}
+        else:
+            backend = POSBackend(os.path.join(workdir, 'store.db'), backup_dir=os.path.join(workdir, 'backups'))
+            dataset = populate(backend, args.products, args.categories, args.customers,
+                               args.years, args.invoices_per_day, args.seed)
+
+        rng = random.Random(args.seed + 1)
+        results = {}
+        for name in args.scenarios:
+            start = time.perf_counter()
+            if name == 'sales':
+                results[name] = bench_sales(backend, rng, args.sales)
+            elif name == 'search':
+                results[name] = bench_search(backend, rng, args.repeat * 10)
+            elif name == 'dashboard':
+                results[name] = bench_dashboard(backend, rng, args.repeat)
+            elif name == 'report':
+                results[name] = bench_report(backend, rng, args.repeat)
+            elif name == 'export':
+                results[name] = bench_export(backend, rng, args.repeat, workdir)
+            elif name == 'import':
+                results[name] = bench_import(backend, rng, args.repeat, workdir)
+            results[name]['scenario_seconds'] = round(time.perf_counter() - start, 3)
+
+        return {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'environment': {
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+                'query_metrics': backend.metrics.enabled,
+            },
+            'config': {key: value for key, value in vars(args).items() if key != 'output'},
+            'dataset': dataset,
+            'results': results,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس أداء سيناريوهات الواجهة الخلفية')
+    parser.add_argument('--db', help='استخدام نسخة من قاعدة بيانات موجودة بدلاً من توليد بيانات')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--customers', type=int, default=300)
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--invoices-per-day', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sales', type=int, default=500, help='عدد عمليات البيع في سيناريو sales')
+    parser.add_argument('--repeat', type=int, default=20, help='عدد التكرارات لسيناريوهات القراءة')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        type=lambda value: [name for name in value.split(',') if name])
+    parser.add_argument('--output', help='كتابة النتائج إلى ملف JSON بدلاً من المخرج القياسي')
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"سيناريوهات غير معروفة: {', '.join(sorted(unknown))}")
+
+    report = run(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
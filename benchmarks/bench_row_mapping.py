@@ -0,0 +1,148 @@
+"""قياس أداء تحويل صفوف المنتجات إلى قواميس
+
+يقارن الطريقة القديمة (dict(zip(description)) لكل صف ثم تحويل الأسعار حقلاً حقلاً)
+مع sqlite3.Row ومع نماذج Product المعتمدة على __slots__ (دالة تحويل مترجمة لكل مخطط أعمدة).
+
+الاستخدام:
+    python benchmarks/bench_row_mapping.py --rows 20000 --repeat 5
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Product
+
+QUERY = '''
+    SELECT p.*, c.name as category_name
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+    WHERE p.is_active = 1
+    ORDER BY p.name
+'''
+
+
+def build_database(row_count):
+    """إنشاء قاعدة بيانات في الذاكرة بنفس مخطط جدول المنتجات"""
+    conn = sqlite3.connect(':memory:')
+    conn.executescript('''
+        CREATE TABLE categories (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            barcode TEXT UNIQUE,
+            category_id INTEGER,
+            purchase_price REAL DEFAULT 0,
+            sale_price REAL NOT NULL,
+            stock_quantity REAL DEFAULT 0,
+            min_stock REAL DEFAULT 0,
+            unit TEXT DEFAULT 'قطعة',
+            description TEXT,
+            image_url TEXT,
+            is_active INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+    conn.executemany('INSERT INTO categories (id, name) VALUES (?, ?)',
+                     [(i, f'فئة {i}') for i in range(1, 21)])
+    conn.executemany('''
+        INSERT INTO products (name, barcode, category_id, purchase_price, sale_price, stock_quantity, min_stock)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(f'منتج رقم {i}', f'BC{i:08d}', i % 20 + 1, i * 0.5, i * 0.75, i % 50, 5)
+          for i in range(row_count)])
+    conn.commit()
+    return conn
+
+
+def legacy_mapping(conn):
+    cursor = conn.cursor()
+    cursor.execute(QUERY)
+    results = cursor.fetchall()
+    products = []
+    for row in results:
+        product = dict(zip([column[0] for column in cursor.description], row))
+        product['sale_price'] = float(product['sale_price'])
+        product['purchase_price'] = float(product['purchase_price'])
+        product['stock_quantity'] = float(product['stock_quantity'])
+        product['min_stock'] = float(product['min_stock'])
+        products.append(product)
+    return products
+
+
+def sqlite_row_mapping(conn):
+    conn.row_factory = sqlite3.Row
+    try:
+        cursor = conn.cursor()
+        cursor.execute(QUERY)
+        products = []
+        for row in cursor.fetchall():
+            product = dict(row)
+            product['sale_price'] = float(product['sale_price'])
+            product['purchase_price'] = float(product['purchase_price'])
+            product['stock_quantity'] = float(product['stock_quantity'])
+            product['min_stock'] = float(product['min_stock'])
+            products.append(product)
+        return products
+    finally:
+        conn.row_factory = None
+
+
+def product_record_mapping(conn):
+    cursor = conn.cursor()
+    cursor.execute(QUERY)
+    return Product.fetchall(cursor)
+
+
+SCENARIOS = {
+    'legacy_dict_zip': legacy_mapping,
+    'sqlite3_row': sqlite_row_mapping,
+    'product_records': product_record_mapping,
+}
+
+
+def run(row_count, repeat):
+    conn = build_database(row_count)
+    expected = legacy_mapping(conn)
+    results = {}
+    for name, func in SCENARIOS.items():
+        if [row if isinstance(row, dict) else row.to_dict() for row in func(conn)] != expected:
+            raise AssertionError(f'{name} أعاد نتيجة مختلفة')
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(conn)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        results[name] = {
+            'best_seconds': best,
+            'rows_per_second': row_count / best if best else None,
+        }
+    conn.close()
+    return {'rows': row_count, 'repeat': repeat, 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس أداء تحويل الصفوف')
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='إخراج النتائج بصيغة JSON')
+    args = parser.parse_args()
+
+    report = run(args.rows, args.repeat)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    baseline = report['results']['legacy_dict_zip']['best_seconds']
+    for name, result in report['results'].items():
+        print(f"{name:<18} {result['best_seconds'] * 1000:8.2f} ms  "
+              f"{result['rows_per_second']:12.0f} rows/s  x{baseline / result['best_seconds']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
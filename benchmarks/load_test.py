@@ -0,0 +1,319 @@
+"""اختبار تحميل متزامن لواجهة Flask عبر HTTP
+
+يشغل نسخة من app.py في عملية منفصلة على قاعدة بيانات مؤقتة معبأة ببيانات
+تجريبية (أو يستهدف خادماً قائماً عبر --url)، ثم يحاكي عدداً من نقاط البيع
+المتزامنة، كل منها ترسل مزيجاً من الطلبات مع زمن تفكير عشوائي بين الطلبات:
+    search     GET  /api/products/search
+    sale       POST /api/sales/process
+    dashboard  GET  /api/dashboard
+    report     GET  /api/financial/report
+
+التقرير (JSON): الإنتاجية، زمن الاستجابة (p50/p95/p99) لكل نوع طلب، ونسبة
+الأخطاء وأخطاء قفل قاعدة البيانات (database is locked).
+
+الاستخدام:
+    python benchmarks/load_test.py --concurrency 20 --duration 30 --think-time 0.5
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --mix search=70,sale=30
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import make_sale, PRODUCT_NOUNS, BRANDS
+from bench_backend import summarize
+
+DEFAULT_MIX = 'search=50,sale=25,dashboard=15,report=10'
+LOCK_ERROR = 'database is locked'
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {'search', 'sale', 'dashboard', 'report'}
+    if unknown:
+        raise argparse.ArgumentTypeError(f"أنواع طلبات غير معروفة: {', '.join(sorted(unknown))}")
+    return mix
+
+
+# =========================================================================
+# الخادم التجريبي
+# =========================================================================
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(db_path, port):
+    """تشغيل app.py بخادم werkzeug متعدد الخيوط (تُستدعى داخل العملية الفرعية)"""
+    os.environ['POS_DB_PATH'] = db_path
+    from werkzeug.serving import make_server
+    from app import app
+
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def start_server(workdir, args):
+    """تعبئة قاعدة بيانات مؤقتة وتشغيل الخادم في عملية منفصلة"""
+    from pos_backend import POSBackend
+    from synthetic_data import populate
+
+    db_path = os.path.join(workdir, 'store.db')
+    dataset = populate(POSBackend(db_path, backup_dir=os.path.join(workdir, 'backups')),
+                       args.products, customers=args.customers, years=args.years,
+                       invoices_per_day=args.invoices_per_day, seed=args.seed)
+
+    port = free_port()
+    # العملية الفرعية تعمل داخل المجلد المؤقت حتى لا تنشئ ملفات في المستودع
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', db_path, '--port', str(port)],
+        cwd=workdir, env={**os.environ, 'PYTHONPATH': ROOT},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('تعذر تشغيل الخادم التجريبي')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process, url, dataset
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('انتهت مهلة انتظار الخادم التجريبي')
+
+
+# =========================================================================
+# نقاط البيع الوهمية
+# =========================================================================
+
+class Till(threading.Thread):
+    """نقطة بيع واحدة ترسل طلبات متتالية عبر اتصال HTTP دائم"""
+
+    def __init__(self, index, url, catalog, customers, args, stop_at, results):
+        super().__init__(name=f'till-{index}', daemon=True)
+        self.rng = random.Random(args.seed + index)
+        self.target = urlsplit(url)
+        self.catalog = catalog
+        self.customers = customers
+        self.args = args
+        self.stop_at = stop_at
+        self.results = results
+        self.kinds = list(args.mix)
+        self.weights = [args.mix[kind] for kind in self.kinds]
+        self.connection = None
+
+    def run(self):
+        while time.time() < self.stop_at:
+            kind = self.rng.choices(self.kinds, self.weights)[0]
+            method, path, body = self.build(kind)
+            start = time.perf_counter()
+            status, payload = self.send(method, path, body)
+            elapsed = time.perf_counter() - start
+            self.results.append((kind, elapsed, status, payload))
+            if self.args.think_time:
+                time.sleep(self.rng.expovariate(1 / self.args.think_time))
+
+    def build(self, kind):
+        if kind == 'search':
+            return 'GET', '/api/products/search?' + urlencode({'q': self.rng.choice(PRODUCT_NOUNS + BRANDS)}), None
+        if kind == 'sale':
+            return 'POST', '/api/sales/process', make_sale(self.rng, self.catalog, self.customers)
+        if kind == 'dashboard':
+            return 'GET', '/api/dashboard', None
+        end = datetime.now()
+        start = end - timedelta(days=self.rng.choice((1, 7, 30, 365)))
+        return 'GET', '/api/financial/report?' + urlencode({
+            'start_date': start.strftime('%Y-%m-%d'), 'end_date': end.strftime('%Y-%m-%d')}), None
+
+    def send(self, method, path, body):
+        headers = {}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            try:
+                if self.connection is None:
+                    self.connection = http.client.HTTPConnection(self.target.hostname, self.target.port, timeout=60)
+                self.connection.request(method, path, body=data, headers=headers)
+                response = self.connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError) as e:
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    return 0, str(e).encode('utf-8')
+        return 0, b''
+
+
+def fetch_catalog(url):
+    target = urlsplit(url)
+    connection = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+    try:
+        connection.request('GET', '/api/products')
+        products = json.loads(connection.getresponse().read())['data']
+        connection.request('GET', '/api/customers')
+        customers = json.loads(connection.getresponse().read()).get('data') or []
+    finally:
+        connection.close()
+    catalog = [(product['id'], product['name'], product['sale_price']) for product in products]
+    return catalog, [customer['id'] for customer in customers]
+
+
+def classify(status, payload):
+    """(خطأ؟، خطأ قفل؟) من رمز الحالة ونص الاستجابة"""
+    if status == 200:
+        try:
+            if json.loads(payload).get('success', True):
+                return False, False
+        except ValueError:
+            return False, False
+    return True, LOCK_ERROR in payload.decode('utf-8', 'replace')
+
+
+def error_message(payload):
+    try:
+        return str(json.loads(payload).get('error'))[:200]
+    except (ValueError, AttributeError):
+        return payload.decode('utf-8', 'replace')[:200]
+
+
+def report(results, elapsed):
+    by_kind = {}
+    for kind, latency, status, payload in results:
+        stats = by_kind.setdefault(kind, {'latencies': [], 'errors': 0, 'lock_errors': 0,
+                                          'statuses': {}, 'error_samples': []})
+        error, lock_error = classify(status, payload)
+        stats['latencies'].append(latency)
+        stats['errors'] += error
+        stats['lock_errors'] += lock_error
+        stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+        if error and len(stats['error_samples']) < 3:
+            message = error_message(payload)
+            if message not in stats['error_samples']:
+                stats['error_samples'].append(message)
+
+    total = len(results)
+    errors = sum(stats['errors'] for stats in by_kind.values())
+    lock_errors = sum(stats['lock_errors'] for stats in by_kind.values())
+    return {
+        'requests': total,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 1) if elapsed else None,
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'lock_error_rate': round(lock_errors / total, 4) if total else 0.0,
+        'latency': summarize([latency for _, latency, _, _ in results]) if total else None,
+        'endpoints': {
+            kind: {
+                'requests': len(stats['latencies']),
+                'throughput_rps': round(len(stats['latencies']) / elapsed, 1) if elapsed else None,
+                'errors': stats['errors'],
+                'lock_errors': stats['lock_errors'],
+                'lock_error_rate': round(stats['lock_errors'] / len(stats['latencies']), 4),
+                'statuses': stats['statuses'],
+                'error_samples': stats['error_samples'],
+                **summarize(stats['latencies']),
+            }
+            for kind, stats in sorted(by_kind.items())
+        },
+    }
+
+
+def run(args):
+    workdir = None
+    process = None
+    dataset = None
+    url = args.url
+    try:
+        if url is None:
+            workdir = tempfile.mkdtemp(prefix='pos_load_')
+            process, url, dataset = start_server(workdir, args)
+
+        catalog, customers = fetch_catalog(url)
+        if not catalog:
+            raise RuntimeError('لا توجد منتجات في الخادم المستهدف')
+
+        results = []
+        start = time.time()
+        stop_at = start + args.duration
+        tills = [Till(index, url, catalog, customers, args, stop_at, results)
+                 for index in range(args.concurrency)]
+        for till in tills:
+            till.start()
+        for till in tills:
+            till.join()
+        elapsed = time.time() - start
+
+        return {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'target': url if args.url else 'temporary instance',
+            'config': {
+                'concurrency': args.concurrency,
+                'duration': args.duration,
+                'think_time': args.think_time,
+                'mix': args.mix,
+            },
+            'dataset': dataset,
+            'results': report(results, elapsed),
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='اختبار تحميل متزامن لواجهة API')
+    parser.add_argument('--url', help='استهداف خادم قائم بدلاً من تشغيل نسخة مؤقتة')
+    parser.add_argument('--concurrency', type=int, default=20, help='عدد نقاط البيع المتزامنة')
+    parser.add_argument('--duration', type=float, default=30, help='مدة الاختبار بالثواني')
+    parser.add_argument('--think-time', type=float, default=0.5,
+                        help='متوسط زمن التفكير بين الطلبات بالثواني (توزيع أسي، 0 للتعطيل)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'أوزان أنواع الطلبات (الافتراضي: {DEFAULT_MIX})')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--customers', type=int, default=300)
+    parser.add_argument('--years', type=float, default=0.5)
+    parser.add_argument('--invoices-per-day', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='كتابة النتائج إلى ملف JSON')
+    parser.add_argument('--serve', metavar='DB', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    text = json.dumps(run(args), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""توليد بيانات متجر تجريبية قابلة للتكرار لقياس الأداء
+
+ينشئ فئات ومنتجات وعملاء بأسماء عربية، وسجل مبيعات لعدد من السنوات بأحجام
+سلال واقعية (معظم الفواتير صغيرة مع ذيل من السلال الكبيرة). المنتجات والعملاء
+تُدرج دفعة واحدة، أما الفواتير فتمر عبر processSalesBatch حتى تتحدث الأرصدة
+والمخزون وسجل الصندوق كما في التشغيل الفعلي.
+
+الاستخدام:
+    python benchmarks/synthetic_data.py --db store.db --products 5000 --years 2
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pos_backend import POSBackend
+
+CATEGORY_NAMES = [
+    'ألبان وأجبان', 'مخبوزات', 'مشروبات', 'معلبات', 'حلويات', 'خضروات', 'فواكه', 'لحوم',
+    'دواجن', 'أسماك', 'بهارات', 'منظفات', 'عناية شخصية', 'أدوات منزلية', 'قرطاسية',
+    'ألعاب', 'إلكترونيات', 'أدوية', 'مجمدات', 'حبوب وبقوليات', 'زيوت', 'أغذية أطفال',
+]
+
+PRODUCT_NOUNS = [
+    'حليب', 'جبنة', 'لبن', 'خبز', 'كعك', 'عصير', 'ماء', 'شاي', 'قهوة', 'أرز', 'سكر', 'طحين',
+    'زيت', 'تمر', 'عسل', 'مربى', 'بسكويت', 'شوكولاتة', 'صابون', 'شامبو', 'معجون أسنان', 'مناديل',
+    'دفتر', 'قلم', 'بطارية', 'مصباح', 'كوب', 'صحن', 'عدس', 'فول', 'حمص', 'تونة', 'سردين', 'دجاج',
+]
+
+PRODUCT_ADJECTIVES = [
+    'طازج', 'كامل الدسم', 'قليل الدسم', 'عضوي', 'بالفراولة', 'بالشوكولاتة', 'بالمانجو',
+    'سادة', 'فاخر', 'اقتصادي', 'بالليمون', 'بالنعناع', 'مجمد', 'معطر', 'للأطفال', 'عائلي',
+]
+
+BRANDS = ['المراعي', 'الصافي', 'نادك', 'السعودية', 'الربيع', 'الوطنية', 'الخليج', 'الأصيل', 'النخبة', 'الريف']
+
+SIZES = ['250 مل', '500 مل', '1 لتر', '2 لتر', '100 غرام', '250 غرام', '500 غرام', '1 كغ', '5 كغ', 'حبة', 'عبوة 6', 'عبوة 12']
+
+UNITS = ['قطعة', 'علبة', 'كرتون', 'كيلو', 'لتر']
+
+FIRST_NAMES = [
+    'محمد', 'أحمد', 'عبدالله', 'خالد', 'سعد', 'فهد', 'عمر', 'علي', 'يوسف', 'إبراهيم', 'ناصر',
+    'فاطمة', 'عائشة', 'مريم', 'نورة', 'سارة', 'هند', 'ريم', 'لطيفة', 'منى', 'أمل',
+]
+
+FAMILY_NAMES = [
+    'العتيبي', 'القحطاني', 'الشمري', 'الدوسري', 'الحربي', 'الزهراني', 'الغامدي', 'المطيري',
+    'السبيعي', 'العنزي', 'الشهري', 'التميمي', 'البلوي', 'الرشيدي', 'الجهني',
+]
+
+# توزيع عدد بنود السلة: معظم الفواتير صغيرة مع ذيل من السلال الكبيرة
+BASKET_SIZES = (1, 2, 3, 4, 5, 6, 8, 10, 15, 25)
+BASKET_WEIGHTS = (22, 20, 16, 12, 9, 7, 6, 4, 3, 1)
+
+
+def product_name(rng, index):
+    return (f'{rng.choice(PRODUCT_NOUNS)} {rng.choice(PRODUCT_ADJECTIVES)} '
+            f'{rng.choice(BRANDS)} {rng.choice(SIZES)} #{index}')
+
+
+def customer_name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(FAMILY_NAMES)}'
+
+
+def basket_size(rng):
+    return rng.choices(BASKET_SIZES, BASKET_WEIGHTS)[0]
+
+
+def make_sale(rng, products, customers, created_at=None, credit_ratio=0.2):
+    """بيانات بيع عشوائية بنفس صيغة /api/sales/process"""
+    items = []
+    for product_id, name, price in rng.sample(products, min(basket_size(rng), len(products))):
+        quantity = rng.choice((1, 1, 1, 2, 2, 3, 5))
+        items.append({
+            'product_id': product_id,
+            'product_name': name,
+            'quantity': quantity,
+            'unit_price': price,
+            'total_price': round(quantity * price, 2)
+        })
+
+    sale = {
+        'total_amount': round(sum(item['total_price'] for item in items), 2),
+        'items': items,
+        'payment_type': 'cash',
+    }
+    if customers and rng.random() < credit_ratio:
+        sale['payment_type'] = 'credit'
+        sale['customer_id'] = rng.choice(customers)
+    if created_at is not None:
+        sale['created_at'] = created_at.strftime('%Y-%m-%d %H:%M:%S')
+    return sale
+
+
+def populate(backend, products=2000, categories=20, customers=300, years=1, invoices_per_day=40,
+             seed=42, batch_size=500):
+    """تعبئة قاعدة بيانات POSBackend ببيانات تجريبية وإرجاع ملخص بما تم إنشاؤه"""
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    conn = backend._connect()
+    cursor = conn.cursor()
+    try:
+        names = (CATEGORY_NAMES * (categories // len(CATEGORY_NAMES) + 1))[:categories]
+        cursor.executemany('INSERT OR IGNORE INTO categories (name) VALUES (?)',
+                           [(name if index < len(CATEGORY_NAMES) else f'{name} {index}',)
+                            for index, name in enumerate(names)])
+        cursor.execute('SELECT id FROM categories')
+        category_ids = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM products')
+        first_id = cursor.fetchone()[0] + 1
+        rows = []
+        for index in range(first_id, first_id + products):
+            purchase_price = round(rng.uniform(1, 200), 2)
+            rows.append((
+                product_name(rng, index),
+                f'62{index:011d}',
+                rng.choice(category_ids),
+                purchase_price,
+                round(purchase_price * rng.uniform(1.1, 1.6), 2),
+                float(rng.randint(0, 500) + years * invoices_per_day * 2),
+                float(rng.choice((0, 5, 10, 20))),
+                rng.choice(UNITS),
+            ))
+        cursor.executemany('''
+            INSERT INTO products (name, barcode, category_id, purchase_price, sale_price,
+                                  stock_quantity, min_stock, unit)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+        cursor.executemany('INSERT INTO customers (name, phone) VALUES (?, ?)',
+                           [(customer_name(rng), f'05{rng.randint(0, 99999999):08d}') for _ in range(customers)])
+
+        cursor.execute('SELECT id FROM products')
+        backend._refreshStockAlerts(cursor, [row[0] for row in cursor.fetchall()])
+        conn.commit()
+
+        cursor.execute('SELECT id, name, sale_price FROM products WHERE is_active = 1')
+        catalog = cursor.fetchall()
+        cursor.execute('SELECT id FROM customers')
+        customer_ids = [row[0] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    backend.invalidateProductCaches()
+
+    # سجل المبيعات موزع على ساعات العمل لكل يوم
+    sales = []
+    invoices = 0
+    day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=int(years * 365))
+    end = datetime.now()
+    while day < end:
+        for _ in range(max(0, int(rng.gauss(invoices_per_day, invoices_per_day * 0.25)))):
+            moment = day + timedelta(hours=rng.uniform(8, 23))
+            sales.append(make_sale(rng, catalog, customer_ids, moment))
+            if len(sales) >= batch_size:
+                invoices += backend.processSalesBatch(sales)['processed']
+                sales = []
+        day += timedelta(days=1)
+    if sales:
+        invoices += backend.processSalesBatch(sales)['processed']
+
+    return {
+        'seed': seed,
+        'categories': len(category_ids),
+        'products': products,
+        'customers': customers,
+        'years': years,
+        'invoices': invoices,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def load_catalog(backend):
+    """المنتجات والعملاء الحاليون لتوليد مبيعات جديدة أثناء القياس"""
+    conn = backend._connect()
+    try:
+        catalog = conn.execute('SELECT id, name, sale_price FROM products WHERE is_active = 1').fetchall()
+        customers = [row[0] for row in conn.execute('SELECT id FROM customers').fetchall()]
+    finally:
+        conn.close()
+    return catalog, customers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='توليد بيانات متجر تجريبية')
+    parser.add_argument('--db', required=True, help='مسار قاعدة البيانات (تُنشأ إذا لم تكن موجودة)')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--customers', type=int, default=300)
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--invoices-per-day', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    backend = POSBackend(args.db)
+    summary = populate(backend, args.products, args.categories, args.customers,
+                       args.years, args.invoices_per_day, args.seed)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""ناقل أحداث داخل العملية لإرسال التحديثات الفورية للعملاء (Server-Sent Events)
+
+يتم نشر الأحداث بعد تأكيد المعاملات (commit) فقط، وكل مشترك يملك طابوراً
+محدود الحجم حتى لا يؤدي عميل بطيء إلى تعطيل عمليات البيع.
+"""
+import itertools
+import json
+import queue
+import threading
+import time
+
+
+class Subscription:
+    """اشتراك في موضوع أو أكثر من الأحداث"""
+
+    def __init__(self, bus, topics=None, max_queue=1000):
+        self.bus = bus
+        self.topics = set(topics) if topics else None
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def accepts(self, topic):
+        return self.topics is None or topic in self.topics
+
+    def get(self, timeout=None):
+        """انتظار الحدث التالي، أو None عند انتهاء المهلة"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventBus:
+    """ناقل نشر/اشتراك بسيط وآمن مع الخيوط"""
+
+    def __init__(self, max_queue=1000):
+        self.max_queue = max_queue
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, topics=None):
+        subscription = Subscription(self, topics, self.max_queue)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def publish(self, topic, data):
+        """نشر حدث لجميع المشتركين في الموضوع"""
+        with self._lock:
+            subscribers = [s for s in self._subscribers if s.accepts(topic)]
+        if not subscribers:
+            return None
+
+        event = {'id': next(self._ids), 'topic': topic, 'data': data, 'time': time.time()}
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # المشترك البطيء يفقد الحدث بدلاً من إيقاف الناشر
+                subscription.dropped += 1
+        return event
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+def format_sse(event):
+    """ترميز حدث بصيغة text/event-stream"""
+    data = json.dumps(event['data'], ensure_ascii=False, default=str)
+    return f"id: {event['id']}\nevent: {event['topic']}\ndata: {data}\n\n"
+
+
+def sse_stream(subscription, heartbeat=15.0):
+    """مولد نصوص SSE للاشتراك مع نبضات دورية للحفاظ على الاتصال"""
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            event = subscription.get(timeout=heartbeat)
+            if event is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield format_sse(event)
+    finally:
+        subscription.close()
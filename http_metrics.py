@@ -0,0 +1,193 @@
+"""مؤشرات أداء مسارات Flask بصيغة Prometheus النصية
+
+لكل مسار (قالب المسار مثل /api/products/<int:product_id> وليس الرابط الفعلي)
+وطريقة: مدرج تكراري لزمن الاستجابة، حجم الاستجابات بالبايت، عدد الطلبات حسب
+رمز الحالة، عدد الأخطاء (5xx أو استثناء غير معالج)، والطلبات الجارية حالياً.
+"""
+import threading
+import time
+
+from flask import g, request
+
+from query_metrics import Histogram
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class RouteMetrics:
+    """تجميع مؤشرات الطلبات لكل مسار"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._routes = {}
+            self._in_flight = {}
+
+    def _route(self, key):
+        stats = self._routes.get(key)
+        if stats is None:
+            stats = self._routes[key] = {
+                'latency': Histogram(),
+                'bytes': 0,
+                'statuses': {},
+                'errors': 0,
+            }
+        return stats
+
+    def started(self, key):
+        with self._lock:
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+
+    def finished(self, key):
+        with self._lock:
+            self._in_flight[key] -= 1
+
+    def record(self, key, elapsed, status, size, error=False):
+        with self._lock:
+            stats = self._route(key)
+            stats['latency'].observe(elapsed)
+            stats['bytes'] += size
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+            if error or status >= 500:
+                stats['errors'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                f'{method} {route}': {
+                    'latency': stats['latency'].to_dict(),
+                    'bytes': stats['bytes'],
+                    'statuses': dict(stats['statuses']),
+                    'errors': stats['errors'],
+                    'in_flight': self._in_flight.get((route, method), 0),
+                }
+                for (route, method), stats in self._routes.items()
+            }
+
+    def render_prometheus(self, query_metrics=None, report_cache=None):
+        """إخراج المؤشرات بصيغة Prometheus النصية (الإصدار 0.0.4)"""
+        lines = []
+        with self._lock:
+            routes = sorted(self._routes.items())
+            in_flight = sorted(self._in_flight.items())
+
+            lines.append('# HELP pos_http_request_duration_seconds زمن معالجة الطلب')
+            lines.append('# TYPE pos_http_request_duration_seconds histogram')
+            for (route, method), stats in routes:
+                _histogram_lines(lines, 'pos_http_request_duration_seconds',
+                                 {'route': route, 'method': method}, stats['latency'])
+
+            lines.append('# HELP pos_http_response_bytes_total إجمالي حجم الاستجابات')
+            lines.append('# TYPE pos_http_response_bytes_total counter')
+            for (route, method), stats in routes:
+                lines.append(_sample('pos_http_response_bytes_total',
+                                     {'route': route, 'method': method}, stats['bytes']))
+
+            lines.append('# HELP pos_http_requests_total عدد الطلبات حسب رمز الحالة')
+            lines.append('# TYPE pos_http_requests_total counter')
+            for (route, method), stats in routes:
+                for status, count in sorted(stats['statuses'].items()):
+                    lines.append(_sample('pos_http_requests_total',
+                                         {'route': route, 'method': method, 'status': status}, count))
+
+            lines.append('# HELP pos_http_errors_total الطلبات المنتهية بخطأ خادم أو استثناء')
+            lines.append('# TYPE pos_http_errors_total counter')
+            for (route, method), stats in routes:
+                lines.append(_sample('pos_http_errors_total',
+                                     {'route': route, 'method': method}, stats['errors']))
+
+            lines.append('# HELP pos_http_requests_in_flight الطلبات الجارية حالياً')
+            lines.append('# TYPE pos_http_requests_in_flight gauge')
+            for (route, method), count in in_flight:
+                lines.append(_sample('pos_http_requests_in_flight',
+                                     {'route': route, 'method': method}, count))
+
+        if query_metrics is not None and query_metrics.enabled:
+            snapshot = query_metrics.histograms()
+            lines.append('# HELP pos_db_method_duration_seconds زمن استدعاء دوال الواجهة الخلفية')
+            lines.append('# TYPE pos_db_method_duration_seconds histogram')
+            for method, histograms in snapshot:
+                _histogram_lines(lines, 'pos_db_method_duration_seconds', {'method': method}, histograms['calls'])
+            lines.append('# HELP pos_db_query_duration_seconds زمن الاستعلامات لكل دالة')
+            lines.append('# TYPE pos_db_query_duration_seconds histogram')
+            for method, histograms in snapshot:
+                _histogram_lines(lines, 'pos_db_query_duration_seconds', {'method': method}, histograms['queries'])
+
+        if report_cache is not None and report_cache.enabled:
+            snapshot = report_cache.snapshot()
+            lines.append('# HELP pos_report_cache_requests_total طلبات التقارير المخزنة حسب النتيجة')
+            lines.append('# TYPE pos_report_cache_requests_total counter')
+            for report, stats in snapshot['reports'].items():
+                for result in ('hits', 'misses', 'invalidations', 'evictions'):
+                    lines.append(_sample('pos_report_cache_requests_total',
+                                         {'report': report, 'result': result}, stats[result]))
+            lines.append('# HELP pos_report_cache_entries عدد النتائج المخزنة حالياً')
+            lines.append('# TYPE pos_report_cache_entries gauge')
+            lines.append(f"pos_report_cache_entries {snapshot['entries']}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sample(name, labels, value):
+    label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+    return f'{name}{{{label_text}}} {value}'
+
+
+def _histogram_lines(lines, name, labels, histogram):
+    for bound, count in histogram.cumulative():
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(_sample(f'{name}_bucket', {**labels, 'le': le}, count))
+    lines.append(_sample(f'{name}_sum', labels, histogram.sum))
+    lines.append(_sample(f'{name}_count', labels, histogram.count))
+
+
+def _route_key():
+    rule = request.url_rule
+    return (rule.rule if rule is not None else '<unmatched>', request.method)
+
+
+def init_route_metrics(app, metrics=None):
+    """تسجيل مؤشرات كل طلب
+
+    يجب استدعاؤها قبل init_compression: دوال after_request تُنفذ بترتيب عكسي،
+    فيُقاس حجم الاستجابة بعد ضغطها.
+    """
+    metrics = metrics or RouteMetrics()
+    app.extensions['route_metrics'] = metrics
+
+    @app.before_request
+    def start_request_metrics():
+        key = _route_key()
+        g._route_metrics = [key, time.perf_counter(), False]
+        metrics.started(key)
+
+    @app.after_request
+    def record_request_metrics(response):
+        state = g.get('_route_metrics')
+        if state is not None:
+            key, start, _ = state
+            state[2] = True
+            # الاستجابات المتدفقة (SSE والتنزيلات) لا يُعرف حجمها مسبقاً
+            size = 0 if response.is_streamed else (response.calculate_content_length() or 0)
+            metrics.record(key, time.perf_counter() - start, response.status_code, size)
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        state = g.pop('_route_metrics', None)
+        if state is None:
+            return
+        key, start, recorded = state
+        if not recorded:
+            # استثناء غير معالج لم يصل إلى after_request
+            metrics.record(key, time.perf_counter() - start, 500, 0, error=True)
+        metrics.finished(key)
+
+    return metrics
@@ -0,0 +1,120 @@
+"""تقييم المخزون بالتكلفة المتوسطة المرجحة
+
+لكل منتج تكلفة متوسطة (products.avg_cost) تُعاد موازنتها مع كل كمية مشتراة أو
+مضافة بتكلفة معروفة:
+
+    avg_cost = (المخزون الموجب × avg_cost + الكمية × التكلفة) / (المخزون الموجب + الكمية)
+
+والبيع والتسوية بالنقص يخرجان بالتكلفة المتوسطة الحالية فلا يغيرانها.
+
+القيمة الإجمالية محفوظة كمجاميع جارية لكل فئة في inventory_valuation، وتحدّثها
+مشغلات (triggers) على products: كل تغيير في المخزون أو التكلفة أو الفئة أو
+الحالة يطرح مساهمة الصف القديمة ويضيف الجديدة داخل نفس المعاملة، أياً كان
+مصدره (بيع، شراء، تسوية، تعديل المنتج، استيراد). المنتجات غير النشطة والمخزون
+السالب لا يدخلان في القيمة. المجاميع تُعاد من الصفر عند كل تشغيل لإزالة أي
+تراكم لأخطاء التقريب.
+"""
+
+# الفئة 0 للمنتجات بدون فئة (المفتاح الأساسي لا يقبل NULL كقيمة مميزة)
+NO_CATEGORY = 0
+
+_QUANTITY_SQL = 'CASE WHEN {row}.is_active = 1 AND {row}.stock_quantity > 0 THEN {row}.stock_quantity ELSE 0 END'
+_VALUE_SQL = f'({_QUANTITY_SQL}) * COALESCE({{row}}.avg_cost, 0)'
+
+
+def _add(row, sign):
+    """عبارة تضيف (أو تطرح) مساهمة صف المنتج إلى مجموع فئته"""
+    quantity = _QUANTITY_SQL.format(row=row)
+    value = _VALUE_SQL.format(row=row)
+    return f'''
+        INSERT INTO inventory_valuation (category_key, quantity, value, products)
+        VALUES (COALESCE({row}.category_id, {NO_CATEGORY}), {sign}({quantity}), {sign}({value}),
+                {sign}({row}.is_active = 1))
+        ON CONFLICT(category_key) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            value = value + excluded.value,
+            products = products + excluded.products;
+    '''
+
+
+def install(cursor):
+    """جدول المجاميع الجارية ومشغلات تحديثها ثم إعادة حسابها من المنتجات"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inventory_valuation (
+            category_key INTEGER PRIMARY KEY,
+            quantity REAL NOT NULL DEFAULT 0,
+            value REAL NOT NULL DEFAULT 0,
+            products INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_products_valuation_insert
+        AFTER INSERT ON products
+        BEGIN {_add('NEW', '+')} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_products_valuation_delete
+        AFTER DELETE ON products
+        BEGIN {_add('OLD', '-')} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_products_valuation_update
+        AFTER UPDATE OF stock_quantity, avg_cost, category_id, is_active ON products
+        BEGIN {_add('OLD', '-')} {_add('NEW', '+')} END
+    ''')
+    rebuild(cursor)
+
+
+def rebuild(cursor):
+    cursor.execute('DELETE FROM inventory_valuation')
+    cursor.execute(f'''
+        INSERT INTO inventory_valuation (category_key, quantity, value, products)
+        SELECT COALESCE(category_id, {NO_CATEGORY}), SUM({_QUANTITY_SQL.format(row='products')}),
+               SUM({_VALUE_SQL.format(row='products')}), SUM(is_active = 1)
+        FROM products
+        GROUP BY 1
+    ''')
+
+
+def total_value(cursor):
+    cursor.execute('SELECT COALESCE(SUM(value), 0) FROM inventory_valuation')
+    return float(cursor.fetchone()[0])
+
+
+def by_category(cursor):
+    """القيمة لكل فئة من جدول المجاميع (دون قراءة المنتجات)"""
+    cursor.execute(f'''
+        SELECT v.category_key, c.name, v.products, v.quantity, v.value
+        FROM inventory_valuation v
+        LEFT JOIN categories c ON c.id = v.category_key
+        WHERE v.products != 0 OR ABS(v.value) > 1e-9
+        ORDER BY v.value DESC
+    ''')
+    categories = [{
+        'category_id': key if key != NO_CATEGORY else None,
+        'category_name': name,
+        'products': products,
+        'quantity': float(quantity),
+        'value': round(float(value), 2),
+    } for key, name, products, quantity, value in cursor.fetchall()]
+    return {
+        'method': 'weighted_average_cost',
+        'total_value': round(sum(category['value'] for category in categories), 2),
+        'total_quantity': sum(category['quantity'] for category in categories),
+        'categories': categories,
+    }
+
+
+# إعادة موازنة التكلفة المتوسطة عند إضافة كمية بتكلفة معروفة (جميع القيم من الصف قبل التحديث)
+RECEIVE_STOCK_SQL = '''
+    UPDATE products SET
+        avg_cost = CASE
+            WHEN MAX(stock_quantity, 0) + :quantity > 0
+            THEN (MAX(stock_quantity, 0) * COALESCE(avg_cost, 0) + :quantity * :unit_cost)
+                 / (MAX(stock_quantity, 0) + :quantity)
+            ELSE :unit_cost
+        END,
+        stock_quantity = stock_quantity + :quantity,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = :product_id
+'''
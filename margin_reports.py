@@ -0,0 +1,104 @@
+"""تقارير هامش الربح الإجمالي
+
+تكلفة الوحدة تُسجل على كل بند بيع لحظة البيع (invoice_items.unit_cost)، فلا
+يتغير هامش الفواتير السابقة عند تعديل سعر الشراء لاحقاً. إلى جانب ذلك يُحدَّث
+الجدول daily_margin داخل معاملة البيع: سطر لكل (يوم، منتج) بالكمية والإيراد
+والتكلفة وفئة المنتج وقت البيع، فتصبح تقارير الهامش حسب المنتج أو الفئة أو
+اليوم تجميعاً على فهرس صغير بدلاً من مسح بنود الفواتير.
+
+الملخص اليومي يبقى في القاعدة الرئيسية عند أرشفة الفواتير (مثل archive_daily_summary).
+"""
+
+GROUPINGS = {
+    'product': ('m.product_id', 'm.product_id AS product_id, p.name AS name, c.name AS category'),
+    'category': ('m.category_id', 'm.category_id AS category_id, c.name AS category'),
+    'day': ('m.day', 'm.day AS day'),
+}
+
+
+def install_margin_rollup(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_margin (
+            day TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            category_id INTEGER,
+            quantity REAL NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            cost REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, product_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_margin_product ON daily_margin (product_id, day)')
+
+
+_ROLLUP_SQL = '''
+    INSERT INTO daily_margin (day, product_id, category_id, quantity, revenue, cost)
+    SELECT DATE(i.created_at), ii.product_id, p.category_id,
+           SUM(ii.quantity), SUM(ii.total_price), SUM(ii.quantity * COALESCE(ii.unit_cost, 0))
+    FROM invoice_items ii
+    JOIN invoices i ON i.id = ii.invoice_id
+    LEFT JOIN products p ON p.id = ii.product_id
+    WHERE {condition} AND i.type = 'sale' AND ii.product_id IS NOT NULL
+    GROUP BY DATE(i.created_at), ii.product_id
+    ON CONFLICT(day, product_id) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        revenue = revenue + excluded.revenue,
+        cost = cost + excluded.cost
+'''
+
+
+def record_invoice(cursor, invoice_id):
+    """إضافة بنود فاتورة بيع إلى الملخص اليومي (ضمن معاملة البيع)"""
+    cursor.execute(_ROLLUP_SQL.format(condition='ii.invoice_id = ?'), (invoice_id,))
+
+
+def rebuild(cursor, start_day=None):
+    """إعادة بناء الملخص اليومي من بنود البيع في القاعدة الرئيسية
+
+    start_day: إعادة بناء الأيام من هذا اليوم فقط (الأيام المؤرشفة لا بنود لها هنا).
+    """
+    start_day = start_day or '0000-00-00'
+    cursor.execute('DELETE FROM daily_margin WHERE day >= ?', (start_day,))
+    cursor.execute(_ROLLUP_SQL.format(condition='i.created_at >= ?'), (start_day,))
+
+
+def _margin_fields(row):
+    revenue, cost = float(row.pop('revenue')), float(row.pop('cost'))
+    row.update({
+        'revenue': revenue,
+        'cost': cost,
+        'margin': revenue - cost,
+        'margin_pct': round((revenue - cost) / revenue * 100, 2) if revenue else None,
+    })
+    return row
+
+
+def report(cursor, start_date, end_date, group_by='product', limit=None, offset=0):
+    """الهامش للفترة مجمعاً حسب product أو category أو day (الأعلى هامشاً أولاً عدا day)"""
+    if group_by not in GROUPINGS:
+        raise ValueError(f"التجميع يجب أن يكون أحد: {', '.join(GROUPINGS)}")
+    key, columns = GROUPINGS[group_by]
+    order = 'm.day' if group_by == 'day' else 'SUM(m.revenue) - SUM(m.cost) DESC'
+
+    cursor.execute(f'''
+        SELECT {columns}, SUM(m.quantity) AS quantity, SUM(m.revenue) AS revenue, SUM(m.cost) AS cost
+        FROM daily_margin m
+        LEFT JOIN products p ON p.id = m.product_id
+        LEFT JOIN categories c ON c.id = {'m.category_id' if group_by != 'product' else 'p.category_id'}
+        WHERE m.day BETWEEN ? AND ?
+        GROUP BY {key}
+        ORDER BY {order}
+        LIMIT ? OFFSET ?
+    ''', (start_date, end_date, limit if limit else -1, offset))
+    names = [column[0] for column in cursor.description]
+    return [_margin_fields(dict(zip(names, row))) for row in cursor.fetchall()]
+
+
+def totals(cursor, start_date, end_date):
+    cursor.execute('''
+        SELECT COALESCE(SUM(quantity), 0) AS quantity, COALESCE(SUM(revenue), 0) AS revenue,
+               COALESCE(SUM(cost), 0) AS cost
+        FROM daily_margin WHERE day BETWEEN ? AND ?
+    ''', (start_date, end_date))
+    names = [column[0] for column in cursor.description]
+    return _margin_fields(dict(zip(names, cursor.fetchone())))
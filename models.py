@@ -0,0 +1,347 @@
+"""نماذج البيانات الأساسية للنظام
+
+كائنات خفيفة تعتمد على __slots__ بدلاً من القواميس لتقليل استهلاك الذاكرة
+عند الاحتفاظ بالكتالوج ونتائج التقارير في الذاكرة المؤقتة. تدعم الوصول بأسلوب
+القواميس (record['name'] و record.get()) للتوافق مع الكود الحالي.
+"""
+from datetime import datetime, timezone
+
+# صيغة التواريخ المخزنة (مثل CURRENT_TIMESTAMP)؛ جميع فلاتر التاريخ مقارنات نصية عليها
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def normalize_timestamp(value, field='created_at'):
+    """تحويل تاريخ ISO 8601 من الطلب إلى صيغة التخزين
+
+    يقبل 'YYYY-MM-DD' و 'YYYY-MM-DD HH:MM[:SS]' و 'YYYY-MM-DDTHH:MM[:SS][.ffffff][Z|±HH:MM]'.
+    التاريخ المرفق بمنطقة زمنية يُحول إلى UTC مثل CURRENT_TIMESTAMP.
+    """
+    if value is None:
+        return None
+    try:
+        moment = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f'صيغة تاريخ غير صالحة للحقل {field}: {value!r} (المتوقع YYYY-MM-DD HH:MM:SS)')
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.strftime(TIMESTAMP_FORMAT)
+
+
+class Record:
+    """الصنف الأساسي لجميع النماذج
+
+    FIELDS: الحقول الأساسية (الاسم، النوع، القيمة الافتراضية) وتُضبط دائماً.
+    EXTRA_FIELDS: حقول إضافية ناتجة عن الربط (JOIN) وتظهر فقط عند وجودها.
+    REQUIRED: الحقول الإلزامية عند الإنشاء من بيانات الطلب.
+    """
+
+    __slots__ = ()
+
+    FIELDS = ()
+    EXTRA_FIELDS = ()
+    REQUIRED = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_names = tuple(field[0] for field in cls.FIELDS)
+        cls._types = {name: kind for name, kind, _ in cls.FIELDS}
+        cls._defaults = {name: default for name, _, default in cls.FIELDS}
+        cls._types.update({name: kind for name, kind in cls.EXTRA_FIELDS})
+        cls._row_builders = {}
+
+    def __init__(self, **values):
+        for name in self._field_names:
+            setattr(self, name, values.pop(name, self._defaults[name]))
+        for name, value in values.items():
+            if name not in self._types:
+                raise TypeError(f'{type(self).__name__} لا يحتوي على الحقل {name}')
+            setattr(self, name, value)
+
+    # ---------------------------------------------------------------------
+    # التحويل من وإلى صفوف قاعدة البيانات
+    # ---------------------------------------------------------------------
+
+    @classmethod
+    def _compile(cls, description):
+        columns = tuple(column[0] for column in description)
+        builder = cls._row_builders.get(columns)
+        if builder is not None:
+            return builder
+
+        namespace = {'_new': object.__new__, '_cls': cls}
+        lines = ['def build(r):', '    o = _new(_cls)']
+        for index, name in enumerate(columns):
+            kind = cls._types.get(name)
+            if kind is None:
+                continue
+            if kind in (float, int):
+                lines.append(f'    o.{name} = None if r[{index}] is None else {kind.__name__}(r[{index}])')
+            else:
+                lines.append(f'    o.{name} = r[{index}]')
+        for name in cls._field_names:
+            if name not in columns:
+                namespace[f'_d_{name}'] = cls._defaults[name]
+                lines.append(f'    o.{name} = _d_{name}')
+        lines.append('    return o')
+
+        exec('\n'.join(lines), namespace)
+        builder = namespace['build']
+        cls._row_builders[columns] = builder
+        return builder
+
+    @classmethod
+    def fetchone(cls, cursor):
+        """قراءة صف واحد من المؤشر كنموذج (أو None)"""
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return cls._compile(cursor.description)(row)
+
+    @classmethod
+    def fetchall(cls, cursor):
+        """قراءة جميع صفوف المؤشر كنماذج"""
+        build = cls._compile(cursor.description)
+        return [build(row) for row in cursor.fetchall()]
+
+    def to_row(self, columns):
+        """قيم الحقول المطلوبة كـ tuple لتمريرها إلى execute/executemany"""
+        return tuple(getattr(self, name) for name in columns)
+
+    # ---------------------------------------------------------------------
+    # التحويل من بيانات الطلب مع التحقق
+    # ---------------------------------------------------------------------
+
+    @classmethod
+    def from_dict(cls, data):
+        """إنشاء نموذج من قاموس (بيانات الطلب) مع التحقق من الحقول والأنواع"""
+        if isinstance(data, cls):
+            return data
+        if not isinstance(data, dict):
+            raise ValueError(f'بيانات {cls.__name__} يجب أن تكون كائن JSON')
+
+        for name in cls.REQUIRED:
+            if data.get(name) is None:
+                raise ValueError(f'الحقل {name} مطلوب')
+
+        values = {}
+        for name, value in data.items():
+            kind = cls._types.get(name)
+            if kind is None:
+                continue
+            if value is not None and kind in (float, int):
+                try:
+                    value = kind(value)
+                except (TypeError, ValueError):
+                    raise ValueError(f'قيمة غير صالحة للحقل {name}: {value!r}')
+            values[name] = value
+
+        record = cls(**values)
+        record.validate()
+        return record
+
+    def validate(self):
+        """تحقق إضافي خاص بكل نموذج"""
+
+    def to_dict(self):
+        """تحويل النموذج إلى قاموس قابل للترميز بـ JSON"""
+        data = {name: getattr(self, name) for name in self._field_names}
+        for name, _ in self.EXTRA_FIELDS:
+            try:
+                value = getattr(self, name)
+            except AttributeError:
+                continue
+            if isinstance(value, list):
+                value = [item.to_dict() if isinstance(item, Record) else item for item in value]
+            data[name] = value
+        return data
+
+    # ---------------------------------------------------------------------
+    # الوصول بأسلوب القواميس للتوافق مع الكود الحالي
+    # ---------------------------------------------------------------------
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self._types:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self._types and hasattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            return default
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self._field_names[:3])
+        return f'{type(self).__name__}({fields})'
+
+
+class Product(Record):
+    """منتج"""
+
+    FIELDS = (
+        ('id', int, None),
+        ('name', str, None),
+        ('barcode', str, None),
+        ('category_id', int, None),
+        ('purchase_price', float, 0.0),
+        ('sale_price', float, None),
+        ('stock_quantity', float, 0.0),
+        ('min_stock', float, 0.0),
+        ('unit', str, 'قطعة'),
+        ('description', str, None),
+        ('image_url', str, None),
+        ('is_active', int, 1),
+        ('created_at', str, None),
+        ('updated_at', str, None),
+    )
+    EXTRA_FIELDS = (
+        ('category_name', str),
+        ('stock_status', str),
+    )
+    REQUIRED = ('name', 'sale_price')
+
+    __slots__ = tuple(field[0] for field in FIELDS) + tuple(field[0] for field in EXTRA_FIELDS)
+
+    def validate(self):
+        if not str(self.name).strip():
+            raise ValueError('اسم المنتج مطلوب')
+        if self.sale_price < 0 or self.purchase_price < 0:
+            raise ValueError('الأسعار لا يمكن أن تكون سالبة')
+
+
+class Customer(Record):
+    """عميل"""
+
+    FIELDS = (
+        ('id', int, None),
+        ('name', str, None),
+        ('phone', str, None),
+        ('email', str, None),
+        ('address', str, None),
+        ('balance', float, 0.0),
+        ('tax_number', str, None),
+        ('notes', str, None),
+        ('created_at', str, None),
+    )
+    REQUIRED = ('name',)
+
+    __slots__ = tuple(field[0] for field in FIELDS)
+
+
+class InvoiceItem(Record):
+    """بند فاتورة"""
+
+    FIELDS = (
+        ('id', int, None),
+        ('invoice_id', int, None),
+        ('product_id', int, None),
+        ('product_name', str, ''),
+        ('quantity', float, None),
+        ('unit_price', float, None),
+        ('total_price', float, None),
+        # تكلفة الوحدة وقت البيع (تُسجل من الخادم وليس من بيانات الطلب)
+        ('unit_cost', float, None),
+    )
+    REQUIRED = ('product_id', 'quantity', 'unit_price')
+
+    __slots__ = tuple(field[0] for field in FIELDS)
+
+    def validate(self):
+        if self.quantity <= 0:
+            raise ValueError(f'كمية غير صالحة للمنتج {self.product_id}')
+        if self.total_price is None:
+            self.total_price = self.quantity * self.unit_price
+
+
+class Invoice(Record):
+    """فاتورة بيع أو شراء"""
+
+    FIELDS = (
+        ('id', int, None),
+        ('invoice_number', str, None),
+        ('customer_id', int, None),
+        ('total_amount', float, None),
+        ('paid_amount', float, None),
+        ('remaining_amount', float, 0.0),
+        ('type', str, 'sale'),
+        ('status', str, 'completed'),
+        ('notes', str, ''),
+        ('created_by', int, None),
+        ('created_at', str, None),
+        ('idempotency_key', str, None),
+    )
+    EXTRA_FIELDS = (
+        ('customer_name', str),
+        ('payment_type', str),
+        ('items', list),
+    )
+    REQUIRED = ('total_amount',)
+
+    __slots__ = tuple(field[0] for field in FIELDS) + tuple(field[0] for field in EXTRA_FIELDS)
+
+    @classmethod
+    def from_dict(cls, data):
+        invoice = super().from_dict(data)
+        if isinstance(data, dict):
+            items = data.get('items')
+            if items is not None and not isinstance(items, list):
+                raise ValueError('بنود الفاتورة يجب أن تكون قائمة')
+            invoice.items = [InvoiceItem.from_dict(item) for item in items or []]
+        return invoice
+
+    def validate(self):
+        if self.total_amount < 0:
+            raise ValueError('إجمالي الفاتورة لا يمكن أن يكون سالباً')
+        self.created_at = normalize_timestamp(self.created_at)
+        payment_type = self.get('payment_type') or 'cash'
+        self.payment_type = payment_type
+        if self.paid_amount is None:
+            # البيع النقدي مدفوع بالكامل، والآجل غير مدفوع ما لم يُحدد غير ذلك
+            self.paid_amount = self.total_amount if payment_type == 'cash' else 0.0
+        self.remaining_amount = self.total_amount - self.paid_amount
+
+
+class Voucher(Record):
+    """سند قبض أو صرف"""
+
+    FIELDS = (
+        ('id', int, None),
+        ('voucher_number', str, None),
+        ('voucher_type', str, None),
+        ('account_id', int, None),
+        ('amount', float, None),
+        ('description', str, ''),
+        ('reference', str, ''),
+        ('status', str, 'completed'),
+        ('created_by', int, None),
+        ('created_at', str, None),
+    )
+    EXTRA_FIELDS = (
+        ('account_name', str),
+    )
+    REQUIRED = ('voucher_type', 'account_id', 'amount')
+
+    __slots__ = tuple(field[0] for field in FIELDS) + tuple(field[0] for field in EXTRA_FIELDS)
+
+    def validate(self):
+        if self.voucher_type not in ('receipt', 'payment'):
+            raise ValueError('نوع السند غير مدعوم')
+        if self.amount <= 0:
+            raise ValueError('مبلغ السند يجب أن يكون أكبر من صفر')
@@ -8,17 +8,107 @@ import hashlib
 import secrets
 import base64
 import io
+import threading
+from contextlib import contextmanager
 from PIL import Image
 import openpyxl
+from models import Product, Invoice, Voucher, Customer
+from events import EventBus
+from query_metrics import QueryMetrics, InstrumentedConnection, instrument_methods
+import backup_manager
+import archive_manager
+import sales_analytics
+import reorder_engine
+import margin_reports
+import inventory_valuation
+import stock_ledger
+import stocktake
+from report_cache import ReportCache
+
+class SharedConnection(InstrumentedConnection):
+    """اتصال مشترك بين عدة عمليات قراءة: الإغلاق من داخل الدوال لا يغلقه فعلياً"""
+    
+    def close(self):
+        pass
+    
+    def release(self):
+        super().close()
 
 class POSBackend:
-    def __init__(self, db_path="pos_database.db"):
+    # ترتيب أعمدة بنود الفاتورة عند الإدراج (بعد invoice_id)
+    INVOICE_ITEM_COLUMNS = ('product_id', 'product_name', 'quantity', 'unit_price', 'total_price')
+    
+    # حالة المخزون: النفاد يُفحص أولاً لأنه حالة خاصة من انخفاض المخزون
+    STOCK_ALERT_STATUS_SQL = "CASE WHEN stock_quantity <= 0 THEN 'out' ELSE 'low' END"
+    
+    # الجداول التي يكتب عليها البيع (لإبطال التقارير المخزنة التي تعتمد عليها)
+    SALE_TABLES = ('invoices', 'invoice_items', 'products', 'accounts', 'cash_transactions', 'product_demand',
+                   'daily_margin')
+    FINANCIAL_REPORT_TABLES = ('invoices', 'vouchers', 'accounts', 'archive_daily_summary')
+    FINANCIAL_SUMMARY_TABLES = ('accounts',)
+    PRODUCT_SALES_TABLES = ('invoices', 'invoice_items')
+    ANALYTICS_PRODUCT_TABLES = ('products', 'categories')
+    REORDER_TABLES = ('products', 'categories', 'product_demand')
+    MARGIN_TABLES = ('daily_margin', 'products', 'categories')
+    PURCHASE_TABLES = ('invoices', 'invoice_items', 'products', 'accounts', 'cash_transactions')
+    
+    def __init__(self, db_path="pos_database.db", backup_dir=None, archive_dir=None, read_only=False):
         self.db_path = db_path
-        self.initDatabase()
+        # وضع القراءة فقط (نسخة التقارير): لا تهيئة للجداول والاتصالات بـ mode=ro
+        self.read_only = read_only
+        self._database = f'file:{os.path.abspath(db_path)}?mode=ro' if read_only else db_path
+        self.backup_dir = backup_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), 'backups')
+        self.archive_dir = archive_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), 'archives')
+        self._productsVersion = 0
+        self._productStatsCache = None
+        self.reportCache = ReportCache.from_env()
+        self.demandSmoothing = reorder_engine.smoothing(
+            int(os.environ.get('POS_DEMAND_WINDOW_DAYS', reorder_engine.DEFAULT_WINDOW_DAYS)))
+        self.stockSnapshotDays = int(os.environ.get('POS_STOCK_SNAPSHOT_DAYS', stock_ledger.DEFAULT_SNAPSHOT_DAYS))
+        self._nextStockSnapshot = None
+        self.events = EventBus()
+        self.metrics = QueryMetrics.from_env(db_path)
+        self._local = threading.local()
+        if not read_only:
+            self.initDatabase()
+    
+    def _connect(self, timeout=5.0):
+        """فتح اتصال بقاعدة البيانات، أو إرجاع الاتصال المشترك إذا كانت هناك لقطة قراءة نشطة"""
+        shared = getattr(self._local, 'connection', None)
+        if shared is not None:
+            return shared
+        if not self.metrics.enabled:
+            return sqlite3.connect(self._database, timeout=timeout, uri=self.read_only)
+        conn = sqlite3.connect(self._database, timeout=timeout, uri=self.read_only, factory=InstrumentedConnection)
+        conn.metrics = self.metrics
+        return conn
+    
+    @contextmanager
+    def readSnapshot(self):
+        """تنفيذ عدة عمليات قراءة على اتصال واحد ولقطة متسقة واحدة
+        
+        جميع الدوال التي تُستدعى داخل السياق (في نفس الخيط) تستخدم نفس الاتصال
+        ونفس معاملة القراءة، فترى جميعها نفس حالة البيانات.
+        """
+        if getattr(self._local, 'connection', None) is not None:
+            yield self._local.connection
+            return
+        
+        conn = sqlite3.connect(self._database, uri=self.read_only, factory=SharedConnection)
+        if self.metrics.enabled:
+            conn.metrics = self.metrics
+        conn.execute('BEGIN')
+        self._local.connection = conn
+        try:
+            yield conn
+        finally:
+            self._local.connection = None
+            conn.rollback()
+            conn.release()
     
     def initDatabase(self):
         """تهيئة قاعدة البيانات وجميع الجداول"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # جدول المستخدمين
@@ -219,15 +309,89 @@ class POSBackend:
             )
         ''')
         
+        # جدول جديد: تنبيهات المخزون (يُحدّث مع كل تغيير في المخزون)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_alerts (
+                product_id INTEGER PRIMARY KEY,
+                status TEXT NOT NULL,
+                stock_quantity REAL NOT NULL,
+                min_stock REAL NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (product_id) REFERENCES products (id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_alerts_status ON stock_alerts (status, product_id)')
+        
+        # فهارس تقارير الفترات وتحليلات المبيعات (الفواتير حسب النوع والتاريخ ثم بنودها)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_type_created_at ON invoices (type, created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice ON invoice_items (invoice_id)')
+        
+        # مفتاح منع تكرار المبيعات المرسلة من نقاط البيع غير المتصلة
+        self._ensureColumn(cursor, 'invoices', 'idempotency_key', 'TEXT')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_invoices_idempotency_key
+            ON invoices (idempotency_key) WHERE idempotency_key IS NOT NULL
+        ''')
+        
+        # تكلفة الوحدة على بنود البيع؛ البنود السابقة للترحيل تأخذ سعر الشراء الحالي (أفضل تقدير متاح)
+        if self._ensureColumn(cursor, 'invoice_items', 'unit_cost', 'REAL'):
+            cursor.execute('''
+                UPDATE invoice_items
+                SET unit_cost = (SELECT purchase_price FROM products WHERE products.id = invoice_items.product_id)
+            ''')
+        
+        # التكلفة المتوسطة المرجحة؛ تبدأ من سعر الشراء الحالي
+        if self._ensureColumn(cursor, 'products', 'avg_cost', 'REAL'):
+            cursor.execute('UPDATE products SET avg_cost = purchase_price')
+        inventory_valuation.install(cursor)
+        
+        # سجل حركات المخزون ولقطاته الدورية
+        stock_ledger.install(cursor)
+        stocktake.install(cursor)
+        
+        # سجل التغييرات للنسخ الاحتياطي التزايدي (بعد إنشاء جميع الجداول المتتبعة)
+        archive_manager.install_archive_summary(cursor)
+        backup_manager.install_change_journal(cursor)
+        
+        # الطلب اليومي لكل منتج (يُحدّث مع كل بيع)؛ يُبنى من السجل عند أول تشغيل
+        reorder_engine.install_demand_table(cursor)
+        cursor.execute('SELECT EXISTS(SELECT 1 FROM product_demand), EXISTS(SELECT 1 FROM invoice_items)')
+        has_demand, has_sales = cursor.fetchone()
+        if has_sales and not has_demand:
+            reorder_engine.rebuild(conn, self.demandSmoothing)
+        
+        # ملخص الهامش اليومي (يُحدّث مع كل بيع)
+        margin_reports.install_margin_rollup(cursor)
+        cursor.execute('SELECT EXISTS(SELECT 1 FROM daily_margin)')
+        if has_sales and not cursor.fetchone()[0]:
+            margin_reports.rebuild(cursor)
+        
+        # إعادة بناء التنبيهات مرة واحدة عند التشغيل لضمان تطابقها مع المخزون
+        cursor.execute('DELETE FROM stock_alerts')
+        cursor.execute(f'''
+            INSERT INTO stock_alerts (product_id, status, stock_quantity, min_stock)
+            SELECT id, {self.STOCK_ALERT_STATUS_SQL}, stock_quantity, min_stock
+            FROM products
+            WHERE is_active = 1 AND stock_quantity <= min_stock
+        ''')
+        
         conn.commit()
         conn.close()
         
         # إضافة البيانات الأساسية
         self.initializeDefaultData()
     
+    def _ensureColumn(self, cursor, table, column, definition):
+        """إضافة عمود لجدول موجود إذا لم يكن موجوداً (ترحيل قواعد البيانات القديمة)"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+            return True
+        return False
+    
     def initializeDefaultData(self):
         """تهيئة البيانات الافتراضية"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # إضافة مستخدم افتراضي
@@ -251,11 +415,13 @@ class POSBackend:
             {"name": "مصروفات تشغيل", "type": "expense", "parent_id": None}
         ]
         
-        for account in accounts:
-            cursor.execute('''
-                INSERT OR IGNORE INTO accounts (name, account_type, parent_id)
+        # لا يوجد قيد فريد على اسم الحساب، لذا يتم الإدراج فقط عند خلو الجدول
+        cursor.execute('SELECT COUNT(*) FROM accounts')
+        if cursor.fetchone()[0] == 0:
+            cursor.executemany('''
+                INSERT INTO accounts (name, account_type, parent_id)
                 VALUES (?, ?, ?)
-            ''', (account["name"], account["type"], account["parent_id"]))
+            ''', [(account["name"], account["type"], account["parent_id"]) for account in accounts])
         
         # إضافة فئات افتراضية
         categories = ["أجهزة إلكترونية", "ملابس", "أغذية", "أثاث", "مستلزمات مكتبية"]
@@ -274,7 +440,7 @@ class POSBackend:
     
     def getCashBalance(self):
         """جلب رصيد الصندوق الحالي"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -288,84 +454,49 @@ class POSBackend:
         return float(result)
     
     def processSale(self, sale_data):
-        """معالجة عملية بيع مع دعم الدفع النقدي والآجل"""
-        conn = sqlite3.connect(self.db_path)
+        """معالجة عملية بيع مع دعم الدفع النقدي والآجل
+        
+        إذا احتوت البيانات على idempotency_key وسبق تسجيل بيع بنفس المفتاح،
+        يتم إرجاع الفاتورة الموجودة بدلاً من تسجيل البيع مرة أخرى.
+        """
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
-            # إنشاء رقم فاتورة
-            invoice_number = self.generateInvoiceNumber('sale')
+            invoice = Invoice.from_dict(sale_data)
             
-            # تحديد حالة الفاتورة بناءً على نوع الدفع
-            payment_type = sale_data.get('payment_type', 'cash')
-            status = 'completed' if payment_type == 'cash' else 'pending'
-            remaining_amount = sale_data['total_amount'] - sale_data.get('paid_amount', 0)
+            # قفل الكتابة قبل توليد رقم الفاتورة، وإلا قد تحصل نقطتا بيع متزامنتان على نفس الرقم
+            cursor.execute('BEGIN IMMEDIATE')
+            self._snapshotStockIfDue(cursor)
             
-            # حفظ الفاتورة
-            cursor.execute('''
-                INSERT INTO invoices 
-                (invoice_number, customer_id, total_amount, paid_amount, 
-                 remaining_amount, type, status, notes)
-                VALUES (?, ?, ?, ?, ?, 'sale', ?, ?)
-            ''', (
-                invoice_number,
-                sale_data.get('customer_id'),
-                sale_data['total_amount'],
-                sale_data.get('paid_amount', sale_data['total_amount']),
-                remaining_amount,
-                status,
-                sale_data.get('notes', '')
-            ))
+            if invoice.idempotency_key:
+                existing = self._findSalesByKeys(cursor, [invoice.idempotency_key])
+                if existing:
+                    conn.rollback()
+                    return self._duplicateSaleResult(existing[invoice.idempotency_key])
             
-            invoice_id = cursor.lastrowid
-            
-            # حفظ عناصر الفاتورة
-            for item in sale_data['items']:
-                cursor.execute('''
-                    INSERT INTO invoice_items 
-                    (invoice_id, product_id, product_name, quantity, unit_price, total_price)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    invoice_id, item['product_id'], item.get('product_name', ''),
-                    item['quantity'], item['unit_price'], item['total_price']
-                ))
-                
-                # تحديث المخزون
-                cursor.execute('''
-                    UPDATE products 
-                    SET stock_quantity = stock_quantity - ?
-                    WHERE id = ?
-                ''', (item['quantity'], item['product_id']))
-            
-            # إذا كان البيع نقدياً، تحديث رصيد الصندوق
-            if payment_type == 'cash':
-                self.updateCashBalance(sale_data['total_amount'], 'income', f'بيع نقدي - فاتورة {invoice_number}')
-            
-            # إذا كان البيع آجلاً، تحديث رصيد العميل
-            if payment_type == 'credit' and sale_data.get('customer_id'):
-                cursor.execute('''
-                    UPDATE customers 
-                    SET balance = balance + ?
-                    WHERE id = ?
-                ''', (remaining_amount, sale_data['customer_id']))
-            
-            # إنشاء القيد المحاسبي
-            self.createJournalEntry({
-                'type': 'sale',
-                'invoice_number': invoice_number,
-                'total_amount': sale_data['total_amount'],
-                'paid_amount': sale_data.get('paid_amount', sale_data['total_amount']),
-                'remaining_amount': remaining_amount
-            }, invoice_id)
+            result = self._insertSale(cursor, invoice)
+            stock_changes = self._refreshStockAlerts(cursor, [item.product_id for item in invoice.items])
+            events = self._saleEvents(cursor, [(invoice, result)])
             
             conn.commit()
+            self.invalidateProductCaches()
+            self.reportCache.invalidate(*self.SALE_TABLES)
+            self._publishStockAlerts(stock_changes)
+            self._publishEvents(events)
+            return result
+            
+        except sqlite3.IntegrityError as e:
+            conn.rollback()
+            # بيع متزامن بنفس المفتاح سبقنا إلى الإدراج
+            if sale_data.get('idempotency_key'):
+                existing = self._findSalesByKeys(cursor, [sale_data['idempotency_key']])
+                if existing:
+                    return self._duplicateSaleResult(existing[sale_data['idempotency_key']])
             return {
-                'success': True,
-                'invoice_id': invoice_id,
-                'invoice_number': invoice_number,
-                'message': 'تمت عملية البيع بنجاح'
+                'success': False,
+                'error': str(e)
             }
-            
         except Exception as e:
             conn.rollback()
             return {
@@ -375,108 +506,363 @@ class POSBackend:
         finally:
             conn.close()
     
+    def processSalesBatch(self, sales, group_size=50):
+        """معالجة دفعة مبيعات (مثلاً من نقطة بيع عادت للاتصال بعد انقطاع)
+        
+        يتم تنفيذ المبيعات في معاملات مجمعة (group_size بيع لكل معاملة) مع
+        نقطة حفظ لكل بيع، فلا يُلغي فشل بيع واحد بقية المجموعة. المبيعات ذات
+        idempotency_key المسجل مسبقاً لا تُسجل مرة أخرى.
+        """
+        results = []
+        seen_keys = {}
+        
+        for start in range(0, len(sales), group_size):
+            group = list(enumerate(sales[start:start + group_size], start))
+            group_results = []
+            group_keys = {}
+            touched_products = []
+            stock_changes = []
+            sold = []
+            events = []
+            
+            conn = self._connect(timeout=30)
+            conn.isolation_level = None
+            cursor = conn.cursor()
+            
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                self._snapshotStockIfDue(cursor)
+                
+                # التحقق من صحة البيانات ثم البحث عن المفاتيح المسجلة باستعلام واحد
+                invoices = []
+                for index, sale_data in group:
+                    try:
+                        invoices.append((index, Invoice.from_dict(sale_data), None))
+                    except Exception as e:
+                        invoices.append((index, None, str(e)))
+                
+                existing = self._findSalesByKeys(
+                    cursor, [invoice.idempotency_key for _, invoice, _ in invoices if invoice and invoice.idempotency_key])
+                
+                for index, invoice, error in invoices:
+                    if error:
+                        group_results.append({'index': index, 'idempotency_key': self._saleKey(sales[index]),
+                                              'success': False, 'error': error})
+                        continue
+                    
+                    key = invoice.idempotency_key
+                    previous = (existing.get(key) or seen_keys.get(key) or group_keys.get(key)) if key else None
+                    if previous:
+                        group_results.append({'index': index, 'idempotency_key': key,
+                                              **self._duplicateSaleResult(previous)})
+                        continue
+                    
+                    cursor.execute('SAVEPOINT sale')
+                    try:
+                        result = self._insertSale(cursor, invoice)
+                        cursor.execute('RELEASE SAVEPOINT sale')
+                    except Exception as e:
+                        cursor.execute('ROLLBACK TO SAVEPOINT sale')
+                        cursor.execute('RELEASE SAVEPOINT sale')
+                        group_results.append({'index': index, 'idempotency_key': key, 'success': False, 'error': str(e)})
+                        continue
+                    
+                    if key:
+                        group_keys[key] = (result['invoice_id'], result['invoice_number'])
+                    touched_products.extend(item.product_id for item in invoice.items)
+                    sold.append((invoice, result))
+                    group_results.append({'index': index, 'idempotency_key': key, 'duplicate': False, **result})
+                
+                stock_changes = self._refreshStockAlerts(cursor, touched_products)
+                events = self._saleEvents(cursor, sold)
+                cursor.execute('COMMIT')
+                
+            except Exception as e:
+                if conn.in_transaction:
+                    cursor.execute('ROLLBACK')
+                # فشل المعاملة بالكامل: لم يُسجل أي بيع من هذه المجموعة
+                group_results = [{'index': index, 'idempotency_key': self._saleKey(sale_data),
+                                  'success': False, 'error': str(e)} for index, sale_data in group]
+                group_keys = {}
+                touched_products = []
+                events = []
+            finally:
+                conn.close()
+            
+            results.extend(group_results)
+            seen_keys.update(group_keys)
+            if touched_products:
+                self.invalidateProductCaches()
+                self.reportCache.invalidate(*self.SALE_TABLES)
+                self._publishStockAlerts(stock_changes)
+                self._publishEvents(events)
+        
+        results.sort(key=lambda result: result['index'])
+        return {
+            'success': True,
+            'total': len(results),
+            'processed': sum(1 for r in results if r['success'] and not r.get('duplicate')),
+            'duplicates': sum(1 for r in results if r.get('duplicate')),
+            'failed': sum(1 for r in results if not r['success']),
+            'results': results
+        }
+    
+    def _insertSale(self, cursor, invoice):
+        """تسجيل فاتورة بيع وبنودها وتحديث المخزون والصندوق ضمن معاملة المستدعي"""
+        # إنشاء رقم فاتورة
+        invoice_number = self.generateInvoiceNumber('sale', cursor)
+        
+        # تحديد حالة الفاتورة بناءً على نوع الدفع
+        payment_type = invoice.payment_type
+        status = 'completed' if payment_type == 'cash' else 'pending'
+        
+        # حفظ الفاتورة
+        cursor.execute('''
+            INSERT INTO invoices 
+            (invoice_number, customer_id, total_amount, paid_amount, 
+             remaining_amount, type, status, notes, idempotency_key, created_at)
+            VALUES (?, ?, ?, ?, ?, 'sale', ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ''', (
+            invoice_number,
+            invoice.customer_id,
+            invoice.total_amount,
+            invoice.paid_amount,
+            invoice.remaining_amount,
+            status,
+            invoice.notes,
+            invoice.idempotency_key,
+            invoice.created_at
+        ))
+        
+        invoice_id = cursor.lastrowid
+        
+        # حفظ عناصر الفاتورة مع التكلفة المتوسطة الحالية للمنتج
+        cursor.executemany('''
+            INSERT INTO invoice_items 
+            (invoice_id, product_id, product_name, quantity, unit_price, total_price, unit_cost)
+            VALUES (?, ?, ?, ?, ?, ?, (SELECT COALESCE(avg_cost, purchase_price) FROM products WHERE id = ?))
+        ''', [(invoice_id,) + item.to_row(self.INVOICE_ITEM_COLUMNS) + (item.product_id,)
+              for item in invoice.items])
+        margin_reports.record_invoice(cursor, invoice_id)
+        
+        # تحديث المخزون وتسجيل حركاته
+        cursor.executemany('''
+            UPDATE products 
+            SET stock_quantity = stock_quantity - ?
+            WHERE id = ?
+        ''', [(item.quantity, item.product_id) for item in invoice.items])
+        stock_ledger.record_invoice(cursor, invoice_id, 'sale', -1)
+        
+        # تحديث متوسط الطلب اليومي للمنتجات المباعة
+        reorder_engine.record_sale(cursor, reorder_engine.sale_day(invoice.created_at),
+                                   [(item.product_id, item.quantity) for item in invoice.items],
+                                   self.demandSmoothing)
+        
+        # إذا كان البيع نقدياً، تحديث رصيد الصندوق
+        if payment_type == 'cash':
+            self.updateCashBalance(invoice.total_amount, 'income', f'بيع نقدي - فاتورة {invoice_number}', cursor)
+        
+        # إذا كان البيع آجلاً، تحديث رصيد العميل
+        if payment_type == 'credit' and invoice.customer_id:
+            cursor.execute('''
+                UPDATE customers 
+                SET balance = balance + ?
+                WHERE id = ?
+            ''', (invoice.remaining_amount, invoice.customer_id))
+        
+        # إنشاء القيد المحاسبي
+        self.createJournalEntry({
+            'type': 'sale',
+            'invoice_number': invoice_number,
+            'total_amount': invoice.total_amount,
+            'paid_amount': invoice.paid_amount,
+            'remaining_amount': invoice.remaining_amount
+        }, invoice_id)
+        
+        return {
+            'success': True,
+            'invoice_id': invoice_id,
+            'invoice_number': invoice_number,
+            'message': 'تمت عملية البيع بنجاح'
+        }
+    
+    def _findSalesByKeys(self, cursor, keys):
+        """البحث عن فواتير مسجلة بمفاتيح منع التكرار (باستخدام الفهرس الفريد)"""
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            cursor.execute(f'''
+                SELECT idempotency_key, id, invoice_number FROM invoices
+                WHERE idempotency_key IN ({marks})
+            ''', chunk)
+            for key, invoice_id, invoice_number in cursor.fetchall():
+                found[key] = (invoice_id, invoice_number)
+        return found
+    
+    def _saleKey(self, sale_data):
+        return sale_data.get('idempotency_key') if isinstance(sale_data, dict) else None
+    
+    def _duplicateSaleResult(self, existing):
+        invoice_id, invoice_number = existing
+        return {
+            'success': True,
+            'duplicate': True,
+            'invoice_id': invoice_id,
+            'invoice_number': invoice_number,
+            'message': 'تم تسجيل هذا البيع مسبقاً'
+        }
+    
+    # =========================================================================
+    # الأحداث الفورية
+    # =========================================================================
+    
+    def _saleEvents(self, cursor, sales):
+        """تجهيز أحداث المبيعات ضمن معاملة المستدعي لنشرها بعد commit
+        
+        sales: قائمة (invoice, result). لا يتم تنفيذ أي استعلام إذا لم يوجد مشتركون.
+        """
+        if not sales or not self.events.subscriber_count:
+            return []
+        
+        events = []
+        cash_delta = 0.0
+        product_ids = []
+        for invoice, result in sales:
+            events.append(('sale_completed', {
+                'invoice_id': result['invoice_id'],
+                'invoice_number': result['invoice_number'],
+                'customer_id': invoice.customer_id,
+                'payment_type': invoice.payment_type,
+                'total_amount': invoice.total_amount,
+                'paid_amount': invoice.paid_amount,
+                'remaining_amount': invoice.remaining_amount,
+                'items_count': len(invoice.items)
+            }))
+            if invoice.payment_type == 'cash':
+                cash_delta += invoice.total_amount
+            product_ids.extend(item.product_id for item in invoice.items)
+        
+        events.extend(self._stockEvents(cursor, product_ids, 'sale'))
+        if cash_delta:
+            events.append(self._cashEvent(cursor, cash_delta, 'sale'))
+        return events
+    
+    def _stockEvents(self, cursor, product_ids, source):
+        """حدث stock_changed بالكميات الحالية للمنتجات المعدلة"""
+        if not self.events.subscriber_count:
+            return []
+        
+        ids = list(dict.fromkeys(product_id for product_id in product_ids if product_id is not None))
+        products = []
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            cursor.execute(f'''
+                SELECT id, name, stock_quantity, min_stock, is_active
+                FROM products WHERE id IN ({marks})
+            ''', chunk)
+            products.extend({
+                'product_id': product_id,
+                'name': name,
+                'stock_quantity': float(stock_quantity or 0),
+                'min_stock': float(min_stock or 0),
+                'is_active': is_active
+            } for product_id, name, stock_quantity, min_stock, is_active in cursor.fetchall())
+        
+        if not products:
+            return []
+        return [('stock_changed', {'source': source, 'products': products})]
+    
+    def _cashEvent(self, cursor, delta, source, reference=None):
+        """حدث cash_balance بالتغير والرصيد بعد المعاملة"""
+        cursor.execute('''
+            SELECT COALESCE(SUM(balance), 0) FROM accounts
+            WHERE name = 'النقدية' AND is_active = 1
+        ''')
+        return ('cash_balance', {
+            'balance': float(cursor.fetchone()[0]),
+            'delta': delta,
+            'source': source,
+            'reference': reference
+        })
+    
+    def _publishEvents(self, events):
+        """نشر الأحداث المجهزة بعد تأكيد المعاملة"""
+        for topic, data in events:
+            self.events.publish(topic, data)
+    
     def getProductsByCategory(self, category_id=None):
         """جلب المنتجات حسب الفئة"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         if category_id:
             cursor.execute('''
                 SELECT p.*, c.name as category_name,
-                       CASE 
-                           WHEN p.stock_quantity <= p.min_stock THEN 'low'
-                           WHEN p.stock_quantity = 0 THEN 'out'
-                           ELSE 'good'
-                       END as stock_status
+                       COALESCE(a.status, 'good') as stock_status
                 FROM products p
                 LEFT JOIN categories c ON p.category_id = c.id
+                LEFT JOIN stock_alerts a ON a.product_id = p.id
                 WHERE p.category_id = ? AND p.is_active = 1
                 ORDER BY p.name
             ''', (category_id,))
         else:
             cursor.execute('''
                 SELECT p.*, c.name as category_name,
-                       CASE 
-                           WHEN p.stock_quantity <= p.min_stock THEN 'low'
-                           WHEN p.stock_quantity = 0 THEN 'out'
-                           ELSE 'good'
-                       END as stock_status
+                       COALESCE(a.status, 'good') as stock_status
                 FROM products p
                 LEFT JOIN categories c ON p.category_id = c.id
+                LEFT JOIN stock_alerts a ON a.product_id = p.id
                 WHERE p.is_active = 1
                 ORDER BY p.name
             ''')
         
-        results = cursor.fetchall()
+        products = Product.fetchall(cursor)
         conn.close()
         
-        products = []
-        for row in results:
-            product = dict(zip([column[0] for column in cursor.description], row))
-            # تحويل القيم العشرية
-            product['sale_price'] = float(product['sale_price'])
-            product['purchase_price'] = float(product['purchase_price'])
-            product['stock_quantity'] = float(product['stock_quantity'])
-            products.append(product)
-        
         return products
     
     def searchProducts(self, query):
         """بحث فوري في المنتجات"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         search_term = f'%{query}%'
         cursor.execute('''
             SELECT p.*, c.name as category_name,
-                   CASE 
-                       WHEN p.stock_quantity <= p.min_stock THEN 'low'
-                       WHEN p.stock_quantity = 0 THEN 'out'
-                       ELSE 'good'
-                   END as stock_status
+                   COALESCE(a.status, 'good') as stock_status
             FROM products p
             LEFT JOIN categories c ON p.category_id = c.id
+            LEFT JOIN stock_alerts a ON a.product_id = p.id
             WHERE (p.name LIKE ? OR p.barcode LIKE ?) AND p.is_active = 1
             ORDER BY p.name
             LIMIT 20
         ''', (search_term, search_term))
         
-        results = cursor.fetchall()
+        products = Product.fetchall(cursor)
         conn.close()
         
-        products = []
-        for row in results:
-            product = dict(zip([column[0] for column in cursor.description], row))
-            product['sale_price'] = float(product['sale_price'])
-            product['purchase_price'] = float(product['purchase_price'])
-            product['stock_quantity'] = float(product['stock_quantity'])
-            products.append(product)
-        
         return products
     
-    def updateCashBalance(self, amount, transaction_type, description):
-        """تحديث رصيد الصندوق"""
-        conn = sqlite3.connect(self.db_path)
+    def updateCashBalance(self, amount, transaction_type, description, cursor=None):
+        """تحديث رصيد الصندوق
+        
+        عند تمرير cursor يتم التنفيذ ضمن معاملة المستدعي دون commit،
+        لتجنب فتح اتصال ثانٍ ينتظر قفل الكتابة الذي يحمله المستدعي.
+        """
+        if cursor is not None:
+            self._applyCashTransaction(cursor, amount, transaction_type, description)
+            return True
+        
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
-            # تحديث حساب النقدية
-            if transaction_type == 'income':
-                cursor.execute('''
-                    UPDATE accounts SET balance = balance + ? WHERE name = 'النقدية'
-                ''', (amount,))
-            else:
-                cursor.execute('''
-                    UPDATE accounts SET balance = balance - ? WHERE name = 'النقدية'
-                ''', (amount,))
-            
-            # تسجيل الحركة
-            cursor.execute('''
-                INSERT INTO cash_transactions (amount, type, description)
-                VALUES (?, ?, ?)
-            ''', (amount, transaction_type, description))
-            
+            self._applyCashTransaction(cursor, amount, transaction_type, description)
             conn.commit()
+            self.reportCache.invalidate('accounts', 'cash_transactions')
             return True
             
         except Exception as e:
@@ -485,55 +871,175 @@ class POSBackend:
         finally:
             conn.close()
     
+    def _applyCashTransaction(self, cursor, amount, transaction_type, description):
+        """تحديث حساب النقدية وتسجيل الحركة"""
+        if transaction_type == 'income':
+            cursor.execute('''
+                UPDATE accounts SET balance = balance + ? WHERE name = 'النقدية'
+            ''', (amount,))
+        else:
+            cursor.execute('''
+                UPDATE accounts SET balance = balance - ? WHERE name = 'النقدية'
+            ''', (amount,))
+        
+        # تسجيل الحركة
+        cursor.execute('''
+            INSERT INTO cash_transactions (amount, type, description)
+            VALUES (?, ?, ?)
+        ''', (amount, transaction_type, description))
+    
     # =========================================================================
-    # وظائف إدارة المنتجات المتقدمة
+    # تنبيهات المخزون
     # =========================================================================
     
-    def getProductStatistics(self):
-        """جلب إحصائيات المنتجات"""
-        conn = sqlite3.connect(self.db_path)
+    def _refreshStockAlerts(self, cursor, product_ids):
+        """تحديث تنبيهات المخزون للمنتجات المعدلة ضمن معاملة المستدعي
+        
+        ترجع قائمة المنتجات التي تغيرت حالتها (good/low/out) لنشرها بعد commit.
+        """
+        changes = []
+        ids = list(dict.fromkeys(product_id for product_id in product_ids if product_id is not None))
+        
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            
+            cursor.execute(f'SELECT product_id, status FROM stock_alerts WHERE product_id IN ({marks})', chunk)
+            previous = dict(cursor.fetchall())
+            
+            cursor.execute(f'DELETE FROM stock_alerts WHERE product_id IN ({marks})', chunk)
+            cursor.execute(f'''
+                INSERT INTO stock_alerts (product_id, status, stock_quantity, min_stock)
+                SELECT id, {self.STOCK_ALERT_STATUS_SQL}, stock_quantity, min_stock
+                FROM products
+                WHERE id IN ({marks}) AND is_active = 1 AND stock_quantity <= min_stock
+            ''', chunk)
+            
+            cursor.execute(f'''
+                SELECT p.id, p.name, p.stock_quantity, p.min_stock, COALESCE(a.status, 'good')
+                FROM products p
+                LEFT JOIN stock_alerts a ON a.product_id = p.id
+                WHERE p.id IN ({marks})
+            ''', chunk)
+            
+            for product_id, name, stock_quantity, min_stock, status in cursor.fetchall():
+                previous_status = previous.get(product_id, 'good')
+                if status != previous_status:
+                    changes.append({
+                        'product_id': product_id,
+                        'name': name,
+                        'status': status,
+                        'previous_status': previous_status,
+                        'stock_quantity': stock_quantity,
+                        'min_stock': min_stock
+                    })
+        
+        return changes
+    
+    def _publishStockAlerts(self, changes):
+        """نشر تغييرات حالة المخزون للمشتركين"""
+        for change in changes:
+            self.events.publish('stock_alert', change)
+    
+    def getStockAlerts(self, status=None, page=1, per_page=50):
+        """جلب المنتجات منخفضة أو نافدة المخزون مع التقسيم إلى صفحات"""
+        page = max(int(page), 1)
+        per_page = min(max(int(per_page), 1), 500)
+        
+        conn = self._connect()
         cursor = conn.cursor()
         
-        # إجمالي المنتجات
-        cursor.execute('SELECT COUNT(*) FROM products WHERE is_active = 1')
-        total_products = cursor.fetchone()[0]
+        cursor.execute('SELECT status, COUNT(*) FROM stock_alerts GROUP BY status')
+        counts = {'low': 0, 'out': 0}
+        counts.update(dict(cursor.fetchall()))
         
-        # المنتجات منخفضة المخزون
-        cursor.execute('''
-            SELECT COUNT(*) FROM products 
-            WHERE stock_quantity <= min_stock AND is_active = 1
-        ''')
-        low_stock_count = cursor.fetchone()[0]
+        query = '''
+            SELECT p.*, c.name as category_name, a.status as stock_status
+            FROM stock_alerts a
+            JOIN products p ON p.id = a.product_id
+            LEFT JOIN categories c ON p.category_id = c.id
+        '''
+        params = []
+        if status:
+            query += " WHERE a.status = ?"
+            params.append(status)
         
-        # المنتجات التي نفذت من المخزون
-        cursor.execute('''
-            SELECT COUNT(*) FROM products 
-            WHERE stock_quantity = 0 AND is_active = 1
-        ''')
-        out_of_stock_count = cursor.fetchone()[0]
+        query += " ORDER BY a.status DESC, a.product_id LIMIT ? OFFSET ?"
+        params.extend([per_page, (page - 1) * per_page])
+        
+        cursor.execute(query, params)
+        products = Product.fetchall(cursor)
+        conn.close()
+        
+        return {
+            'items': products,
+            'total': counts[status] if status else counts['low'] + counts['out'],
+            'counts': counts,
+            'page': page,
+            'per_page': per_page
+        }
+    
+    # =========================================================================
+    # وظائف إدارة المنتجات المتقدمة
+    # =========================================================================
+    
+    def getProductStatistics(self):
+        """جلب إحصائيات المنتجات
+        
+        يتم حساب جميع الإحصائيات في مسح واحد لجدول المنتجات وتخزين النتيجة
+        مؤقتاً حتى أول عملية كتابة على المنتجات أو المخزون أو الفئات.
+        """
+        cached = self._productStatsCache
+        if cached is not None and cached[0] == self._productsVersion:
+            return dict(cached[1])
+        
+        version = self._productsVersion
+        conn = self._connect()
+        cursor = conn.cursor()
         
-        # قيمة المخزون الإجمالية
         cursor.execute('''
-            SELECT COALESCE(SUM(stock_quantity * purchase_price), 0)
+            SELECT COUNT(*),
+                   COALESCE(SUM(CASE WHEN stock_quantity <= min_stock THEN 1 ELSE 0 END), 0),
+                   COALESCE(SUM(CASE WHEN stock_quantity <= 0 THEN 1 ELSE 0 END), 0)
             FROM products WHERE is_active = 1
         ''')
-        inventory_value = cursor.fetchone()[0]
+        total_products, low_stock_count, out_of_stock_count = cursor.fetchone()
+        inventory_value = inventory_valuation.total_value(cursor)
         
+        categories = self._fetchCategoriesCount(cursor)
         conn.close()
         
-        return {
+        stats = {
             'total_products': total_products,
             'low_stock_count': low_stock_count,
             'out_of_stock_count': out_of_stock_count,
             'inventory_value': float(inventory_value),
-            'categories_count': self.getCategoriesCount()
+            'categories_count': categories
         }
+        
+        # لا نخزن النتيجة إذا حدثت كتابة أثناء الحساب
+        if version == self._productsVersion:
+            self._productStatsCache = (version, stats)
+        return dict(stats)
+    
+    def invalidateProductCaches(self):
+        """إبطال النتائج المخزنة مؤقتاً للمنتجات بعد أي كتابة"""
+        self._productsVersion += 1
+        self._productStatsCache = None
+        self.reportCache.invalidate('products', 'categories')
     
     def getCategoriesCount(self):
         """عدد الفئات والمنتجات في كل فئة"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
+        categories = self._fetchCategoriesCount(cursor)
+        conn.close()
+        
+        return categories
+    
+    def _fetchCategoriesCount(self, cursor):
+        """استعلام عدد المنتجات في كل فئة على اتصال قائم"""
         cursor.execute('''
             SELECT c.id, c.name, COUNT(p.id) as product_count
             FROM categories c
@@ -542,11 +1048,8 @@ class POSBackend:
             ORDER BY c.name
         ''')
         
-        results = cursor.fetchall()
-        conn.close()
-        
         categories = []
-        for row in results:
+        for row in cursor.fetchall():
             categories.append({
                 'id': row[0],
                 'name': row[1],
@@ -621,10 +1124,10 @@ class POSBackend:
                     existing_product = self.getProductByBarcode(product_data.get('barcode'))
                     if existing_product:
                         product_data['id'] = existing_product['id']
-                        self.saveProduct(product_data)
+                        self.saveProduct(product_data, movement_type='import')
                         updated_count += 1
                     else:
-                        self.saveProduct(product_data)
+                        self.saveProduct(product_data, movement_type='import')
                         imported_count += 1
                         
                 except Exception as e:
@@ -642,7 +1145,7 @@ class POSBackend:
     
     def getOrCreateCategory(self, category_name):
         """الحصول على فئة أو إنشاؤها إذا لم تكن موجودة"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('SELECT id FROM categories WHERE name = ?', (category_name,))
@@ -655,6 +1158,7 @@ class POSBackend:
             cursor.execute('INSERT INTO categories (name) VALUES (?)', (category_name,))
             category_id = cursor.lastrowid
             conn.commit()
+            self.invalidateProductCaches()
             conn.close()
             return category_id
     
@@ -663,20 +1167,18 @@ class POSBackend:
         if not barcode:
             return None
             
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM products WHERE barcode = ? AND is_active = 1', (barcode,))
-        result = cursor.fetchone()
+        product = Product.fetchone(cursor)
         conn.close()
         
-        if result:
-            return dict(zip([column[0] for column in cursor.description], result))
-        return None
+        return product
     
     def manageProductImages(self, product_id, image_data=None, image_url=None, action='add'):
         """إدارة صور المنتجات"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -719,7 +1221,7 @@ class POSBackend:
     
     def getProductImages(self, product_id):
         """جلب صور المنتج"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -759,7 +1261,7 @@ class POSBackend:
     
     def updateCategory(self, category_data):
         """تحديث الفئة"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -776,6 +1278,7 @@ class POSBackend:
                 ''', (category_data['name'], category_data.get('description')))
             
             conn.commit()
+            self.invalidateProductCaches()
             return True
             
         except Exception as e:
@@ -786,7 +1289,7 @@ class POSBackend:
     
     def deleteCategory(self, category_id):
         """حذف الفئة"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -802,6 +1305,7 @@ class POSBackend:
             
             cursor.execute('DELETE FROM categories WHERE id = ?', (category_id,))
             conn.commit()
+            self.invalidateProductCaches()
             
             return {'success': True, 'message': 'تم حذف الفئة بنجاح'}
             
@@ -817,7 +1321,7 @@ class POSBackend:
     
     def getAccountBalance(self, account_id):
         """جلب رصيد الحساب"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('SELECT balance FROM accounts WHERE id = ?', (account_id,))
@@ -830,7 +1334,7 @@ class POSBackend:
     
     def createAccount(self, account_data):
         """إنشاء حساب جديد"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -846,6 +1350,7 @@ class POSBackend:
             
             account_id = cursor.lastrowid
             conn.commit()
+            self.reportCache.invalidate('accounts')
             
             return {'success': True, 'account_id': account_id}
             
@@ -866,8 +1371,12 @@ class POSBackend:
         ]
     
     def getFinancialSummary(self):
-        """جلب الملخص المالي"""
-        conn = sqlite3.connect(self.db_path)
+        """جلب الملخص المالي (مخزن مؤقتاً حتى الكتابة التالية على الحسابات)"""
+        return self.reportCache.get_or_compute('financial_summary', (), self.FINANCIAL_SUMMARY_TABLES,
+                                               self._computeFinancialSummary)
+    
+    def _computeFinancialSummary(self):
+        conn = self._connect()
         cursor = conn.cursor()
         
         # إجمالي الأصول
@@ -906,48 +1415,59 @@ class POSBackend:
     
     def createVoucher(self, voucher_data):
         """إنشاء سند قبض/صرف"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
+            voucher = Voucher.from_dict(voucher_data)
+            
             # إنشاء رقم سند
-            voucher_number = self.generateVoucherNumber(voucher_data['voucher_type'])
+            voucher_number = self.generateVoucherNumber(voucher.voucher_type)
             
             cursor.execute('''
                 INSERT INTO vouchers (voucher_number, voucher_type, account_id, amount, description, reference)
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (
                 voucher_number,
-                voucher_data['voucher_type'],
-                voucher_data['account_id'],
-                voucher_data['amount'],
-                voucher_data.get('description', ''),
-                voucher_data.get('reference', '')
+                voucher.voucher_type,
+                voucher.account_id,
+                voucher.amount,
+                voucher.description,
+                voucher.reference
             ))
             
             voucher_id = cursor.lastrowid
             
             # تحديث رصيد الحساب
-            if voucher_data['voucher_type'] == 'receipt':
+            if voucher.voucher_type == 'receipt':
                 # سند قبض - زيادة رصيد الحساب
                 cursor.execute('''
                     UPDATE accounts SET balance = balance + ? WHERE id = ?
-                ''', (voucher_data['amount'], voucher_data['account_id']))
+                ''', (voucher.amount, voucher.account_id))
             else:
                 # سند صرف - نقصان رصيد الحساب
                 cursor.execute('''
                     UPDATE accounts SET balance = balance - ? WHERE id = ?
-                ''', (voucher_data['amount'], voucher_data['account_id']))
+                ''', (voucher.amount, voucher.account_id))
             
             # تسجيل الحركة النقدية إذا كان الحساب نقدياً
-            cursor.execute('SELECT name FROM accounts WHERE id = ?', (voucher_data['account_id'],))
+            cursor.execute('SELECT name FROM accounts WHERE id = ?', (voucher.account_id,))
             account_name = cursor.fetchone()[0]
             
+            events = []
             if 'نقد' in account_name or 'صندوق' in account_name:
-                transaction_type = 'income' if voucher_data['voucher_type'] == 'receipt' else 'expense'
-                self.updateCashBalance(voucher_data['amount'], transaction_type, voucher_data.get('description', ''))
+                transaction_type = 'income' if voucher.voucher_type == 'receipt' else 'expense'
+                cursor.execute('''
+                    INSERT INTO cash_transactions (amount, type, description)
+                    VALUES (?, ?, ?)
+                ''', (voucher.amount, transaction_type, voucher.description))
+                if self.events.subscriber_count:
+                    delta = voucher.amount if transaction_type == 'income' else -voucher.amount
+                    events.append(self._cashEvent(cursor, delta, 'voucher', voucher_number))
             
             conn.commit()
+            self.reportCache.invalidate('vouchers', 'accounts', 'cash_transactions')
+            self._publishEvents(events)
             
             return {
                 'success': True,
@@ -966,7 +1486,7 @@ class POSBackend:
         prefix = 'RCV' if voucher_type == 'receipt' else 'PAY'
         date_str = datetime.now().strftime('%Y%m%d')
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -981,7 +1501,7 @@ class POSBackend:
     
     def getVouchersByType(self, voucher_type, start_date=None, end_date=None):
         """جلب السندات حسب النوع"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         query = '''
@@ -999,15 +1519,9 @@ class POSBackend:
         query += " ORDER BY v.created_at DESC"
         
         cursor.execute(query, params)
-        results = cursor.fetchall()
+        vouchers = Voucher.fetchall(cursor)
         conn.close()
         
-        vouchers = []
-        for row in results:
-            voucher = dict(zip([column[0] for column in cursor.description], row))
-            voucher['amount'] = float(voucher['amount'])
-            vouchers.append(voucher)
-        
         return vouchers
     
     def processReceiptVoucher(self, voucher_data):
@@ -1021,8 +1535,17 @@ class POSBackend:
         return self.createVoucher(voucher_data)
     
     def generateFinancialReport(self, start_date, end_date):
-        """تقرير مالي شامل"""
-        conn = sqlite3.connect(self.db_path)
+        """تقرير مالي شامل
+        
+        النتيجة مخزنة مؤقتاً لكل فترة حتى الكتابة التالية على الفواتير أو السندات
+        أو الحسابات؛ report_date هو وقت حساب التقرير.
+        """
+        return self.reportCache.get_or_compute(
+            'financial_report', (start_date, end_date), self.FINANCIAL_REPORT_TABLES,
+            lambda: self._computeFinancialReport(start_date, end_date))
+    
+    def _computeFinancialReport(self, start_date, end_date):
+        conn = self._connect()
         cursor = conn.cursor()
         
         # الإيرادات
@@ -1063,6 +1586,13 @@ class POSBackend:
         ''', (start_date, end_date))
         credit_sales = cursor.fetchone()[0]
         
+        # الأيام المؤرشفة تُحتسب من الملخص اليومي دون فتح ملفات الأرشيف
+        archived = archive_manager.summary_totals(cursor, start_date, end_date)
+        total_revenue += archived['revenue']
+        total_expenses += archived['expenses']
+        cash_sales += archived['cash_sales']
+        credit_sales += archived['credit_sales']
+        
         conn.close()
         
         return {
@@ -1076,9 +1606,443 @@ class POSBackend:
             'report_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
     
+    # =========================================================================
+    # تحليلات المبيعات حسب المنتج
+    # =========================================================================
+    
+    def _productSales(self, start_date, end_date):
+        """مجاميع مبيعات كل منتج في الفترة (DataFrame مشترك: لا يُعدل)"""
+        def load():
+            connections = [self._connect()]
+            try:
+                for _, path in archive_manager.archives_for_range(self.archive_dir, start_date, end_date):
+                    connections.append(archive_manager.open_archive(path))
+                return sales_analytics.load_product_sales(connections, start_date, end_date)
+            finally:
+                for conn in connections:
+                    conn.close()
+        
+        return self.reportCache.get_or_compute('product_sales', (start_date, end_date),
+                                               self.PRODUCT_SALES_TABLES, load)
+    
+    def _analyticsProducts(self):
+        def load():
+            conn = self._connect()
+            try:
+                return sales_analytics.load_products(conn)
+            finally:
+                conn.close()
+        
+        return self.reportCache.get_or_compute('analytics_products', (), self.ANALYTICS_PRODUCT_TABLES, load)
+    
+    def getTopProducts(self, start_date, end_date, limit=20, by='revenue'):
+        """أعلى المنتجات مبيعاً في الفترة حسب الإيراد أو الكمية"""
+        return sales_analytics.top_products(self._productSales(start_date, end_date),
+                                            self._analyticsProducts(), limit, by)
+    
+    def getABCAnalysis(self, start_date, end_date, a_share=0.8, b_share=0.95):
+        """تصنيف ABC للمنتجات حسب مساهمتها في إيراد الفترة"""
+        return sales_analytics.abc_classification(self._productSales(start_date, end_date),
+                                                  self._analyticsProducts(), a_share, b_share)
+    
+    def getProductVelocity(self, start_date, end_date, sort='days_of_cover', limit=100, offset=0):
+        """معدل البيع ونسبة التصريف وأيام تغطية المخزون لكل منتج نشط"""
+        return sales_analytics.velocity_report(self._productSales(start_date, end_date),
+                                               self._analyticsProducts(),
+                                               sales_analytics.period_days(start_date, end_date),
+                                               sort, limit, offset)
+    
+    # =========================================================================
+    # اقتراحات إعادة الطلب
+    # =========================================================================
+    
+    def _reorderFrame(self):
+        def load():
+            conn = self._connect()
+            try:
+                return reorder_engine.load_demand(conn)
+            finally:
+                conn.close()
+        
+        return self.reportCache.get_or_compute('reorder_demand', (), self.REORDER_TABLES, load)
+    
+    def getReorderSuggestions(self, lead_days=None, review_days=None, service_z=None,
+                              limit=100, offset=0, include_all=False):
+        """قائمة اقتراحات الشراء للمنتجات التي بلغت نقطة إعادة الطلب
+        
+        المعاملات غير المحددة تُقرأ من الإعدادات (reorder_lead_days، reorder_review_days،
+        reorder_service_z) ثم القيم الافتراضية.
+        """
+        settings = self.loadSettings()
+        lead_days = float(lead_days if lead_days is not None else
+                          settings.get('reorder_lead_days', reorder_engine.DEFAULT_LEAD_DAYS))
+        review_days = float(review_days if review_days is not None else
+                            settings.get('reorder_review_days', reorder_engine.DEFAULT_REVIEW_DAYS))
+        service_z = float(service_z if service_z is not None else
+                          settings.get('reorder_service_z', reorder_engine.DEFAULT_SERVICE_Z))
+        if lead_days < 0 or review_days < 0 or service_z < 0:
+            raise ValueError('مدة التوريد وفترة المراجعة ومعامل الأمان يجب ألا تكون سالبة')
+        
+        frame = reorder_engine.suggestions(self._reorderFrame(), self.demandSmoothing,
+                                           lead_days, review_days, service_z, include_all=include_all)
+        return {
+            'parameters': {'lead_days': lead_days, 'review_days': review_days, 'service_z': service_z,
+                           'smoothing': round(self.demandSmoothing, 4)},
+            'total': len(frame),
+            'estimated_cost': float(frame['estimated_cost'].sum()),
+            'products': reorder_engine.to_records(frame, limit, offset),
+        }
+    
+    def rebuildDemand(self):
+        """إعادة حساب الطلب اليومي لجميع المنتجات من سجل المبيعات"""
+        conn = self._connect(timeout=30)
+        try:
+            products = reorder_engine.rebuild(conn, self.demandSmoothing)
+            conn.commit()
+            self.reportCache.invalidate('product_demand')
+            return {'success': True, 'products': products}
+        except Exception as e:
+            conn.rollback()
+            return {'success': False, 'error': str(e)}
+        finally:
+            conn.close()
+    
+    # =========================================================================
+    # تقارير هامش الربح
+    # =========================================================================
+    
+    def getMarginReport(self, start_date, end_date, group_by='product', limit=None, offset=0):
+        """هامش الربح الإجمالي للفترة حسب المنتج أو الفئة أو اليوم (من الملخص اليومي)"""
+        def compute():
+            conn = self._connect()
+            try:
+                cursor = conn.cursor()
+                return {
+                    'totals': margin_reports.totals(cursor, start_date, end_date),
+                    'rows': margin_reports.report(cursor, start_date, end_date, group_by, limit, offset),
+                }
+            finally:
+                conn.close()
+        
+        return self.reportCache.get_or_compute('margin_report', (start_date, end_date, group_by, limit, offset),
+                                               self.MARGIN_TABLES, compute)
+    
+    def getMarginSummary(self):
+        """هامش اليوم والشهر الحالي حتى اليوم"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        month_start = today[:8] + '01'
+        
+        def compute():
+            conn = self._connect()
+            try:
+                cursor = conn.cursor()
+                return {
+                    'today': margin_reports.totals(cursor, today, today),
+                    'month_to_date': {'start_date': month_start,
+                                      **margin_reports.totals(cursor, month_start, today)},
+                }
+            finally:
+                conn.close()
+        
+        return self.reportCache.get_or_compute('margin_summary', (today,), ('daily_margin',), compute)
+    
+    # =========================================================================
+    # المشتريات وتسويات المخزون وتقييمه
+    # =========================================================================
+    
+    def processPurchase(self, purchase_data):
+        """تسجيل فاتورة شراء: زيادة المخزون وإعادة موازنة التكلفة المتوسطة لكل بند
+        
+        unit_price في البنود هو تكلفة شراء الوحدة، ويصبح سعر الشراء الأخير للمنتج.
+        الشراء الآجل يضاف لرصيد المورد (supplier_id) إن وجد.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            invoice = Invoice.from_dict(purchase_data)
+            if not invoice.items:
+                raise ValueError('فاتورة الشراء يجب أن تحتوي على بنود')
+            
+            cursor.execute('BEGIN IMMEDIATE')
+            self._requireActiveProducts(cursor, [item.product_id for item in invoice.items])
+            self._snapshotStockIfDue(cursor)
+            invoice_number = self.generateInvoiceNumber('purchase', cursor)
+            cursor.execute('''
+                INSERT INTO invoices 
+                (invoice_number, total_amount, paid_amount, remaining_amount, type, status, notes, created_at)
+                VALUES (?, ?, ?, ?, 'purchase', 'completed', ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ''', (invoice_number, invoice.total_amount, invoice.paid_amount, invoice.remaining_amount,
+                  invoice.notes, invoice.created_at))
+            invoice_id = cursor.lastrowid
+            
+            cursor.executemany('''
+                INSERT INTO invoice_items 
+                (invoice_id, product_id, product_name, quantity, unit_price, total_price, unit_cost)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(invoice_id,) + item.to_row(self.INVOICE_ITEM_COLUMNS) + (item.unit_price,)
+                  for item in invoice.items])
+            
+            cursor.executemany(inventory_valuation.RECEIVE_STOCK_SQL, [
+                {'product_id': item.product_id, 'quantity': item.quantity, 'unit_cost': item.unit_price}
+                for item in invoice.items])
+            stock_ledger.record_invoice(cursor, invoice_id, 'purchase', 1)
+            cursor.executemany('UPDATE products SET purchase_price = ? WHERE id = ?',
+                               [(item.unit_price, item.product_id) for item in invoice.items])
+            
+            if invoice.paid_amount:
+                self.updateCashBalance(invoice.paid_amount, 'expense', f'شراء - فاتورة {invoice_number}', cursor)
+            supplier_id = purchase_data.get('supplier_id')
+            if invoice.remaining_amount and supplier_id:
+                cursor.execute('UPDATE suppliers SET balance = balance + ? WHERE id = ?',
+                               (invoice.remaining_amount, supplier_id))
+            
+            product_ids = [item.product_id for item in invoice.items]
+            stock_changes = self._refreshStockAlerts(cursor, product_ids)
+            events = self._stockEvents(cursor, product_ids, 'purchase')
+            conn.commit()
+            self.invalidateProductCaches()
+            self.reportCache.invalidate(*self.PURCHASE_TABLES)
+            self._publishStockAlerts(stock_changes)
+            self._publishEvents(events)
+            return {'success': True, 'invoice_id': invoice_id, 'invoice_number': invoice_number}
+            
+        except Exception as e:
+            conn.rollback()
+            return {'success': False, 'error': str(e)}
+        finally:
+            conn.close()
+    
+    def adjustStock(self, adjustments, reason=None):
+        """تسويات مخزون (فروقات جرد، تالف، إضافة يدوية) في معاملة واحدة
+        
+        adjustments: [{'product_id', 'quantity' (موجبة للإضافة وسالبة للخصم), 'unit_cost' اختيارية}]
+        الإضافة بتكلفة محددة تعيد موازنة التكلفة المتوسطة، وبدونها تُقيّم بالتكلفة الحالية.
+        reason يُحفظ كملاحظة على حركات المخزون.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            rows = []
+            for adjustment in adjustments:
+                quantity = float(adjustment['quantity'])
+                unit_cost = adjustment.get('unit_cost')
+                rows.append({'product_id': int(adjustment['product_id']), 'quantity': quantity,
+                             'unit_cost': float(unit_cost) if unit_cost is not None and quantity > 0 else None})
+            
+            cursor.execute('BEGIN IMMEDIATE')
+            self._requireActiveProducts(cursor, [row['product_id'] for row in rows])
+            self._snapshotStockIfDue(cursor)
+            stock_ledger.record(cursor, rows, 'adjustment', note=reason)
+            # بالترتيب المرسل: المخزون قبل كل إضافة يحدد وزن تكلفتها في المتوسط
+            for row in rows:
+                if row['unit_cost'] is not None:
+                    cursor.execute(inventory_valuation.RECEIVE_STOCK_SQL, row)
+                else:
+                    cursor.execute('''
+                        UPDATE products SET stock_quantity = stock_quantity + :quantity,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE id = :product_id
+                    ''', row)
+            
+            product_ids = [row['product_id'] for row in rows]
+            stock_changes = self._refreshStockAlerts(cursor, product_ids)
+            events = self._stockEvents(cursor, product_ids, 'adjustment')
+            conn.commit()
+            self.invalidateProductCaches()
+            self._publishStockAlerts(stock_changes)
+            self._publishEvents(events)
+            return {'success': True, 'adjusted': len(rows)}
+            
+        except Exception as e:
+            conn.rollback()
+            return {'success': False, 'error': str(e)}
+        finally:
+            conn.close()
+    
+    def _requireActiveProducts(self, cursor, product_ids):
+        """رفض العملية إذا كان أحد المنتجات غير موجود أو غير نشط (قبل أي كتابة)"""
+        product_ids = set(product_ids)
+        cursor.execute(f'''
+            SELECT id FROM products WHERE id IN ({','.join('?' * len(product_ids))}) AND is_active = 1
+        ''', list(product_ids))
+        unknown = product_ids - {row[0] for row in cursor.fetchall()}
+        if unknown:
+            raise ValueError(f'منتجات غير موجودة أو غير نشطة: {sorted(unknown)}')
+    
+    def getInventoryValuation(self):
+        """قيمة المخزون بالتكلفة المتوسطة المرجحة لكل فئة وإجمالاً"""
+        conn = self._connect()
+        try:
+            return inventory_valuation.by_category(conn.cursor())
+        finally:
+            conn.close()
+    
+    def _snapshotStockIfDue(self, cursor):
+        """لقطة المخزون الدورية لنهاية أمس ضمن معاملة الكتابة الحالية
+        
+        موعد اللقطة التالية محفوظ في الذاكرة، فلا يُستعلم عنه إلا مرة عند حلوله.
+        التواريخ بتوقيت UTC مثل CURRENT_TIMESTAMP في moved_at.
+        """
+        today = datetime.utcnow().date()
+        if self._nextStockSnapshot is not None and today < self._nextStockSnapshot:
+            return
+        yesterday = today - timedelta(days=1)
+        last = stock_ledger.last_snapshot(cursor)
+        if last is None or date.fromisoformat(last) + timedelta(days=self.stockSnapshotDays) <= yesterday:
+            stock_ledger.take_snapshot(cursor, yesterday.isoformat())
+            last = yesterday.isoformat()
+        self._nextStockSnapshot = date.fromisoformat(last) + timedelta(days=self.stockSnapshotDays + 1)
+    
+    def snapshotStock(self, day=None):
+        """أخذ لقطة رصيد نهاية يوم (الافتراضي أمس) يدوياً"""
+        day = day or (datetime.utcnow().date() - timedelta(days=1)).isoformat()
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            result = stock_ledger.take_snapshot(cursor, date.fromisoformat(day[:10]).isoformat())
+            conn.commit()
+            return {'success': True, **result}
+            
+        except Exception as e:
+            conn.rollback()
+            return {'success': False, 'error': str(e)}
+        finally:
+            conn.close()
+    
+    def getStockOnDate(self, day, product_ids=None):
+        """رصيد المنتجات في نهاية يوم سابق (آخر لقطة + الحركات بعدها)"""
+        day = date.fromisoformat(day[:10]).isoformat()
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            balances, base_day = stock_ledger.stock_on(cursor, day, product_ids)
+            return {
+                'date': day,
+                'base_snapshot': base_day,
+                'products': [{'product_id': product_id, 'quantity': quantity}
+                             for product_id, quantity in sorted(balances.items())],
+            }
+        finally:
+            conn.close()
+    
+    def getStockMovements(self, product_id, start_date, end_date):
+        """حركات منتج في الفترة مع الرصيد بعد كل حركة"""
+        conn = self._connect()
+        try:
+            return stock_ledger.history(conn.cursor(), product_id, start_date, end_date)
+        finally:
+            conn.close()
+    
+    def getStockDrift(self, limit=100):
+        """المنتجات التي لا يطابق مخزونها مجموع حركاتها"""
+        conn = self._connect()
+        try:
+            return stock_ledger.drift(conn.cursor(), limit)
+        finally:
+            conn.close()
+    
+    # =========================================================================
+    # الجرد الفعلي
+    # =========================================================================
+    
+    def createStocktake(self, note=None, created_by=None):
+        """فتح جلسة جرد جديدة"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            session_id = stocktake.create_session(cursor, note, created_by)
+            conn.commit()
+            return {'success': True, 'session': stocktake.get_session(cursor, session_id)}
+            
+        except Exception as e:
+            conn.rollback()
+            return {'success': False, 'error': str(e)}
+        finally:
+            conn.close()
+    
+    def getStocktake(self, session_id):
+        conn = self._connect()
+        try:
+            return stocktake.get_session(conn.cursor(), session_id)
+        finally:
+            conn.close()
+    
+    def addStocktakeCounts(self, session_id, counts, mode='add'):
+        """إضافة دفعة من الكميات الممسوحة إلى جلسة جرد مفتوحة (معاملة واحدة للدفعة)"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            result = stocktake.stage_counts(cursor, session_id, counts, mode)
+            conn.commit()
+            return {'success': True, **result}
+            
+        except Exception as e:
+            conn.rollback()
+            return {'success': False, 'error': str(e)}
+        finally:
+            conn.close()
+    
+    def getStocktakeVariances(self, session_id, zero_uncounted=False, limit=100, offset=0):
+        """فروقات الجلسة مقابل المخزون الحالي"""
+        conn = self._connect()
+        try:
+            return stocktake.variances(conn.cursor(), session_id, zero_uncounted, limit, offset)
+        finally:
+            conn.close()
+    
+    def applyStocktake(self, session_id, zero_uncounted=False):
+        """اعتماد الجرد: ضبط المخزون وتسجيل الحركات لجميع الفروقات في معاملة واحدة
+        
+        zero_uncounted: جرد كامل، المنتجات النشطة التي لم تُعد يصبح مخزونها صفراً.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            self._snapshotStockIfDue(cursor)
+            summary = stocktake.summary(cursor, session_id, zero_uncounted)
+            product_ids = stocktake.apply(cursor, session_id, zero_uncounted)
+            stock_changes = self._refreshStockAlerts(cursor, product_ids)
+            events = self._stockEvents(cursor, product_ids, 'stocktake')
+            conn.commit()
+            if product_ids:
+                self.invalidateProductCaches()
+            self._publishStockAlerts(stock_changes)
+            self._publishEvents(events)
+            return {'success': True, 'adjusted': len(product_ids), **summary}
+            
+        except Exception as e:
+            conn.rollback()
+            return {'success': False, 'error': str(e)}
+        finally:
+            conn.close()
+    
+    def cancelStocktake(self, session_id):
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            stocktake.close_session(cursor, session_id, 'cancelled')
+            conn.commit()
+            return {'success': True}
+            
+        except Exception as e:
+            conn.rollback()
+            return {'success': False, 'error': str(e)}
+        finally:
+            conn.close()
+    
     def getCustomerBalances(self):
         """أرصدة العملاء"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1104,7 +2068,7 @@ class POSBackend:
     
     def getSupplierBalances(self):
         """أرصدة الموردين"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1128,6 +2092,144 @@ class POSBackend:
         
         return suppliers
     
+    # =========================================================================
+    # النسخ الاحتياطي والاستعادة
+    # =========================================================================
+    
+    def streamBackup(self):
+        """نسخة احتياطية مضغوطة كمولد دفعات للإرسال المباشر للعميل"""
+        return backup_manager.stream_backup(self.db_path)
+    
+    def createBackup(self):
+        """حفظ نسخة احتياطية كاملة مضغوطة في مجلد النسخ المحلي"""
+        return backup_manager.write_backup(self.db_path, self.backup_dir)
+    
+    def createIncrementalBackup(self):
+        """حفظ نسخة تزايدية بالصفوف المتغيرة منذ آخر نسخة"""
+        return backup_manager.write_incremental_backup(self.db_path, self.backup_dir)
+    
+    def listBackups(self):
+        """قائمة النسخ الاحتياطية المحلية"""
+        return backup_manager.list_backups(self.backup_dir)
+    
+    def restoreBackup(self, backup_path=None, filename=None, incrementals=None):
+        """استعادة قاعدة البيانات من ملف نسخة احتياطية أو من نسخة محلية بالاسم
+        
+        incrementals: أسماء النسخ التزايدية المحلية لإعادة تطبيقها بالترتيب بعد النسخة الكاملة
+        """
+        try:
+            if filename:
+                backup_path = backup_manager.resolve_backup(self.backup_dir, filename)
+            
+            if incrementals:
+                incremental_paths = [backup_manager.resolve_backup(self.backup_dir, name) for name in incrementals]
+                backup_manager.restore_chain(self.db_path, backup_path, incremental_paths,
+                                             migrate=self._migrateDatabaseFile)
+                # الجداول المشتقة لا تُسجل في النسخ التزايدية، فتُعاد من البنود المستعادة
+                self._rebuildSalesRollups()
+            else:
+                backup_manager.restore_database(self.db_path, backup_path)
+            
+            # النسخ القديمة قد لا تحتوي على الجداول الأحدث
+            self.initDatabase()
+            self.invalidateProductCaches()
+            self.reportCache.invalidate()
+            return {'success': True, 'message': 'تم استعادة النسخة الاحتياطية بنجاح'}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def _migrateDatabaseFile(self, path):
+        """ترحيل مخطط ملف قاعدة بيانات آخر (نسخة قيد الاستعادة) إلى المخطط الحالي"""
+        # الإنشاء يشغّل initDatabase على الملف
+        type(self)(path, backup_dir=self.backup_dir, archive_dir=self.archive_dir)
+    
+    def _rebuildSalesRollups(self):
+        """إعادة بناء الطلب اليومي وملخص الهامش من بنود البيع، وحذف لقطات المخزون لتُحسب من السجل"""
+        archives = archive_manager.list_archives(self.archive_dir)
+        start_day = f'{archives[-1][0] + 1:04d}-01-01' if archives else None
+        
+        conn = self._connect(timeout=30)
+        try:
+            reorder_engine.rebuild(conn, self.demandSmoothing)
+            margin_reports.rebuild(conn.cursor(), start_day)
+            # الحركات المستعادة قد تسبق لقطات النسخة الكاملة؛ اللقطات التالية تُؤخذ من السجل كاملاً
+            conn.execute('DELETE FROM stock_snapshots')
+            conn.commit()
+        finally:
+            conn.close()
+    
+    # =========================================================================
+    # أرشفة الفترات المغلقة
+    # =========================================================================
+    
+    def archiveClosedPeriods(self, keep_years=1, vacuum=False):
+        """نقل الفواتير والحركات والسندات للسنوات المغلقة إلى ملفات أرشيف سنوية
+        
+        keep_years: عدد السنوات التي تبقى في القاعدة الرئيسية (1 = السنة الحالية فقط).
+        vacuum: ضغط ملف القاعدة الرئيسية بعد النقل لاستعادة المساحة.
+        """
+        conn = self._connect(timeout=30)
+        conn.isolation_level = None
+        
+        try:
+            cutoff = archive_manager.current_cutoff_year(keep_years)
+            archived = {}
+            for year in archive_manager.archivable_years(conn, cutoff):
+                archived[year] = archive_manager.archive_year(conn, self.archive_dir, year)
+            
+            if archived and vacuum:
+                conn.execute('VACUUM')
+            
+            return {'success': True, 'cutoff_year': cutoff, 'archived': archived}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+        finally:
+            conn.close()
+            # السنوات التي نُقلت قبل أي خطأ تغيرت جداولها أيضاً
+            self.reportCache.invalidate(*archive_manager.ARCHIVED_TABLES, 'archive_daily_summary')
+    
+    def listArchives(self):
+        """ملفات الأرشيف السنوية وأحجامها"""
+        return [{'year': year, 'filename': os.path.basename(path), 'size': os.path.getsize(path)}
+                for year, path in archive_manager.list_archives(self.archive_dir)]
+    
+    def _archivedInvoices(self, invoice_type, start_date, end_date):
+        """فواتير الأرشيف للفترة المطلوبة (مع أسماء العملاء من القاعدة الرئيسية)"""
+        invoices = []
+        for _, path in archive_manager.archives_for_range(self.archive_dir, start_date, end_date):
+            query = 'SELECT * FROM invoices WHERE 1 = 1'
+            params = []
+            if invoice_type:
+                query += ' AND type = ?'
+                params.append(invoice_type)
+            if start_date:
+                query += ' AND created_at >= ?'
+                params.append(start_date)
+            if end_date:
+                query += " AND created_at < DATE(?, '+1 day')"
+                params.append(end_date)
+            
+            archive = archive_manager.open_archive(path)
+            try:
+                invoices.extend(Invoice.fetchall(archive.execute(query, params)))
+            finally:
+                archive.close()
+        
+        customer_ids = list({invoice.customer_id for invoice in invoices if invoice.customer_id})
+        names = {}
+        if customer_ids:
+            conn = self._connect()
+            cursor = conn.cursor()
+            for start in range(0, len(customer_ids), 500):
+                chunk = customer_ids[start:start + 500]
+                cursor.execute(f"SELECT id, name FROM customers WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+                names.update(cursor.fetchall())
+            conn.close()
+        
+        for invoice in invoices:
+            invoice.customer_name = names.get(invoice.customer_id)
+        return invoices
+    
     # =========================================================================
     # الوظائف الحالية (للحفاظ على التوافق)
     # =========================================================================
@@ -1138,7 +2240,7 @@ class POSBackend:
     
     def verify_user(self, username, password):
         """التحقق من صحة بيانات المستخدم"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1159,9 +2261,129 @@ class POSBackend:
             }
         return None
     
+    def getDashboardData(self):
+        """بيانات لوحة التحكم"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        # مبيعات اليوم (التاريخ المحلي كما في created_at)
+        today = datetime.now().strftime('%Y-%m-%d')
+        cursor.execute('''
+            SELECT COALESCE(SUM(total_amount), 0) FROM invoices
+            WHERE type = 'sale' AND created_at >= ? AND created_at < DATE(?, '+1 day')
+        ''', (today, today))
+        today_sales = float(cursor.fetchone()[0])
+        
+        # آخر 5 فواتير
+        cursor.execute('''
+            SELECT i.*, c.name as customer_name
+            FROM invoices i
+            LEFT JOIN customers c ON i.customer_id = c.id
+            ORDER BY i.id DESC
+            LIMIT 5
+        ''')
+        recent_invoices = Invoice.fetchall(cursor)
+        
+        cursor.execute('SELECT COUNT(*) FROM customers')
+        customers_count = cursor.fetchone()[0]
+        
+        # قيمة المخزون من المجاميع الجارية بالتكلفة المتوسطة
+        inventory_value = inventory_valuation.total_value(cursor)
+        conn.close()
+        
+        # تنبيهات المخزون من الفهرس المحدّث مع كل بيع بدلاً من فلترة الكتالوج
+        stock_alerts = self.getStockAlerts(per_page=20)
+        
+        return {
+            'today_sales': today_sales,
+            'today_purchases': 0,  # يمكن تطويره لاحقاً
+            'inventory_value': inventory_value,
+            'customers_count': customers_count,
+            'recent_invoices': recent_invoices,
+            'low_stock_products': stock_alerts['items'],
+            'low_stock_count': stock_alerts['total']
+        }
+    
+    def loadCustomers(self):
+        """جلب جميع العملاء"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT * FROM customers ORDER BY name')
+        customers = Customer.fetchall(cursor)
+        conn.close()
+        
+        return customers
+    
+    def saveCustomer(self, customer_data):
+        """حفظ عميل (إضافة أو تحديث)"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            values = (
+                customer_data['name'], customer_data.get('phone'), customer_data.get('email'),
+                customer_data.get('address'), customer_data.get('tax_number'), customer_data.get('notes')
+            )
+            if customer_data.get('id'):
+                cursor.execute('''
+                    UPDATE customers
+                    SET name=?, phone=?, email=?, address=?, tax_number=?, notes=?
+                    WHERE id=?
+                ''', values + (customer_data['id'],))
+            else:
+                cursor.execute('''
+                    INSERT INTO customers (name, phone, email, address, tax_number, notes)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', values)
+            
+            conn.commit()
+            return True
+            
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            conn.close()
+    
+    def loadSettings(self):
+        """جلب الإعدادات كقاموس (القيم مخزنة بصيغة JSON)"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT key, value FROM settings')
+        settings = {}
+        for key, value in cursor.fetchall():
+            try:
+                settings[key] = json.loads(value) if value is not None else None
+            except ValueError:
+                settings[key] = value
+        conn.close()
+        
+        return settings
+    
+    def saveSettings(self, settings_data):
+        """حفظ الإعدادات (تحديث المفاتيح الموجودة وإضافة الجديدة)"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.executemany('''
+                INSERT INTO settings (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            ''', [(key, json.dumps(value, ensure_ascii=False)) for key, value in settings_data.items()])
+            conn.commit()
+            return True
+            
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            conn.close()
+    
     def getAllProducts(self):
         """جلب جميع المنتجات"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1172,23 +2394,69 @@ class POSBackend:
             ORDER BY p.name
         ''')
         
-        results = cursor.fetchall()
+        products = Product.fetchall(cursor)
         conn.close()
         
-        return [dict(zip([column[0] for column in cursor.description], row)) for row in results]
+        return products
     
-    def saveProduct(self, product_data):
-        """حفظ منتج"""
-        conn = sqlite3.connect(self.db_path)
+    def getAllInvoices(self, invoice_type=None, start_date=None, end_date=None):
+        """جلب الفواتير (مع اسم العميل) مرتبة من الأقدم للأحدث
+        
+        عند تحديد فترة تشمل سنوات مؤرشفة تُضاف فواتير ملفات الأرشيف تلقائياً.
+        بدون فترة تُرجع فواتير القاعدة الرئيسية فقط.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        query = '''
+            SELECT i.*, c.name as customer_name
+            FROM invoices i
+            LEFT JOIN customers c ON i.customer_id = c.id
+            WHERE 1 = 1
+        '''
+        params = []
+        
+        if invoice_type:
+            query += " AND i.type = ?"
+            params.append(invoice_type)
+        if start_date:
+            query += " AND i.created_at >= ?"
+            params.append(start_date)
+        if end_date:
+            query += " AND i.created_at < DATE(?, '+1 day')"
+            params.append(end_date)
+        
+        query += " ORDER BY i.id"
+        
+        cursor.execute(query, params)
+        invoices = Invoice.fetchall(cursor)
+        conn.close()
+        
+        if start_date or end_date:
+            archived = self._archivedInvoices(invoice_type, start_date, end_date)
+            if archived:
+                invoices = sorted(archived + invoices, key=lambda invoice: invoice.id)
+        
+        return invoices
+    
+    def saveProduct(self, product_data, movement_type=None):
+        """حفظ منتج
+        
+        تغيّر المخزون يُسجل كحركة من نوع movement_type (الافتراضي edit للتعديل و opening للمنتج الجديد).
+        """
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
             if 'id' in product_data and product_data['id']:
+                stock_ledger.record_stock_change(cursor, product_data['id'], product_data.get('stock_quantity', 0),
+                                                 movement_type or 'edit')
                 cursor.execute('''
                     UPDATE products 
                     SET name=?, barcode=?, category_id=?, purchase_price=?, 
                         sale_price=?, stock_quantity=?, min_stock=?, unit=?, 
-                        description=?, image_url=?, updated_at=CURRENT_TIMESTAMP
+                        description=?, image_url=?, avg_cost=COALESCE(avg_cost, ?),
+                        updated_at=CURRENT_TIMESTAMP
                     WHERE id=?
                 ''', (
                     product_data['name'], product_data.get('barcode'), 
@@ -1196,23 +2464,56 @@ class POSBackend:
                     product_data['sale_price'], product_data.get('stock_quantity', 0),
                     product_data.get('min_stock', 0), product_data.get('unit', 'قطعة'),
                     product_data.get('description'), product_data.get('image_url'), 
-                    product_data['id']
+                    product_data.get('purchase_price', 0), product_data['id']
                 ))
+                product_id = product_data['id']
             else:
                 cursor.execute('''
                     INSERT INTO products 
                     (name, barcode, category_id, purchase_price, sale_price, 
-                     stock_quantity, min_stock, unit, description, image_url)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                     stock_quantity, min_stock, unit, description, image_url, avg_cost)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (
                     product_data['name'], product_data.get('barcode'), 
                     product_data.get('category_id'), product_data.get('purchase_price', 0),
                     product_data['sale_price'], product_data.get('stock_quantity', 0),
                     product_data.get('min_stock', 0), product_data.get('unit', 'قطعة'),
-                    product_data.get('description'), product_data.get('image_url')
+                    product_data.get('description'), product_data.get('image_url'),
+                    product_data.get('purchase_price', 0)
                 ))
+                product_id = cursor.lastrowid
+                stock_ledger.record(cursor, [{'product_id': product_id,
+                                              'quantity': product_data.get('stock_quantity', 0)}],
+                                    movement_type or 'opening')
+            
+            stock_changes = self._refreshStockAlerts(cursor, [product_id])
+            events = self._stockEvents(cursor, [product_id], 'product')
+            conn.commit()
+            self.invalidateProductCaches()
+            self._publishStockAlerts(stock_changes)
+            self._publishEvents(events)
+            return True
             
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            conn.close()
+    
+    def deactivateProduct(self, product_id):
+        """إيقاف المنتج (حذف منطقي) وإزالته من تنبيهات المخزون"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                UPDATE products SET is_active = 0, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (product_id,))
+            stock_changes = self._refreshStockAlerts(cursor, [product_id])
             conn.commit()
+            self.invalidateProductCaches()
+            self._publishStockAlerts(stock_changes)
             return True
             
         except Exception as e:
@@ -1221,21 +2522,32 @@ class POSBackend:
         finally:
             conn.close()
     
-    def generateInvoiceNumber(self, invoice_type='sale'):
-        """إنشاء رقم فاتورة تلقائي"""
+    def generateInvoiceNumber(self, invoice_type='sale', cursor=None):
+        """إنشاء رقم فاتورة تلقائي
+        
+        عند تمرير cursor يتم العد ضمن معاملة المستدعي، فتُحتسب الفواتير غير المؤكدة بعد
+        (مثل المبيعات السابقة في نفس الدفعة).
+        """
         prefix = 'S' if invoice_type == 'sale' else 'P'
         date_str = datetime.now().strftime('%Y%m%d')
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn = None
+        if cursor is None:
+            conn = self._connect()
+            cursor = conn.cursor()
         
+        # آخر رقم لنفس اليوم عبر فهرس invoice_number (GLOB يستخدم الفهرس بخلاف LIKE)،
+        # فلا يتكرر الرقم حتى لو كان تاريخ الفاتورة مختلفاً (مبيعات مؤجلة من نقاط غير متصلة).
+        # المقارنة رقمية لأن التسلسل قد يتجاوز 4 خانات ('...10000' < '...9999' نصياً)
         cursor.execute('''
-            SELECT COUNT(*) FROM invoices 
-            WHERE invoice_number LIKE ? AND DATE(created_at) = DATE('now')
-        ''', (f'{prefix}{date_str}%',))
+            SELECT MAX(CAST(SUBSTR(invoice_number, ?) AS INTEGER)) FROM invoices 
+            WHERE invoice_number GLOB ?
+        ''', (len(prefix) + len(date_str) + 1, f'{prefix}{date_str}[0-9]*'))
         
-        count = cursor.fetchone()[0] + 1
-        conn.close()
+        last_number = cursor.fetchone()[0]
+        count = last_number + 1 if last_number else 1
+        if conn is not None:
+            conn.close()
         
         return f'{prefix}{date_str}{count:04d}'
     
@@ -1244,6 +2556,9 @@ class POSBackend:
         # التنفيذ الحالي - يمكن تحديثه ليتناسب مع النظام الجديد
         pass
 
+# قياس زمن الاستعلامات لكل دالة عامة في الواجهة الخلفية
+instrument_methods(POSBackend)
+
 # إنشاء كائن النظام
 pos_system = POSBackend()
 
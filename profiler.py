@@ -0,0 +1,186 @@
+"""تحليل أداء طلب واحد عند الطلب (للمدير فقط)
+
+يُفعّل لكل طلب على حدة بالترويسة X-Profile أو بالمعامل ?_profile=، وبشرط أن
+تكون الجلسة لمستخدم بدور admin:
+    cprofile  تحليل حتمي بـ cProfile ويُحفظ بصيغة pstats
+    sample    تحليل بأخذ العينات (كل مللي ثانية) ويُحفظ بصيغة collapsed stacks
+              المناسبة لأدوات flamegraph
+
+يُحفظ الملف مع ملف JSON يصف المسار والمعاملات والمدة، ويُعاد معرف التحليل في
+الترويسة X-Profile-Id. عند عدم طلب التحليل لا يُضاف سوى فحص الترويسة، وعند
+تعطيله (POS_PROFILER=0) لا يتم تسجيل أي دالة على التطبيق إطلاقاً.
+"""
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request, session
+
+PROFILE_MODES = ('cprofile', 'sample')
+PROFILE_EXTENSIONS = {'cprofile': '.pstats', 'sample': '.collapsed'}
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{8}_[0-9]{6}_[0-9a-f]{8}$')
+
+# cProfile لا يدعم أكثر من محلل نشط في نفس الوقت بشكل موثوق
+_cprofile_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """أخذ عينات من مكدس خيط معين على فترات ثابتة وتجميعها كـ collapsed stacks"""
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def _requested_mode():
+    mode = request.headers.get('X-Profile') or request.args.get('_profile')
+    if not mode:
+        return None
+    mode = mode.lower()
+    return mode if mode in PROFILE_MODES else 'cprofile'
+
+
+def init_profiler(app, profile_dir):
+    """تسجيل دوال التحليل على التطبيق (إلا إذا كان POS_PROFILER=0)"""
+    app.config.setdefault('PROFILER_ENABLED', os.environ.get('POS_PROFILER', '1') not in ('0', 'false', 'no'))
+    app.config.setdefault('PROFILE_DIR', profile_dir)
+    if not app.config['PROFILER_ENABLED']:
+        return
+
+    @app.before_request
+    def start_profile():
+        mode = _requested_mode()
+        if mode is None or session.get('role') != 'admin':
+            return
+
+        if mode == 'cprofile':
+            if not _cprofile_lock.acquire(blocking=False):
+                g._profile = None
+                return
+            profile = cProfile.Profile()
+            profile.enable()
+        else:
+            profile = SamplingProfiler(threading.get_ident())
+            profile.start()
+        g._profile = (mode, profile, time.perf_counter())
+
+    @app.after_request
+    def finish_profile(response):
+        if '_profile' not in g:
+            return response
+
+        state = g.pop('_profile')
+        if state is None:
+            response.headers['X-Profile'] = 'busy'
+            return response
+
+        mode, profile, start = state
+        if mode == 'cprofile':
+            profile.disable()
+            _cprofile_lock.release()
+        else:
+            profile.stop()
+
+        profile_id = save_profile(app.config['PROFILE_DIR'], mode, profile, {
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'path': request.path,
+            'args': {key: value for key, value in request.args.items() if key != '_profile'},
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            'user': session.get('username'),
+        })
+        response.headers['X-Profile'] = mode
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    @app.teardown_request
+    def abort_profile(exc):
+        # استثناء غير معالج منع after_request: إيقاف المحلل دون حفظ
+        state = g.pop('_profile', None)
+        if state is None:
+            return
+        mode, profile, _ = state
+        if mode == 'cprofile':
+            profile.disable()
+            _cprofile_lock.release()
+        else:
+            profile.stop()
+
+
+def save_profile(profile_dir, mode, profile, meta):
+    """حفظ نتيجة التحليل وملف الوصف، وإرجاع معرف التحليل"""
+    os.makedirs(profile_dir, exist_ok=True)
+    profile_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    path = os.path.join(profile_dir, profile_id + PROFILE_EXTENSIONS[mode])
+
+    if mode == 'cprofile':
+        profile.dump_stats(path)
+    else:
+        profile.write(path)
+        meta['samples'] = profile.samples
+
+    meta.update({'id': profile_id, 'mode': mode, 'file': os.path.basename(path), 'created_at': time.time()})
+    with open(os.path.join(profile_dir, profile_id + '.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return profile_id
+
+
+def list_profiles(profile_dir):
+    """قائمة التحليلات المحفوظة (الأحدث أولاً)"""
+    if not os.path.isdir(profile_dir):
+        return []
+    profiles = []
+    for name in os.listdir(profile_dir):
+        if name.endswith('.json') and PROFILE_ID_PATTERN.match(name[:-5]):
+            with open(os.path.join(profile_dir, name), encoding='utf-8') as f:
+                profiles.append(json.load(f))
+    profiles.sort(key=lambda meta: meta['created_at'], reverse=True)
+    return profiles
+
+
+def resolve_profile(profile_dir, profile_id):
+    """مسار ملف التحليل لمعرف صالح، أو None"""
+    if not PROFILE_ID_PATTERN.match(profile_id or ''):
+        return None
+    for extension in PROFILE_EXTENSIONS.values():
+        path = os.path.join(profile_dir, profile_id + extension)
+        if os.path.exists(path):
+            return path
+    return None
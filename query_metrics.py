@@ -0,0 +1,419 @@
+"""قياس زمن استعلامات SQLite داخل POSBackend
+
+كل استعلام يُسجل بزمنه (التنفيذ + جلب الصفوف) وعدد صفوفه وبصمته (نص الاستعلام
+بعد توحيد المسافات واستبدال القيم الحرفية)، ويُنسب إلى دالة الواجهة الخلفية التي
+نفذته (processSale، searchProducts، ...). الاستعلامات التي تتجاوز حد البطء تُحفظ
+في سجل محدود الحجم مع خطة التنفيذ (EXPLAIN QUERY PLAN).
+
+التفعيل عبر متغيرات البيئة:
+    POS_QUERY_METRICS=0       لإيقاف القياس بالكامل (الاتصالات تعود لـ sqlite3 العادية)
+    POS_SLOW_QUERY_MS=100     حد الاستعلام البطيء بالمللي ثانية
+"""
+import bisect
+import functools
+import inspect
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# حدود فئات المدرج التكراري بالثواني
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# عبارات لا فائدة من طلب خطة تنفيذ لها
+_NO_PLAN_PREFIXES = ('BEGIN', 'COMMIT', 'END', 'ROLLBACK', 'SAVEPOINT', 'RELEASE',
+                     'PRAGMA', 'CREATE', 'DROP', 'ALTER', 'ATTACH', 'DETACH', 'VACUUM', 'ANALYZE')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+class Histogram:
+    """مدرج تكراري تراكمي بحدود ثابتة (متوافق مع صيغة Prometheus)"""
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """تقدير تقريبي للمئين من حدود الفئات"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def cumulative(self):
+        """أزواج (الحد الأعلى، العدد التراكمي) مع +Inf في النهاية"""
+        total = 0
+        result = []
+        for bound, bucket_count in zip(self.bounds + (float('inf'),), self.counts):
+            total += bucket_count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum_ms': round(self.sum * 1000, 3),
+            'avg_ms': round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 3),
+            'p95_ms': round(self.quantile(0.95) * 1000, 3),
+            'p99_ms': round(self.quantile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+            'buckets': {('+Inf' if bound == float('inf') else f'{bound * 1000:g}ms'): count
+                        for bound, count in self.cumulative()},
+        }
+
+
+_fingerprints = {}
+
+
+def fingerprint(sql):
+    """توحيد نص الاستعلام بحيث تتجمع الاستعلامات المتشابهة تحت بصمة واحدة"""
+    cached = _fingerprints.get(sql)
+    if cached is not None:
+        return cached
+
+    text = _STRING_LITERAL.sub('?', sql)
+    text = _NUMBER_LITERAL.sub('?', text)
+    text = _WHITESPACE.sub(' ', text).strip()
+    text = _IN_LIST.sub('IN (...)', text)
+
+    if len(_fingerprints) < 4096:
+        _fingerprints[sql] = text
+    return text
+
+
+class QueryMetrics:
+    """تجميع أزمنة الاستعلامات حسب الدالة وحسب بصمة الاستعلام"""
+
+    def __init__(self, enabled=True, slow_threshold=0.1, slow_log_size=100, db_path=None):
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.db_path = db_path
+        self._slow_log = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    @classmethod
+    def from_env(cls, db_path=None):
+        return cls(
+            enabled=os.environ.get('POS_QUERY_METRICS', '1') not in ('0', 'false', 'no'),
+            slow_threshold=float(os.environ.get('POS_SLOW_QUERY_MS', '100')) / 1000,
+            db_path=db_path,
+        )
+
+    def reset(self):
+        with self._lock:
+            self._methods = {}
+            self._queries = {}
+            self._slow_log.clear()
+            self._started = time.time()
+
+    # ---------------------------------------------------------------------
+    # نسب الاستعلامات إلى دوال الواجهة الخلفية
+    # ---------------------------------------------------------------------
+
+    @property
+    def current_operation(self):
+        stack = getattr(self._local, 'stack', None)
+        return stack[0] if stack else None
+
+    @contextmanager
+    def operation(self, name):
+        """تحديد الدالة الحالية؛ الاستدعاءات المتداخلة تُنسب إلى الدالة الخارجية"""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stack.pop()
+            if not stack:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self._method(name)['calls'].observe(elapsed)
+
+    def _method(self, name):
+        stats = self._methods.get(name)
+        if stats is None:
+            stats = self._methods[name] = {
+                'calls': Histogram(),
+                'queries': Histogram(),
+                'rows': 0,
+            }
+        return stats
+
+    # ---------------------------------------------------------------------
+    # التسجيل
+    # ---------------------------------------------------------------------
+
+    def record(self, sql, params, elapsed, rows, method, connection=None):
+        key = fingerprint(sql)
+        method = method or '(خارج الدوال)'
+        with self._lock:
+            method_stats = self._method(method)
+            method_stats['queries'].observe(elapsed)
+            method_stats['rows'] += rows
+
+            stats = self._queries.get(key)
+            if stats is None:
+                stats = self._queries[key] = {'latency': Histogram(), 'rows': 0, 'methods': set()}
+            stats['latency'].observe(elapsed)
+            stats['rows'] += rows
+            stats['methods'].add(method)
+
+        if elapsed >= self.slow_threshold:
+            self._slow_log.append({
+                'time': time.time(),
+                'method': method,
+                'duration_ms': round(elapsed * 1000, 3),
+                'rows': rows,
+                'fingerprint': key,
+                'sql': _WHITESPACE.sub(' ', sql).strip(),
+                'plan': self.explain(sql, params, connection),
+            })
+
+    def explain(self, sql, params, connection=None):
+        """خطة تنفيذ الاستعلام كقائمة أسطر، أو None إذا تعذر الحصول عليها"""
+        statement = sql.lstrip().upper()
+        if statement.startswith(_NO_PLAN_PREFIXES):
+            return None
+
+        params = params if params is not None else ()
+        try:
+            try:
+                cursor = sqlite3.Cursor(connection)
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            except (sqlite3.ProgrammingError, TypeError):
+                # الاتصال أُغلق قبل إنهاء التسجيل: نستخدم اتصالاً جديداً للقراءة فقط
+                if not self.db_path:
+                    return None
+                conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True)
+                try:
+                    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+                finally:
+                    conn.close()
+            return [row[3] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            return [f'تعذر الحصول على الخطة: {e}']
+
+    # ---------------------------------------------------------------------
+    # التقارير
+    # ---------------------------------------------------------------------
+
+    def histograms(self):
+        """نسخة من المدرجات التكرارية لكل دالة: [(الاسم، {'calls', 'queries'})]"""
+        with self._lock:
+            return sorted(
+                (name, {'calls': _copy(stats['calls']), 'queries': _copy(stats['queries'])})
+                for name, stats in self._methods.items()
+            )
+
+    def snapshot(self, top=50):
+        with self._lock:
+            methods = {
+                name: {
+                    'calls': stats['calls'].to_dict(),
+                    'queries': stats['queries'].to_dict(),
+                    'rows': stats['rows'],
+                }
+                for name, stats in self._methods.items()
+            }
+            queries = sorted(self._queries.items(), key=lambda item: item[1]['latency'].sum, reverse=True)
+            queries = [
+                {
+                    'fingerprint': key,
+                    'rows': stats['rows'],
+                    'methods': sorted(stats['methods']),
+                    **stats['latency'].to_dict(),
+                }
+                for key, stats in queries[:top]
+            ]
+            slow = list(self._slow_log)
+
+        return {
+            'enabled': self.enabled,
+            'since': self._started,
+            'slow_threshold_ms': self.slow_threshold * 1000,
+            'methods': methods,
+            'queries': queries,
+            'slow_queries': slow,
+        }
+
+
+def _copy(histogram):
+    copy = Histogram(histogram.bounds)
+    copy.counts = list(histogram.counts)
+    copy.count, copy.sum, copy.max = histogram.count, histogram.sum, histogram.max
+    return copy
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """مؤشر يقيس زمن كل استعلام حتى انتهاء جلب صفوفه
+
+    يُغلق قياس الاستعلام عند تنفيذ استعلام آخر على نفس المؤشر، أو عند جلب جميع
+    الصفوف، أو عند إغلاق المؤشر أو تحريره.
+    """
+
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._begin(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._begin(sql, seq_of_parameters[0] if seq_of_parameters else None,
+                        time.perf_counter() - start)
+
+    def executescript(self, sql_script):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._begin(sql_script, None, time.perf_counter() - start)
+            self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        pending = self._pending
+        if pending is not None:
+            pending[2] += time.perf_counter() - start
+            if row is None:
+                self._finish()
+            else:
+                pending[3] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        pending = self._pending
+        if pending is not None:
+            pending[2] += time.perf_counter() - start
+            pending[3] += len(rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        pending = self._pending
+        if pending is not None:
+            pending[2] += time.perf_counter() - start
+            pending[3] += len(rows)
+            self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _begin(self, sql, parameters, elapsed):
+        metrics = self.connection.metrics
+        # عبارات التعديل: عدد الصفوف المتأثرة معروف مباشرة بعد التنفيذ
+        rows = self.rowcount if self.rowcount > 0 else 0
+        self._pending = [sql, parameters, elapsed, rows, metrics.current_operation]
+
+    def _finish(self):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        sql, parameters, elapsed, rows, method = pending
+        try:
+            connection = self.connection
+        except Exception:
+            return
+        connection.metrics.record(sql, parameters, elapsed, rows, method, connection)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """اتصال ينشئ مؤشرات مقيسة عند تعيين metrics، وإلا يعمل كاتصال عادي"""
+
+    metrics = None
+
+    def cursor(self, factory=None):
+        if self.metrics is None or factory is not None:
+            return super().cursor(factory or sqlite3.Cursor)
+        return super().cursor(InstrumentedCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def instrument_methods(cls, exclude=()):
+    """تغليف دوال الصنف العامة لنسب استعلاماتها وزمن استدعائها إلى اسم الدالة
+
+    يفترض أن الكائن يملك الخاصية metrics. الدوال المولدة ومديرو السياق
+    تُستثنى لأن زمن استدعائها لا يمثل زمن العمل الفعلي.
+    """
+    for name, func in list(vars(cls).items()):
+        if name.startswith('_') or name in exclude or not inspect.isfunction(func):
+            continue
+        if inspect.isgeneratorfunction(func) or hasattr(func, '__wrapped__'):
+            continue
+        setattr(cls, name, _timed(name, func))
+    return cls
+
+
+def _timed(name, func):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        if not metrics.enabled:
+            return func(self, *args, **kwargs)
+        with metrics.operation(name):
+            return func(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,241 @@
+"""اقتراحات إعادة الطلب حسب سرعة البيع
+
+الطلب اليومي لكل منتج يُقدّر بمتوسط متحرك أسي (EWMA) على الكمية المباعة يومياً،
+ويُحدَّث تدريجياً مع كل عملية بيع داخل معاملتها: الجدول product_demand يحفظ
+لكل منتج آخر يوم بيع وكميته حتى الآن، ومتوسط الكمية ومتوسط مربعها للأيام
+المكتملة قبله. عند أول بيع في يوم جديد يُدمج اليوم السابق والأيام الخالية بينهما
+بمعادلة مغلقة، فلا يحتاج التحديث إلى قراءة سجل المبيعات.
+
+المتوسطان خطيان في الكميات اليومية، لذلك يمكن إعادة بنائهما من invoice_items
+بمجموع موزون واحد (rebuild)، والتباين = متوسط المربع - مربع المتوسط.
+
+نقطة إعادة الطلب = الطلب اليومي × مدة التوريد + مخزون أمان
+مخزون الأمان     = z × الانحراف المعياري اليومي × √مدة التوريد
+الكمية المقترحة  = (الطلب اليومي × (مدة التوريد + فترة المراجعة) + مخزون الأمان) - المخزون
+ويبقى min_stock اليدوي حداً أدنى لنقطة إعادة الطلب.
+"""
+import math
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# نافذة المتوسط المتحرك بالأيام (معامل التنعيم = 2 / (النافذة + 1))
+DEFAULT_WINDOW_DAYS = 28
+DEFAULT_LEAD_DAYS = 7
+DEFAULT_REVIEW_DAYS = 7
+# z = 1.65 ≈ مستوى خدمة 95%
+DEFAULT_SERVICE_Z = 1.65
+
+
+def smoothing(window_days=DEFAULT_WINDOW_DAYS):
+    return 2.0 / (max(int(window_days), 1) + 1)
+
+
+def install_demand_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_demand (
+            product_id INTEGER PRIMARY KEY,
+            demand_day TEXT NOT NULL,
+            day_quantity REAL NOT NULL DEFAULT 0,
+            avg_daily REAL NOT NULL DEFAULT 0,
+            avg_square REAL NOT NULL DEFAULT 0,
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+    ''')
+
+
+def sale_day(created_at=None):
+    """يوم البيع (YYYY-MM-DD) من تاريخ الفاتورة أو اليوم الحالي"""
+    return (created_at or datetime.now().strftime('%Y-%m-%d'))[:10]
+
+
+# ترتيب يوم 1970-01-01 في date.toordinal
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _ordinals(days):
+    """أرقام الأيام (date.toordinal) لعمود نصي YYYY-MM-DD دون حلقة بايثون"""
+    return pd.to_datetime(days).to_numpy().astype('datetime64[D]').astype(np.int64) + _EPOCH_ORDINAL
+
+
+def _days_between(first, second):
+    return (date.fromisoformat(second) - date.fromisoformat(first)).days
+
+
+def fold(state, day, quantity, alpha):
+    """حالة المنتج بعد إضافة كمية مباعة في يوم معين
+
+    state: (demand_day, day_quantity, avg_daily, avg_square) أو None لمنتج جديد.
+    """
+    if state is None:
+        return day, quantity, 0.0, 0.0
+
+    demand_day, day_quantity, avg_daily, avg_square = state
+    gap = _days_between(demand_day, day)
+    if gap == 0:
+        return demand_day, day_quantity + quantity, avg_daily, avg_square
+    if gap > 0:
+        # إكمال اليوم السابق ثم (gap - 1) يوماً بدون مبيعات
+        decay = (1 - alpha) ** (gap - 1)
+        return (day, quantity,
+                (alpha * day_quantity + (1 - alpha) * avg_daily) * decay,
+                (alpha * day_quantity ** 2 + (1 - alpha) * avg_square) * decay)
+
+    # بيع مؤجل بتاريخ سابق (نقطة بيع غير متصلة): يُضاف بوزن يومه في المتوسط
+    weight = alpha * (1 - alpha) ** (-gap - 1)
+    return demand_day, day_quantity, avg_daily + weight * quantity, avg_square + weight * quantity ** 2
+
+
+def record_sale(cursor, day, items, alpha):
+    """تحديث الطلب للمنتجات المباعة ضمن معاملة البيع
+
+    items: [(product_id, quantity)]
+    """
+    quantities = {}
+    for product_id, quantity in items:
+        if product_id is not None:
+            quantities[product_id] = quantities.get(product_id, 0.0) + quantity
+    if not quantities:
+        return
+
+    ids = list(quantities)
+    marks = ','.join('?' * len(ids))
+    states = {row[0]: row[1:] for row in cursor.execute(f'''
+        SELECT product_id, demand_day, day_quantity, avg_daily, avg_square
+        FROM product_demand WHERE product_id IN ({marks})
+    ''', ids)}
+
+    cursor.executemany('''
+        INSERT OR REPLACE INTO product_demand (product_id, demand_day, day_quantity, avg_daily, avg_square)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(product_id,) + fold(states.get(product_id), day, quantity, alpha)
+          for product_id, quantity in quantities.items()])
+
+
+def rebuild(conn, alpha, today=None, horizon_days=None):
+    """إعادة بناء جدول الطلب من بنود فواتير البيع (مجموع موزون بدل التكرار اليومي)
+
+    horizon_days: عدد الأيام المقروءة من السجل؛ الافتراضي حيث يقل وزن اليوم عن 0.1%.
+    """
+    today = sale_day(today)
+    if horizon_days is None:
+        horizon_days = int(math.ceil(math.log(0.001) / math.log(1 - alpha)))
+    start = (date.fromisoformat(today) - timedelta(days=horizon_days)).isoformat()
+
+    daily = pd.read_sql_query('''
+        SELECT ii.product_id AS product_id, DATE(i.created_at) AS day, SUM(ii.quantity) AS quantity
+        FROM invoices i
+        JOIN invoice_items ii ON ii.invoice_id = i.id
+        WHERE i.type = 'sale' AND i.created_at >= ? AND i.created_at < DATE(?, '+1 day')
+          AND ii.product_id IS NOT NULL
+        GROUP BY ii.product_id, DATE(i.created_at)
+    ''', conn, params=(start, today))
+
+    conn.execute('DELETE FROM product_demand')
+    if daily.empty:
+        return 0
+
+    ordinal = _ordinals(daily['day'])
+    daily['ordinal'] = ordinal
+    last = daily.groupby('product_id')['ordinal'].transform('max').to_numpy()
+    quantity = daily['quantity'].to_numpy()
+
+    # وزن اليوم d في متوسط الأيام المكتملة قبل آخر يوم بيع D: alpha × (1 - alpha)^(D - 1 - d)
+    completed = ordinal < last
+    weights = np.where(completed, alpha * (1 - alpha) ** np.maximum(last - 1 - ordinal, 0), 0.0)
+    daily['avg_daily'] = weights * quantity
+    daily['avg_square'] = weights * quantity ** 2
+    daily['day_quantity'] = np.where(completed, 0.0, quantity)
+
+    state = daily.groupby('product_id').agg(
+        ordinal=('ordinal', 'max'), day_quantity=('day_quantity', 'sum'),
+        avg_daily=('avg_daily', 'sum'), avg_square=('avg_square', 'sum'))
+    state['demand_day'] = [date.fromordinal(int(value)).isoformat() for value in state['ordinal']]
+
+    conn.executemany('''
+        INSERT INTO product_demand (product_id, demand_day, day_quantity, avg_daily, avg_square)
+        VALUES (?, ?, ?, ?, ?)
+    ''', state.reset_index()[['product_id', 'demand_day', 'day_quantity', 'avg_daily', 'avg_square']]
+         .itertuples(index=False, name=None))
+    return len(state)
+
+
+def load_demand(conn):
+    """المنتجات النشطة مع حالة الطلب (سطر لكل منتج)"""
+    return pd.read_sql_query('''
+        SELECT p.id AS product_id, p.name AS name, p.barcode AS barcode, c.name AS category,
+               p.stock_quantity AS stock_quantity, p.min_stock AS min_stock,
+               p.purchase_price AS purchase_price,
+               d.demand_day AS demand_day, d.day_quantity AS day_quantity,
+               d.avg_daily AS avg_daily, d.avg_square AS avg_square
+        FROM products p
+        LEFT JOIN categories c ON c.id = p.category_id
+        LEFT JOIN product_demand d ON d.product_id = p.id
+        WHERE p.is_active = 1
+    ''', conn)
+
+
+def current_demand(frame, alpha, today=None):
+    """(المتوسط اليومي، الانحراف المعياري) حتى نهاية أمس لكل سطر، بعمليات أعمدة"""
+    today_ordinal = date.fromisoformat(sale_day(today)).toordinal()
+    has_demand = frame['demand_day'].notna().to_numpy()
+    day_ordinal = np.full(len(frame), today_ordinal)
+    if has_demand.any():
+        day_ordinal[has_demand] = _ordinals(frame.loc[has_demand, 'demand_day'])
+
+    gap = today_ordinal - day_ordinal
+    day_quantity = frame['day_quantity'].fillna(0.0).to_numpy()
+    avg_daily = frame['avg_daily'].fillna(0.0).to_numpy()
+    avg_square = frame['avg_square'].fillna(0.0).to_numpy()
+
+    # آخر يوم بيع اكتمل: يُدمج مع الأيام الخالية حتى أمس
+    decay = (1 - alpha) ** np.maximum(gap - 1, 0)
+    closed = gap > 0
+    mean = np.where(closed, (alpha * day_quantity + (1 - alpha) * avg_daily) * decay, avg_daily)
+    square = np.where(closed, (alpha * day_quantity ** 2 + (1 - alpha) * avg_square) * decay, avg_square)
+    deviation = np.sqrt(np.maximum(square - mean ** 2, 0.0))
+    return mean, deviation
+
+
+SUGGESTION_COLUMNS = ['product_id', 'name', 'barcode', 'category', 'stock_quantity', 'min_stock',
+                      'daily_demand', 'demand_std', 'days_of_cover', 'reorder_point', 'safety_stock',
+                      'suggested_quantity', 'estimated_cost']
+
+
+def suggestions(frame, alpha, lead_days=DEFAULT_LEAD_DAYS, review_days=DEFAULT_REVIEW_DAYS,
+                service_z=DEFAULT_SERVICE_Z, today=None, include_all=False):
+    """نقاط إعادة الطلب والكميات المقترحة؛ افتراضياً المنتجات التي بلغت نقطة الطلب فقط
+
+    مرتبة حسب أيام التغطية المتبقية (الأقرب للنفاد أولاً).
+    """
+    mean, deviation = current_demand(frame, alpha, today)
+    stock = frame['stock_quantity'].fillna(0.0).to_numpy()
+    min_stock = frame['min_stock'].fillna(0.0).to_numpy()
+
+    safety = service_z * deviation * math.sqrt(lead_days)
+    reorder_point = np.maximum(mean * lead_days + safety, min_stock)
+    target = np.maximum(mean * (lead_days + review_days) + safety, reorder_point)
+    suggested = np.where(stock <= reorder_point, np.ceil(np.maximum(target - stock, 0.0)), 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(mean > 0, np.maximum(stock, 0.0) / mean, np.nan)
+
+    result = frame.assign(
+        daily_demand=np.round(mean, 4),
+        demand_std=np.round(deviation, 4),
+        days_of_cover=np.round(cover, 1),
+        reorder_point=np.round(reorder_point, 2),
+        safety_stock=np.round(safety, 2),
+        suggested_quantity=suggested,
+        estimated_cost=np.round(suggested * frame['purchase_price'].fillna(0.0).to_numpy(), 2),
+    )
+    if not include_all:
+        result = result[(suggested > 0) & (stock <= reorder_point)]
+    return result.sort_values(['days_of_cover', 'daily_demand'], ascending=[True, False],
+                              na_position='last', kind='stable')
+
+
+def to_records(frame, limit=None, offset=0):
+    page = frame[SUGGESTION_COLUMNS].iloc[offset:offset + limit if limit else None]
+    page = page.replace([np.inf, -np.inf], np.nan)
+    return page.astype(object).where(page.notna(), None).to_dict('records')
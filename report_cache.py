@@ -0,0 +1,117 @@
+"""ذاكرة مؤقتة لنتائج التقارير مرتبطة بأجيال الكتابة على الجداول
+
+كل جدول له عداد جيل (generation) تزيده عمليات الكتابة بعد نجاح commit. كل
+نتيجة مخزنة تحفظ أجيال الجداول التي يعتمد عليها التقرير لحظة حسابه، وعند
+الطلب التالي تُستخدم فقط إذا لم يتغير أي منها؛ وإلا يُعاد الحساب وتستبدل
+النتيجة القديمة. عدد النتائج محدود، وتُحذف الأقدم استخداماً (LRU) عند التجاوز.
+
+الأجيال في ذاكرة العملية فقط: الكتابة من عملية أخرى على نفس الملف لا تبطل
+النتائج هنا (مثل ذاكرة إحصائيات المنتجات).
+"""
+import os
+import threading
+from collections import OrderedDict
+
+
+class ReportCache:
+    """نتائج التقارير حسب (اسم التقرير، المعاملات) مع إبطال حسب الجداول"""
+
+    def __init__(self, max_entries=256, enabled=True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._generations = {}
+        # يزيد عند إبطال جميع الجداول (استعادة نسخة احتياطية، تحديث نسخة التقارير)
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.environ.get('POS_REPORT_CACHE_SIZE', '256')),
+            enabled=os.environ.get('POS_REPORT_CACHE', '1') not in ('0', 'false', 'no'),
+        )
+
+    def reset(self):
+        """تصفير عدادات الإصابة والإخفاق (النتائج المخزنة تبقى)"""
+        with self._lock:
+            self._stats = {}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, *tables):
+        """زيادة جيل الجداول بعد الكتابة عليها؛ بدون جداول: إبطال كل شيء"""
+        with self._lock:
+            if not tables:
+                self._epoch += 1
+                self._entries.clear()
+                return
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+
+    def _generation(self, tables):
+        return (self._epoch,) + tuple(self._generations.get(table, 0) for table in tables)
+
+    def _count(self, report, field):
+        stats = self._stats.get(report)
+        if stats is None:
+            stats = self._stats[report] = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+        stats[field] += 1
+
+    def get_or_compute(self, report, params, tables, compute):
+        """النتيجة المخزنة إن كانت أجيال tables لم تتغير، وإلا compute() وتخزينها"""
+        if not self.enabled:
+            return compute()
+
+        key = (report, params)
+        with self._lock:
+            generation = self._generation(tables)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == generation:
+                    self._entries.move_to_end(key)
+                    self._count(report, 'hits')
+                    return _copy(entry[1])
+                del self._entries[key]
+                self._count(report, 'invalidations')
+            self._count(report, 'misses')
+
+        value = compute()
+
+        with self._lock:
+            # لا نخزن النتيجة إذا حدثت كتابة أثناء الحساب
+            if generation == self._generation(tables):
+                self._entries[key] = (generation, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._count(evicted[0], 'evictions')
+        return _copy(value)
+
+    def snapshot(self):
+        with self._lock:
+            reports = {report: dict(stats) for report, stats in sorted(self._stats.items())}
+            hits = sum(stats['hits'] for stats in reports.values())
+            misses = sum(stats['misses'] for stats in reports.values())
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+                'reports': reports,
+                'generations': dict(sorted(self._generations.items())),
+            }
+
+
+def _copy(value):
+    # نسخة سطحية حتى لا يعدل المستدعي النتيجة المخزنة
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return list(value)
+    return value
@@ -0,0 +1,173 @@
+"""نسخة قراءة فقط من قاعدة البيانات لتشغيل التقارير الثقيلة
+
+تُبنى النسخة بواجهة النسخ الاحتياطي (backup API) على دفعات صغيرة إلى ملف مؤقت
+ثم تستبدل النسخة السابقة دفعة واحدة (os.replace)، فلا تتنافس استعلامات التقارير
+الطويلة مع عمليات البيع على نفس الملف. يتم التحديث دورياً في خيط خلفي.
+
+مؤشر الحداثة لكل تقرير: وقت آخر تحديث، عمر النسخة بالثواني، وعدد التغييرات
+في القاعدة الرئيسية التي لم تصل للنسخة بعد (حسب موضع سجل التغييرات، ويُقرأ
+موضع القاعدة الرئيسية في خيط التحديث وليس مع كل طلب).
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import backup_manager
+from pos_backend import POSBackend
+
+
+def _journal_position(database):
+    conn = sqlite3.connect(database)
+    try:
+        return backup_manager.journal_position(conn.cursor())
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+
+class ReportingReplica:
+    """نسخة تقارير لقاعدة بيانات واحدة"""
+
+    def __init__(self, source, replica_path):
+        self.source = source
+        self.replica_path = replica_path
+        self.backend = None
+        self.refreshed_at = None
+        self.refresh_seconds = None
+        self.change_id = 0
+        self.source_change_id = 0
+        self.error = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.backend is not None
+
+    @property
+    def age(self):
+        return time.time() - self.refreshed_at if self.refreshed_at else None
+
+    def refresh(self):
+        """بناء نسخة جديدة واستبدال السابقة (تحديث واحد في كل مرة)"""
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            started = time.time()
+            os.makedirs(os.path.dirname(self.replica_path), exist_ok=True)
+            temp_path = self.replica_path + '.partial'
+            backup_manager.snapshot_database(self.source.db_path, temp_path)
+            change_id = _journal_position(temp_path)
+            os.replace(temp_path, self.replica_path)
+
+            if self.backend is None:
+                self.backend = POSBackend(self.replica_path, backup_dir=self.source.backup_dir,
+                                          archive_dir=self.source.archive_dir, read_only=True)
+            else:
+                self.backend.reportCache.invalidate()
+            self.change_id = change_id
+            self.source_change_id = max(self.source_change_id, change_id)
+            self.refreshed_at = started
+            self.refresh_seconds = time.time() - started
+            self.error = None
+            return True
+        except Exception as e:
+            self.error = str(e)
+            return False
+        finally:
+            self._lock.release()
+
+    def poll(self):
+        """تحديث موضع سجل التغييرات في القاعدة الرئيسية (من خيط التحديث)"""
+        try:
+            self.source_change_id = _journal_position(self.source.db_path)
+        except sqlite3.Error as e:
+            self.error = str(e)
+
+    def freshness(self):
+        return {
+            'source': 'replica',
+            'refreshed_at': self.refreshed_at,
+            'age_seconds': round(self.age, 3) if self.age is not None else None,
+            'pending_changes': max(self.source_change_id - self.change_id, 0),
+            'refresh_seconds': round(self.refresh_seconds, 3) if self.refresh_seconds else None,
+        }
+
+
+class ReplicaManager:
+    """نسخ التقارير لكل قاعدة بيانات (الفرع الافتراضي والفروع الأخرى) مع تحديث دوري"""
+
+    def __init__(self, replica_dir, interval=60.0, enabled=True):
+        self.replica_dir = replica_dir
+        self.interval = interval
+        self.enabled = enabled
+        self._replicas = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, replica_dir):
+        return cls(
+            replica_dir,
+            interval=float(os.environ.get('POS_REPLICA_INTERVAL', '60')),
+            enabled=os.environ.get('POS_REPORT_REPLICA', '1') not in ('0', 'false', 'no'),
+        )
+
+    def get(self, backend):
+        """نسخة التقارير لقاعدة البيانات؛ أول طلب يبدأ بناءها في الخلفية"""
+        key = os.path.abspath(backend.db_path)
+        replica = self._replicas.get(key)
+        if replica is None:
+            with self._lock:
+                replica = self._replicas.get(key)
+                if replica is None:
+                    name = os.path.splitext(os.path.basename(key))[0]
+                    replica = ReportingReplica(backend, os.path.join(self.replica_dir, f'{name}.replica.db'))
+                    self._replicas[key] = replica
+                    threading.Thread(target=replica.refresh, name='replica-refresh', daemon=True).start()
+        return replica
+
+    def reporting_backend(self, backend, fresh=False):
+        """(الواجهة الخلفية للتقرير، مؤشر الحداثة)
+
+        fresh=True أو عدم جاهزية النسخة بعد: يُستخدم الملف الرئيسي مباشرة.
+        """
+        if not self.enabled or fresh or backend.read_only:
+            return backend, {'source': 'primary'}
+        replica = self.get(backend)
+        if not replica.ready:
+            return backend, {'source': 'primary', 'replica': 'building'}
+        return replica.backend, replica.freshness()
+
+    def refresh_all(self):
+        return {key: replica.refresh() for key, replica in list(self._replicas.items())}
+
+    def status(self):
+        return [
+            {
+                'database': key,
+                'ready': replica.ready,
+                'error': replica.error,
+                **({**replica.freshness(), 'cache': replica.backend.reportCache.snapshot()} if replica.ready else {}),
+            }
+            for key, replica in list(self._replicas.items())
+        ]
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='replica-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(min(self.interval, 5.0)):
+            for replica in list(self._replicas.values()):
+                if replica.ready and replica.age >= self.interval:
+                    replica.refresh()
+                elif replica.ready:
+                    replica.poll()
@@ -0,0 +1,185 @@
+"""تحليلات المبيعات على مستوى المنتج باستخدام pandas/NumPy
+
+بنود فواتير البيع للفترة تُقرأ على دفعات (chunks) من القاعدة الرئيسية ومن ملفات
+الأرشيف التي تتقاطع مع الفترة، وتُجمع كل دفعة حسب المنتج فوراً، فلا يبقى في
+الذاكرة إلا سطر واحد لكل منتج مهما بلغ عدد البنود. جميع الحسابات بعد ذلك
+عمليات أعمدة (vectorized) دون حلقات بايثون على الصفوف:
+
+    top_products        أعلى المنتجات حسب الإيراد أو الكمية
+    abc_classification  تصنيف ABC (باريتو) حسب نسبة الإيراد التراكمية
+    velocity            معدل البيع اليومي، نسبة تصريف المخزون وأيام التغطية
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# عدد البنود المقروءة في كل دفعة
+CHUNK_SIZE = 200_000
+# عدد النتائج الجزئية التي تُدمج معاً قبل متابعة القراءة
+MERGE_EVERY = 16
+
+SALE_COLUMNS = ['quantity', 'revenue', 'lines']
+
+_ITEMS_SQL = '''
+    SELECT ii.product_id AS product_id, ii.quantity AS quantity, ii.total_price AS revenue
+    FROM invoices i
+    JOIN invoice_items ii ON ii.invoice_id = i.id
+    WHERE i.type = 'sale' AND i.created_at >= ? AND i.created_at < DATE(?, '+1 day')
+      AND ii.product_id IS NOT NULL
+'''
+
+_ITEM_DTYPES = {'product_id': 'int64', 'quantity': 'float64', 'revenue': 'float64'}
+
+
+def _collapse(partials):
+    frame = pd.concat(partials)
+    return frame.groupby(level=0).sum()
+
+
+def load_product_sales(connections, start_date, end_date, chunk_size=CHUNK_SIZE):
+    """إجمالي الكمية والإيراد وعدد البنود لكل منتج في الفترة
+
+    connections: اتصالات القاعدة الرئيسية وملفات الأرشيف المعنية.
+    النتيجة DataFrame فهرسه product_id وأعمدته SALE_COLUMNS.
+    """
+    partials = []
+    for conn in connections:
+        for chunk in pd.read_sql_query(_ITEMS_SQL, conn, params=(start_date, end_date),
+                                       chunksize=chunk_size, dtype=_ITEM_DTYPES):
+            chunk['lines'] = 1
+            partials.append(chunk.groupby('product_id')[SALE_COLUMNS].sum())
+            if len(partials) >= MERGE_EVERY:
+                partials = [_collapse(partials)]
+
+    if not partials:
+        return pd.DataFrame(columns=SALE_COLUMNS, index=pd.Index([], dtype='int64', name='product_id'),
+                            dtype='float64')
+    return _collapse(partials)
+
+
+def load_products(conn):
+    """بيانات المنتجات اللازمة للتحليل (بما فيها غير النشطة حتى تظهر مبيعاتها السابقة)"""
+    return pd.read_sql_query('''
+        SELECT p.id AS product_id, p.name AS name, c.name AS category,
+               p.stock_quantity AS stock_quantity, p.is_active AS is_active
+        FROM products p
+        LEFT JOIN categories c ON c.id = p.category_id
+    ''', conn, index_col='product_id')
+
+
+def period_days(start_date, end_date):
+    """عدد أيام الفترة شاملة البداية والنهاية"""
+    start = date.fromisoformat(start_date[:10])
+    end = date.fromisoformat(end_date[:10])
+    return max((end - start).days + 1, 1)
+
+
+def _records(frame, columns):
+    # NaN/inf غير صالحة في JSON
+    frame = frame.reset_index()[columns].replace([np.inf, -np.inf], np.nan)
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+def _with_products(sales, products):
+    frame = sales.join(products[['name', 'category']], how='left')
+    frame['name'] = frame['name'].fillna('')
+    return frame
+
+
+def top_products(sales, products, n=20, by='revenue'):
+    """أعلى n منتجات حسب الإيراد (revenue) أو الكمية (quantity)"""
+    if by not in ('revenue', 'quantity'):
+        raise ValueError('الترتيب يجب أن يكون revenue أو quantity')
+    top = sales.nlargest(n, by)
+    frame = _with_products(top, products)
+    total = sales[by].sum()
+    frame['share'] = (frame[by] / total).round(4) if total else 0.0
+    return _records(frame, ['product_id', 'name', 'category', 'quantity', 'revenue', 'lines', 'share'])
+
+
+def abc_classification(sales, products, a_share=0.8, b_share=0.95):
+    """تصنيف المنتجات المباعة حسب مساهمتها التراكمية في الإيراد
+
+    A: المنتجات التي تكوّن أول a_share من الإيراد، B: حتى b_share، C: الباقي.
+    المنتج الذي يعبر الحد يُصنف في الفئة الأعلى.
+    """
+    if not 0 < a_share < b_share <= 1:
+        raise ValueError('يجب أن تكون 0 < a_share < b_share <= 1')
+
+    ranked = sales.sort_values('revenue', ascending=False)
+    total = ranked['revenue'].sum()
+    revenue = ranked['revenue'].to_numpy()
+    cumulative = np.cumsum(revenue) / total if total else np.zeros(len(ranked))
+    before = cumulative - (revenue / total if total else 0)
+    ranked = ranked.assign(
+        share=np.round(revenue / total, 6) if total else 0.0,
+        cumulative_share=np.round(cumulative, 6),
+        abc_class=np.select([before < a_share, before < b_share], ['A', 'B'], 'C'),
+    )
+
+    summary = ranked.groupby('abc_class').agg(products=('revenue', 'size'), revenue=('revenue', 'sum'),
+                                              quantity=('quantity', 'sum'))
+    summary = summary.reindex(['A', 'B', 'C'], fill_value=0)
+    summary['revenue_share'] = (summary['revenue'] / total).round(4) if total else 0.0
+    summary['product_share'] = (summary['products'] / len(ranked)).round(4) if len(ranked) else 0.0
+
+    unsold = int((products['is_active'] == 1).sum() - products.index.isin(ranked.index).sum())
+    return {
+        'total_revenue': float(total),
+        'thresholds': {'A': a_share, 'B': b_share},
+        'summary': {cls: {key: (float(value) if key != 'products' else int(value)) for key, value in row.items()}
+                    for cls, row in summary.to_dict('index').items()},
+        'unsold_products': max(unsold, 0),
+        'products': _records(_with_products(ranked, products),
+                             ['product_id', 'name', 'category', 'revenue', 'quantity',
+                              'share', 'cumulative_share', 'abc_class']),
+    }
+
+
+def velocity(sales, products, days):
+    """معدل البيع اليومي، نسبة التصريف وأيام التغطية لكل منتج نشط
+
+    sell_through = المباع / (المباع + المخزون الحالي)
+    days_of_cover = المخزون الحالي / متوسط البيع اليومي (None إن لم يُبع شيء)
+    """
+    frame = products[products['is_active'] == 1].join(sales[['quantity', 'revenue']], how='left')
+    frame[['quantity', 'revenue']] = frame[['quantity', 'revenue']].fillna(0.0)
+
+    sold = frame['quantity'].to_numpy()
+    stock = frame['stock_quantity'].fillna(0.0).clip(lower=0).to_numpy()
+    daily = sold / days
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sell_through = np.where(sold + stock > 0, sold / (sold + stock), np.nan)
+        cover = np.where(daily > 0, stock / daily, np.nan)
+
+    frame = frame.assign(
+        daily_rate=np.round(daily, 4),
+        sell_through=np.round(sell_through, 4),
+        days_of_cover=np.round(cover, 1),
+    )
+    return frame
+
+
+# ترتيب تقرير السرعة: (العمود، تصاعدي؟)
+VELOCITY_SORTS = {
+    'days_of_cover': ('days_of_cover', True),
+    'sell_through': ('sell_through', False),
+    'slow_movers': ('sell_through', True),
+    'daily_rate': ('daily_rate', False),
+}
+
+
+def velocity_report(sales, products, days, sort='days_of_cover', limit=100, offset=0):
+    if sort not in VELOCITY_SORTS:
+        raise ValueError(f"الترتيب يجب أن يكون أحد: {', '.join(VELOCITY_SORTS)}")
+    column, ascending = VELOCITY_SORTS[sort]
+    frame = velocity(sales, products, days).sort_values(column, ascending=ascending, na_position='last',
+                                                        kind='stable')
+    page = frame.iloc[offset:offset + limit]
+    return {
+        'days': days,
+        'total': len(frame),
+        'products': _records(page, ['product_id', 'name', 'category', 'stock_quantity', 'quantity',
+                                    'revenue', 'daily_rate', 'sell_through', 'days_of_cover']),
+    }
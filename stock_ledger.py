@@ -0,0 +1,198 @@
+"""سجل حركات المخزون مع لقطات دورية
+
+كل تغيير في products.stock_quantity يُسجل كحركة موقعة في stock_movements
+(بيع، شراء، تسوية، جرد، استيراد، تعديل يدوي) ضمن نفس المعاملة وبعبارة واحدة
+لكل عملية (INSERT ... SELECT أو executemany)، فيبقى مجموع حركات المنتج مساوياً
+لمخزونه الحالي.
+
+لقطة اليوم D في stock_snapshots هي رصيد كل منتج في نهاية ذلك اليوم (حركات
+moved_at < D + 1). رصيد أي يوم = آخر لقطة لا تتجاوزه + حركات ما بعدها حتى
+نهايته، فلا يُعاد تشغيل السجل كاملاً. الصفوف ذات الرصيد صفر لا تُحفظ.
+
+الحركة المؤرخة بيوم سابق (بيع مؤجل من نقطة غير متصلة) تحذف اللقطات من
+يومها فصاعداً لأنها لم تعد صحيحة؛ الاستعلام يرجع تلقائياً لآخر لقطة سليمة.
+"""
+from datetime import date, timedelta
+
+# عدد الأيام بين اللقطات التلقائية
+DEFAULT_SNAPSHOT_DAYS = 7
+
+
+def install(cursor):
+    """جداول الحركات واللقطات؛ عند أول تشغيل يُسجل المخزون الحالي كرصيد افتتاحي"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_movements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            quantity REAL NOT NULL,
+            movement_type TEXT NOT NULL,
+            reference_id INTEGER,
+            unit_cost REAL,
+            note TEXT,
+            moved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_movements_product ON stock_movements (product_id, moved_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_movements_moved_at ON stock_movements (moved_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_snapshots (
+            snapshot_day TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity REAL NOT NULL,
+            PRIMARY KEY (snapshot_day, product_id)
+        )
+    ''')
+
+    cursor.execute('SELECT EXISTS(SELECT 1 FROM stock_movements)')
+    if not cursor.fetchone()[0]:
+        cursor.execute('''
+            INSERT INTO stock_movements (product_id, quantity, movement_type, unit_cost)
+            SELECT id, stock_quantity, 'opening', avg_cost FROM products WHERE stock_quantity != 0
+        ''')
+
+
+def _invalidate_snapshots(cursor, moved_at):
+    cursor.execute('DELETE FROM stock_snapshots WHERE snapshot_day >= DATE(?)', (moved_at,))
+
+
+def record(cursor, movements, movement_type, reference_id=None, note=None):
+    """تسجيل حركات بتاريخ الآن (تُستدعى قبل تحديث المخزون)
+
+    movements: [{'product_id', 'quantity', 'unit_cost'}] والكمية موقعة (سالبة للخصم).
+    بدون unit_cost تُسجل التكلفة المتوسطة الحالية؛ المنتجات غير الموجودة تُتجاهل.
+    """
+    cursor.executemany('''
+        INSERT INTO stock_movements (product_id, quantity, movement_type, reference_id, unit_cost, note)
+        SELECT id, :quantity, :movement_type, :reference_id, COALESCE(:unit_cost, avg_cost), :note
+        FROM products WHERE id = :product_id AND :quantity != 0
+    ''', [{'product_id': movement['product_id'], 'quantity': movement['quantity'],
+           'unit_cost': movement.get('unit_cost'), 'movement_type': movement_type,
+           'reference_id': reference_id, 'note': note} for movement in movements])
+
+
+def record_invoice(cursor, invoice_id, movement_type, sign):
+    """حركات بنود فاتورة (sign = -1 للبيع، +1 للشراء) بتاريخ الفاتورة"""
+    cursor.execute('''
+        INSERT INTO stock_movements (product_id, quantity, movement_type, reference_id, unit_cost, moved_at)
+        SELECT ii.product_id, ? * ii.quantity, ?, ii.invoice_id, ii.unit_cost, i.created_at
+        FROM invoice_items ii
+        JOIN invoices i ON i.id = ii.invoice_id
+        WHERE ii.invoice_id = ? AND ii.product_id IS NOT NULL AND ii.quantity != 0
+    ''', (sign, movement_type, invoice_id))
+    cursor.execute('SELECT created_at FROM invoices WHERE id = ?', (invoice_id,))
+    _invalidate_snapshots(cursor, cursor.fetchone()[0])
+
+
+def record_stock_change(cursor, product_id, new_quantity, movement_type, note=None):
+    """حركة بفرق الكمية الجديدة عن المخزون الحالي (تُستدعى قبل UPDATE المنتج)"""
+    cursor.execute('''
+        INSERT INTO stock_movements (product_id, quantity, movement_type, unit_cost, note)
+        SELECT id, ? - stock_quantity, ?, avg_cost, ? FROM products
+        WHERE id = ? AND stock_quantity != ?
+    ''', (new_quantity, movement_type, note, product_id, new_quantity))
+
+
+def _next_day(day):
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+
+def _balances_sql(base_day, product_filter=''):
+    """رصيد المنتجات قبل :end من اللقطة base_day (أو من بداية السجل)"""
+    if base_day is None:
+        return f'''
+            SELECT product_id, SUM(quantity) AS quantity FROM stock_movements
+            WHERE moved_at < :end {product_filter}
+            GROUP BY product_id
+        '''
+    return f'''
+        SELECT product_id, SUM(quantity) AS quantity FROM (
+            SELECT product_id, quantity FROM stock_snapshots
+            WHERE snapshot_day = :base {product_filter}
+            UNION ALL
+            SELECT product_id, quantity FROM stock_movements
+            WHERE moved_at >= :start AND moved_at < :end {product_filter}
+        )
+        GROUP BY product_id
+    '''
+
+
+def _base_snapshot(cursor, day, inclusive):
+    cursor.execute(f'SELECT MAX(snapshot_day) FROM stock_snapshots WHERE snapshot_day {"<=" if inclusive else "<"} ?',
+                   (day,))
+    return cursor.fetchone()[0]
+
+
+def _params(base_day, day):
+    return {'base': base_day, 'start': _next_day(base_day) if base_day else None, 'end': _next_day(day)}
+
+
+def take_snapshot(cursor, day):
+    """لقطة رصيد نهاية اليوم day من اللقطة السابقة وحركات ما بعدها"""
+    base_day = _base_snapshot(cursor, day, inclusive=False)
+    cursor.execute('DELETE FROM stock_snapshots WHERE snapshot_day = ?', (day,))
+    cursor.execute(f'''
+        INSERT INTO stock_snapshots (snapshot_day, product_id, quantity)
+        SELECT :day, product_id, quantity FROM ({_balances_sql(base_day)}) WHERE quantity != 0
+    ''', {'day': day, **_params(base_day, day)})
+    return {'snapshot_day': day, 'base_snapshot': base_day, 'products': cursor.rowcount}
+
+
+def last_snapshot(cursor):
+    cursor.execute('SELECT MAX(snapshot_day) FROM stock_snapshots')
+    return cursor.fetchone()[0]
+
+
+def stock_on(cursor, day, product_ids=None):
+    """({product_id: الرصيد}, يوم اللقطة المستخدمة) في نهاية اليوم day (المنتجات ذات الرصيد فقط)"""
+    base_day = _base_snapshot(cursor, day, inclusive=True)
+    params = _params(base_day, day)
+    product_filter = ''
+    if product_ids is not None:
+        ids = [int(product_id) for product_id in product_ids]
+        product_filter = f"AND product_id IN ({','.join(str(product_id) for product_id in ids) or 'NULL'})"
+    cursor.execute(_balances_sql(base_day, product_filter), params)
+    return {product_id: float(quantity) for product_id, quantity in cursor.fetchall()}, base_day
+
+
+def history(cursor, product_id, start_date, end_date):
+    """حركات منتج في الفترة مع الرصيد الافتتاحي والرصيد بعد كل حركة"""
+    previous_day = (date.fromisoformat(start_date[:10]) - timedelta(days=1)).isoformat()
+    opening, _ = stock_on(cursor, previous_day, [product_id])
+    balance = opening.get(product_id, 0.0)
+
+    cursor.execute('''
+        SELECT id, quantity, movement_type, reference_id, unit_cost, note, moved_at
+        FROM stock_movements
+        WHERE product_id = ? AND moved_at >= ? AND moved_at < ?
+        ORDER BY moved_at, id
+    ''', (product_id, start_date[:10], _next_day(end_date[:10])))
+    names = [column[0] for column in cursor.description]
+    opening_balance = balance
+    movements = []
+    for row in cursor.fetchall():
+        movement = dict(zip(names, row))
+        balance += movement['quantity']
+        movement['balance'] = balance
+        movements.append(movement)
+    return {
+        'product_id': product_id,
+        'opening_balance': opening_balance,
+        'closing_balance': balance,
+        'movements': movements,
+    }
+
+
+def drift(cursor, limit=100):
+    """المنتجات التي يختلف مخزونها عن مجموع حركاتها (تعديل خارج مسارات التسجيل)"""
+    cursor.execute('''
+        SELECT p.id, p.name, p.stock_quantity, COALESCE(m.quantity, 0) AS ledger_quantity
+        FROM products p
+        LEFT JOIN (SELECT product_id, SUM(quantity) AS quantity FROM stock_movements GROUP BY product_id) m
+               ON m.product_id = p.id
+        WHERE ABS(p.stock_quantity - COALESCE(m.quantity, 0)) > 1e-6
+        LIMIT ?
+    ''', (limit,))
+    return [{'product_id': product_id, 'name': name, 'stock_quantity': stock, 'ledger_quantity': ledger,
+             'difference': stock - ledger}
+            for product_id, name, stock, ledger in cursor.fetchall()]
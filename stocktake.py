@@ -0,0 +1,235 @@
+"""جلسات الجرد الفعلي (stocktake)
+
+الجلسة تستقبل الكميات الممسوحة على دفعات كبيرة. كل دفعة تُكتب أولاً في جدول
+مؤقت على اتصال الطلب (stocktake_scan) بـ executemany واحد، ثم تُحل الباركودات
+إلى منتجات وتُدمج في stocktake_counts بعبارة واحدة (جمع الكميات للمسح المتكرر
+أو استبدالها). الفروقات تُحسب بعبارة SELECT واحدة مقابل products.stock_quantity
+لحظة الطلب، وعند الاعتماد تُسجل حركات الجرد ويُضبط المخزون لجميع المنتجات
+بعبارتين ضمن معاملة المستدعي.
+
+الفرق يُحسب مقابل المخزون لحظة الاعتماد، فالمبيعات بين العد والاعتماد تدخل
+ضمن الفرق؛ يُفضل الاعتماد فور انتهاء العد.
+"""
+
+STAGE_MODES = ('add', 'set')
+
+
+def install(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stocktake_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT NOT NULL DEFAULT 'open',
+            note TEXT,
+            created_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            closed_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stocktake_counts (
+            session_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            counted REAL NOT NULL,
+            PRIMARY KEY (session_id, product_id),
+            FOREIGN KEY (session_id) REFERENCES stocktake_sessions (id),
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+    ''')
+
+
+def create_session(cursor, note=None, created_by=None):
+    cursor.execute('INSERT INTO stocktake_sessions (note, created_by) VALUES (?, ?)', (note, created_by))
+    return cursor.lastrowid
+
+
+def get_session(cursor, session_id):
+    cursor.execute('''
+        SELECT s.id, s.status, s.note, s.created_by, s.created_at, s.closed_at,
+               COUNT(c.product_id), COALESCE(SUM(c.counted), 0)
+        FROM stocktake_sessions s
+        LEFT JOIN stocktake_counts c ON c.session_id = s.id
+        WHERE s.id = ?
+        GROUP BY s.id
+    ''', (session_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    names = ('id', 'status', 'note', 'created_by', 'created_at', 'closed_at', 'counted_products', 'counted_quantity')
+    return dict(zip(names, row))
+
+
+def _open_session(cursor, session_id):
+    session = get_session(cursor, session_id)
+    if session is None:
+        raise ValueError('جلسة الجرد غير موجودة')
+    if session['status'] != 'open':
+        raise ValueError(f"جلسة الجرد مغلقة ({session['status']})")
+    return session
+
+
+def _scan_rows(counts):
+    rows = []
+    for index, count in enumerate(counts):
+        if not isinstance(count, dict):
+            raise ValueError(f'سطر {index + 1}: يجب أن يكون كائن JSON')
+        product_id, barcode = count.get('product_id'), count.get('barcode')
+        if product_id is None and not barcode:
+            raise ValueError(f'سطر {index + 1}: product_id أو barcode مطلوب')
+        try:
+            quantity = float(count.get('quantity', 1))
+        except (TypeError, ValueError):
+            raise ValueError(f"سطر {index + 1}: كمية غير صالحة {count.get('quantity')!r}")
+        if quantity < 0:
+            raise ValueError(f'سطر {index + 1}: الكمية المعدودة لا يمكن أن تكون سالبة')
+        rows.append((index, int(product_id) if product_id is not None else None,
+                     str(barcode) if barcode else None, quantity))
+    return rows
+
+
+def stage_counts(cursor, session_id, counts, mode='add'):
+    """إضافة دفعة كميات ممسوحة إلى الجلسة
+
+    counts: [{'product_id' أو 'barcode', 'quantity' (الافتراضي 1 لكل مسح)}]
+    mode: add تجمع الكمية مع ما سبق عده للمنتج، set تستبدله.
+    ترجع عدد المنتجات المحدثة والأسطر التي لم يُعرف منتجها.
+    """
+    if mode not in STAGE_MODES:
+        raise ValueError(f"الوضع يجب أن يكون أحد: {', '.join(STAGE_MODES)}")
+    _open_session(cursor, session_id)
+    rows = _scan_rows(counts)
+
+    cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS stocktake_scan (
+            line INTEGER PRIMARY KEY, product_id INTEGER, barcode TEXT, quantity REAL NOT NULL
+        )
+    ''')
+    cursor.execute('DELETE FROM temp.stocktake_scan')
+    cursor.executemany('INSERT INTO temp.stocktake_scan (line, product_id, barcode, quantity) VALUES (?, ?, ?, ?)',
+                       rows)
+
+    # حل الباركود ثم استبعاد المعرفات غير الموجودة
+    cursor.execute('''
+        UPDATE temp.stocktake_scan
+        SET product_id = (SELECT id FROM products WHERE products.barcode = stocktake_scan.barcode)
+        WHERE product_id IS NULL
+    ''')
+    cursor.execute('''
+        SELECT line, product_id, barcode FROM temp.stocktake_scan s
+        WHERE product_id IS NULL OR NOT EXISTS (SELECT 1 FROM products p WHERE p.id = s.product_id)
+        ORDER BY line
+    ''')
+    unknown = [{'line': line + 1, 'product_id': product_id, 'barcode': barcode}
+               for line, product_id, barcode in cursor.fetchall()]
+
+    counted = 'counted + excluded.counted' if mode == 'add' else 'excluded.counted'
+    cursor.execute(f'''
+        INSERT INTO stocktake_counts (session_id, product_id, counted)
+        SELECT ?, s.product_id, SUM(s.quantity)
+        FROM temp.stocktake_scan s
+        JOIN products p ON p.id = s.product_id
+        WHERE true
+        GROUP BY s.product_id
+        ON CONFLICT(session_id, product_id) DO UPDATE SET counted = {counted}
+    ''', (session_id,))
+    staged = cursor.rowcount
+    cursor.execute('DELETE FROM temp.stocktake_scan')
+
+    # دفاع إضافي: لا تُقبل كمية معدودة سالبة بعد الدمج (يتراجع المستدعي عن الدفعة)
+    cursor.execute('SELECT product_id FROM stocktake_counts WHERE session_id = ? AND counted < 0 LIMIT 1',
+                   (session_id,))
+    negative = cursor.fetchone()
+    if negative is not None:
+        raise ValueError(f'الكمية المعدودة للمنتج {negative[0]} لا يمكن أن تكون سالبة')
+    return {'lines': len(rows), 'products': staged, 'unknown': unknown}
+
+
+def _variance_sql(zero_uncounted):
+    # الجرد الكامل: المنتجات النشطة غير المعدودة تعتبر صفراً
+    scope = 'c.product_id IS NOT NULL OR (p.is_active = 1 AND p.stock_quantity != 0)' if zero_uncounted \
+        else 'c.product_id IS NOT NULL'
+    return f'''
+        SELECT p.id AS product_id, p.name AS name, p.barcode AS barcode,
+               p.stock_quantity AS expected, COALESCE(c.counted, 0) AS counted,
+               COALESCE(c.counted, 0) - p.stock_quantity AS variance,
+               COALESCE(p.avg_cost, 0) AS unit_cost
+        FROM products p
+        LEFT JOIN stocktake_counts c ON c.product_id = p.id AND c.session_id = :session_id
+        WHERE ({scope})
+    '''
+
+
+def summary(cursor, session_id, zero_uncounted=False):
+    """عدد المنتجات المعدودة والمختلفة وإجمالي الزيادة والعجز وقيمة الفرق بالتكلفة المتوسطة"""
+    if get_session(cursor, session_id) is None:
+        raise ValueError('جلسة الجرد غير موجودة')
+    cursor.execute(f'''
+        SELECT COUNT(*),
+               COALESCE(SUM(variance != 0), 0),
+               COALESCE(SUM(CASE WHEN variance > 0 THEN variance ELSE 0 END), 0),
+               COALESCE(SUM(CASE WHEN variance < 0 THEN -variance ELSE 0 END), 0),
+               COALESCE(SUM(variance * unit_cost), 0)
+        FROM ({_variance_sql(zero_uncounted)})
+    ''', {'session_id': session_id})
+    products, mismatched, surplus, shortage, value = cursor.fetchone()
+    return {
+        'session_id': session_id,
+        'products': products,
+        'mismatched': mismatched,
+        'surplus_quantity': float(surplus),
+        'shortage_quantity': float(shortage),
+        'variance_value': round(float(value), 2),
+    }
+
+
+def variances(cursor, session_id, zero_uncounted=False, limit=100, offset=0):
+    """ملخص فروقات الجلسة وقائمة المنتجات المختلفة (الأكبر قيمة أولاً)"""
+    result = summary(cursor, session_id, zero_uncounted)
+    cursor.execute(f'''
+        SELECT product_id, name, barcode, expected, counted, variance, variance * unit_cost AS variance_value
+        FROM ({_variance_sql(zero_uncounted)})
+        WHERE variance != 0
+        ORDER BY ABS(variance * unit_cost) DESC, ABS(variance) DESC
+        LIMIT :limit OFFSET :offset
+    ''', {'session_id': session_id, 'limit': limit if limit else -1, 'offset': offset})
+    names = [column[0] for column in cursor.description]
+    result['variances'] = [dict(zip(names, row)) for row in cursor.fetchall()]
+    return result
+
+
+def apply(cursor, session_id, zero_uncounted=False):
+    """ضبط المخزون على الكميات المعدودة وتسجيل حركات الجرد (ضمن معاملة المستدعي)
+
+    ترجع معرفات المنتجات المعدلة.
+    """
+    session = _open_session(cursor, session_id)
+    cursor.execute('DROP TABLE IF EXISTS temp.stocktake_variance')
+    cursor.execute(f'''
+        CREATE TEMP TABLE stocktake_variance AS
+        SELECT product_id, variance, unit_cost FROM ({_variance_sql(zero_uncounted)}) WHERE variance != 0
+    ''', {'session_id': session_id})
+
+    cursor.execute('''
+        INSERT INTO stock_movements (product_id, quantity, movement_type, reference_id, unit_cost, note)
+        SELECT product_id, variance, 'stocktake', ?, unit_cost, ? FROM temp.stocktake_variance
+    ''', (session_id, session['note']))
+    cursor.execute('''
+        UPDATE products
+        SET stock_quantity = stock_quantity + v.variance, updated_at = CURRENT_TIMESTAMP
+        FROM temp.stocktake_variance v
+        WHERE products.id = v.product_id
+    ''')
+    cursor.execute('SELECT product_id FROM temp.stocktake_variance')
+    product_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute('DROP TABLE temp.stocktake_variance')
+
+    close_session(cursor, session_id, 'applied')
+    return product_ids
+
+
+def close_session(cursor, session_id, status):
+    cursor.execute('''
+        UPDATE stocktake_sessions SET status = ?, closed_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status = 'open'
+    ''', (status, session_id))
+    if not cursor.rowcount:
+        raise ValueError('جلسة الجرد غير موجودة أو مغلقة')
@@ -0,0 +1,223 @@
+"""توزيع بيانات الفروع على ملفات قواعد بيانات منفصلة مع تقارير موحدة للسلسلة
+
+كل فرع يملك ملف stores/store_<id>.db ونسخة POSBackend خاصة به، فلا تتسلسل
+عمليات الكتابة في فرع خلف عمليات فرع آخر. قاعدة البيانات الرئيسية تبقى الفرع
+الافتراضي للطلبات التي لا تحدد فرعاً. ملف الفرع يُنشأ بطلب إداري صريح فقط، ولا
+تُنشئه ترويسة X-Store-ID لفرع غير موجود.
+
+التقارير الموحدة تجمع الفروع بإحدى طريقتين:
+    attach    اتصال واحد يربط (ATTACH) حتى 10 ملفات في كل دفعة ويجمعها بـ UNION ALL
+    parallel  توزيع الفروع على مجموعة عمليات (ProcessPoolExecutor) ثم دمج النتائج
+"""
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from pos_backend import POSBackend
+
+STORE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+DEFAULT_STORE_ID = 'main'
+
+# الحد الافتراضي لعدد قواعد البيانات المربوطة في SQLite (SQLITE_MAX_ATTACHED)
+ATTACH_LIMIT = 10
+
+
+class StoreRouter:
+    """توجيه الطلبات إلى قاعدة بيانات الفرع حسب معرفه"""
+
+    def __init__(self, default_backend, stores_dir):
+        self.default_backend = default_backend
+        self.stores_dir = stores_dir
+        self._backends = {}
+        self._lock = threading.Lock()
+
+    def store_path(self, store_id):
+        if store_id == DEFAULT_STORE_ID:
+            return self.default_backend.db_path
+        if not STORE_ID_PATTERN.match(store_id or ''):
+            raise ValueError(f'معرف فرع غير صالح: {store_id!r}')
+        return os.path.join(self.stores_dir, f'store_{store_id}.db')
+
+    def exists(self, store_id):
+        """هل الفرع مسجل (قاعدة بياناته موجودة)"""
+        if not store_id or store_id == DEFAULT_STORE_ID or store_id in self._backends:
+            return True
+        return os.path.exists(self.store_path(store_id))
+
+    def get(self, store_id=None):
+        """نسخة POSBackend لفرع موجود (الفروع الجديدة تُنشأ بـ create فقط)"""
+        if not store_id or store_id == DEFAULT_STORE_ID:
+            return self.default_backend
+
+        backend = self._backends.get(store_id)
+        if backend is not None:
+            return backend
+
+        if not self.exists(store_id):
+            raise LookupError(f'الفرع غير موجود: {store_id}')
+        return self._open(store_id)
+
+    def create(self, store_id):
+        """إنشاء قاعدة بيانات فرع جديد (مسار إداري)"""
+        self.store_path(store_id)
+        if store_id == DEFAULT_STORE_ID or self.exists(store_id):
+            raise ValueError(f'الفرع موجود مسبقاً: {store_id}')
+        os.makedirs(self.stores_dir, exist_ok=True)
+        return self._open(store_id)
+
+    def _open(self, store_id):
+        path = self.store_path(store_id)
+        with self._lock:
+            backend = self._backends.get(store_id)
+            if backend is None:
+                backend = POSBackend(path, backup_dir=os.path.join(self.stores_dir, 'backups', store_id))
+                self._backends[store_id] = backend
+        return backend
+
+    def list_stores(self):
+        """جميع الفروع الموجودة: [(المعرف، مسار قاعدة البيانات)]"""
+        stores = [(DEFAULT_STORE_ID, self.default_backend.db_path)]
+        if os.path.isdir(self.stores_dir):
+            for name in sorted(os.listdir(self.stores_dir)):
+                if name.startswith('store_') and name.endswith('.db'):
+                    store_id = name[len('store_'):-len('.db')]
+                    if STORE_ID_PATTERN.match(store_id) and store_id != DEFAULT_STORE_ID:
+                        stores.append((store_id, os.path.join(self.stores_dir, name)))
+        return stores
+
+    def chainReport(self, start_date, end_date, mode='attach', store_ids=None, top=20, max_workers=None):
+        """تقرير مبيعات ومالية موحد لجميع الفروع (أو الفروع المحددة)"""
+        stores = self.list_stores()
+        if store_ids:
+            wanted = set(store_ids)
+            stores = [store for store in stores if store[0] in wanted]
+        return chain_report(stores, start_date, end_date, mode, top, max_workers)
+
+
+# =========================================================================
+# التقارير الموحدة
+# =========================================================================
+
+_SUMMARY_SQL = '''
+    SELECT :store_{i},
+        (SELECT COUNT(*) FROM s{i}.invoices
+         WHERE type = 'sale' AND created_at >= :start AND created_at < DATE(:end, '+1 day')),
+        (SELECT COALESCE(SUM(total_amount), 0) FROM s{i}.invoices
+         WHERE type = 'sale' AND status = 'completed' AND created_at >= :start AND created_at < DATE(:end, '+1 day')),
+        (SELECT COALESCE(SUM(paid_amount), 0) FROM s{i}.invoices
+         WHERE type = 'sale' AND status = 'completed' AND remaining_amount = 0
+           AND created_at >= :start AND created_at < DATE(:end, '+1 day')),
+        (SELECT COALESCE(SUM(remaining_amount), 0) FROM s{i}.invoices
+         WHERE type = 'sale' AND status = 'completed' AND remaining_amount > 0
+           AND created_at >= :start AND created_at < DATE(:end, '+1 day')),
+        (SELECT COALESCE(SUM(amount), 0) FROM s{i}.vouchers
+         WHERE voucher_type = 'payment' AND created_at >= :start AND created_at < DATE(:end, '+1 day')),
+        (SELECT COALESCE(SUM(balance), 0) FROM s{i}.accounts WHERE name = 'النقدية' AND is_active = 1)
+'''
+
+_DAILY_SQL = '''
+    SELECT DATE(created_at) AS day, total_amount FROM s{i}.invoices
+    WHERE type = 'sale' AND created_at >= :start AND created_at < DATE(:end, '+1 day')
+'''
+
+_PRODUCTS_SQL = '''
+    SELECT ii.product_name AS product_name, ii.quantity AS quantity, ii.total_price AS total_price
+    FROM s{i}.invoice_items ii
+    JOIN s{i}.invoices i ON i.id = ii.invoice_id
+    WHERE i.type = 'sale' AND i.created_at >= :start AND i.created_at < DATE(:end, '+1 day')
+'''
+
+
+def aggregate_stores(stores, start_date, end_date):
+    """تجميع دفعة فروع (حتى ATTACH_LIMIT) على اتصال واحد
+
+    دالة على مستوى الوحدة حتى يمكن تنفيذها داخل ProcessPoolExecutor.
+    """
+    conn = sqlite3.connect(':memory:', uri=True)
+    try:
+        params = {'start': start_date, 'end': end_date}
+        for index, (store_id, path) in enumerate(stores):
+            conn.execute(f'ATTACH DATABASE ? AS s{index}', (f'file:{os.path.abspath(path)}?mode=ro',))
+            params[f'store_{index}'] = store_id
+        indexes = range(len(stores))
+
+        summary = {}
+        for row in conn.execute(' UNION ALL '.join(_SUMMARY_SQL.format(i=i) for i in indexes), params):
+            store_id, invoices, revenue, cash_sales, credit_sales, expenses, cash_balance = row
+            summary[store_id] = {
+                'invoices': invoices,
+                'total_revenue': float(revenue),
+                'cash_sales': float(cash_sales),
+                'credit_sales': float(credit_sales),
+                'total_expenses': float(expenses),
+                'net_profit': float(revenue - expenses),
+                'cash_balance': float(cash_balance),
+            }
+
+        daily = {day: [count, total] for day, count, total in conn.execute(f'''
+            SELECT day, COUNT(*), COALESCE(SUM(total_amount), 0)
+            FROM ({' UNION ALL '.join(_DAILY_SQL.format(i=i) for i in indexes)})
+            GROUP BY day
+        ''', params)}
+
+        products = {name: [quantity, total] for name, quantity, total in conn.execute(f'''
+            SELECT product_name, SUM(quantity), SUM(total_price)
+            FROM ({' UNION ALL '.join(_PRODUCTS_SQL.format(i=i) for i in indexes)})
+            GROUP BY product_name
+        ''', params)}
+
+        return {'stores': summary, 'daily': daily, 'products': products}
+    finally:
+        conn.close()
+
+
+def _merge(partials, top):
+    stores = {}
+    daily = {}
+    products = {}
+    for partial in partials:
+        stores.update(partial['stores'])
+        for day, (count, total) in partial['daily'].items():
+            entry = daily.setdefault(day, [0, 0.0])
+            entry[0] += count
+            entry[1] += total
+        for name, (quantity, total) in partial['products'].items():
+            entry = products.setdefault(name, [0.0, 0.0])
+            entry[0] += quantity
+            entry[1] += total
+
+    fields = ('invoices', 'total_revenue', 'cash_sales', 'credit_sales', 'total_expenses', 'net_profit', 'cash_balance')
+    totals = {field: sum(store[field] for store in stores.values()) for field in fields}
+    top_products = sorted(products.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    return {
+        'totals': totals,
+        'stores': stores,
+        'daily': [{'date': day, 'invoices': count, 'total': total} for day, (count, total) in sorted(daily.items())],
+        'top_products': [{'product_name': name, 'quantity': quantity, 'total': total}
+                         for name, (quantity, total) in top_products],
+    }
+
+
+def chain_report(stores, start_date, end_date, mode='attach', top=20, max_workers=None):
+    """تشغيل التجميع على دفعات الفروع ودمج النتائج"""
+    if mode not in ('attach', 'parallel'):
+        raise ValueError('طريقة التجميع يجب أن تكون attach أو parallel')
+
+    stores = [store for store in stores if os.path.exists(store[1])]
+    if mode == 'attach':
+        chunks = [stores[start:start + ATTACH_LIMIT] for start in range(0, len(stores), ATTACH_LIMIT)]
+        partials = [aggregate_stores(chunk, start_date, end_date) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(aggregate_stores, [store], start_date, end_date) for store in stores]
+            partials = [future.result() for future in futures]
+
+    report = _merge(partials, top)
+    report.update({
+        'period': f'{start_date} إلى {end_date}',
+        'mode': mode,
+        'store_count': len(stores),
+    })
+    return report
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pos_backend import POSBackend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return POSBackend(str(tmp_path / 'pos.db'), backup_dir=str(tmp_path / 'backups'),
+                      archive_dir=str(tmp_path / 'archives'))
+
+
+@pytest.fixture
+def product_id(backend):
+    backend.saveProduct({'name': 'منتج', 'barcode': '1001', 'purchase_price': 5, 'sale_price': 8,
+                         'stock_quantity': 20})
+    return backend.getProductByBarcode('1001')['id']
+
+
+@pytest.fixture
+def sell(backend, product_id):
+    def sell(quantity=1):
+        result = backend.processSale({
+            'items': [{'product_id': product_id, 'product_name': 'منتج', 'quantity': quantity,
+                       'unit_price': 8, 'total_price': 8 * quantity}],
+            'total_amount': 8 * quantity,
+            'paid_amount': 8 * quantity,
+        })
+        assert result['success'], result
+        return result
+    return sell
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+
+import pytest
+
+import backup_manager
+
+
+def _state(backend):
+    conn = sqlite3.connect(backend.db_path)
+    try:
+        return {
+            'products': conn.execute('SELECT id, stock_quantity, avg_cost FROM products ORDER BY id').fetchall(),
+            'invoices': conn.execute('SELECT invoice_number, total_amount FROM invoices ORDER BY id').fetchall(),
+            'items': conn.execute('SELECT invoice_id, product_id, quantity FROM invoice_items ORDER BY id').fetchall(),
+            'movements': conn.execute('''
+                SELECT product_id, quantity, movement_type FROM stock_movements ORDER BY id
+            ''').fetchall(),
+            'stocktakes': conn.execute('SELECT id, status FROM stocktake_sessions ORDER BY id').fetchall(),
+            'counts': conn.execute('SELECT session_id, product_id, counted FROM stocktake_counts').fetchall(),
+            'cash': conn.execute("SELECT balance FROM accounts WHERE name = 'النقدية'").fetchone(),
+        }
+    finally:
+        conn.close()
+
+
+def test_full_and_incremental_chain_round_trip(backend, product_id, sell):
+    sell(2)
+    full = backend.createBackup()
+
+    sell(3)
+    session_id = backend.createStocktake('جرد')['session']['id']
+    assert backend.addStocktakeCounts(session_id, [{'barcode': '1001', 'quantity': 14}])['success']
+    assert backend.applyStocktake(session_id)['success']
+    first = backend.createIncrementalBackup()
+
+    assert backend.adjustStock([{'product_id': product_id, 'quantity': 6, 'unit_cost': 7}])['success']
+    second = backend.createIncrementalBackup()
+    expected = _state(backend)
+
+    sell(1)
+    result = backend.restoreBackup(filename=full['filename'], incrementals=[first['filename'], second['filename']])
+    assert result['success'], result
+    assert _state(backend) == expected
+    assert backend.getStockDrift() == []
+
+
+def test_restore_chain_rejects_out_of_order_increments(backend, product_id, sell):
+    full = backend.createBackup()
+    sell()
+    first = backend.createIncrementalBackup()
+    sell()
+    second = backend.createIncrementalBackup()
+
+    result = backend.restoreBackup(filename=full['filename'], incrementals=[second['filename'], first['filename']])
+    assert not result['success']
+    assert backend.getProductByBarcode('1001')['stock_quantity'] == 18
+
+
+def test_incremental_chain_continues_after_restore(backend, product_id, sell):
+    full = backend.createBackup()
+    sell(4)
+    assert backend.restoreBackup(filename=full['filename'])['success']
+
+    sell(1)
+    incremental = backend.createIncrementalBackup()
+    expected = _state(backend)
+
+    sell(1)
+    result = backend.restoreBackup(filename=full['filename'], incrementals=[incremental['filename']])
+    assert result['success'], result
+    assert _state(backend) == expected
+    assert backend.getProductByBarcode('1001')['stock_quantity'] == 19
+
+
+def test_incremental_chain_continues_after_chain_restore(backend, product_id, sell):
+    full = backend.createBackup()
+    sell(1)
+    first = backend.createIncrementalBackup()
+    assert backend.restoreBackup(filename=full['filename'], incrementals=[first['filename']])['success']
+
+    sell(2)
+    second = backend.createIncrementalBackup()
+    expected = _state(backend)
+
+    result = backend.restoreBackup(filename=full['filename'], incrementals=[first['filename'], second['filename']])
+    assert result['success'], result
+    assert _state(backend) == expected
+
+
+def test_incremental_requires_full_backup(backend):
+    with pytest.raises(ValueError):
+        backend.createIncrementalBackup()
+
+
+def test_restore_chain_migrates_older_full_backup(backend, product_id, sell, tmp_path):
+    full = backend.createBackup()
+    # نسخة كاملة من إصدار أقدم بدون عمود التكلفة المتوسطة
+    old_path = str(tmp_path / 'old.db')
+    backup_manager._decompress_to(os.path.join(backend.backup_dir, full['filename']), old_path)
+    conn = sqlite3.connect(old_path)
+    for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND sql LIKE '%avg_cost%'").fetchall():
+        conn.execute(f'DROP TRIGGER {name}')
+    conn.execute('ALTER TABLE products DROP COLUMN avg_cost')
+    conn.commit()
+    conn.close()
+
+    sell(5)
+    incremental = backend.createIncrementalBackup()
+    expected = _state(backend)
+
+    backup_manager.restore_chain(backend.db_path, old_path,
+                                 [os.path.join(backend.backup_dir, incremental['filename'])],
+                                 migrate=backend._migrateDatabaseFile)
+    assert _state(backend) == expected